@@ -3,23 +3,58 @@
 import os
 import random
 import pymongo
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo import InsertOne, UpdateOne, ReturnDocument, monitoring
+from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError, OperationFailure, PyMongoError, DuplicateKeyError
+from pymongo.results import BulkWriteResult, InsertOneResult, InsertManyResult, UpdateResult
 import time
-from datetime import datetime
+import uuid
+import hashlib
+import json
+import base64
+import zlib
+from datetime import datetime, timedelta, timezone
 from faker import Faker
-#from bson.objectid import ObjectId
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import bson
+from bson import json_util
+from bson.raw_bson import RawBSONDocument
+from bson.codec_options import CodecOptions
+from bson.objectid import ObjectId
+from bson.timestamp import Timestamp
+from bson.min_key import MinKey
+from bson.max_key import MaxKey
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
 import multiprocessing
 import logging
+import asyncio
+import copy
+import gc
+import threading
 from logging.handlers import RotatingFileHandler
-from typing import List, Tuple, Any, Dict
+from contextlib import contextmanager
+from typing import List, Tuple, Any, Dict, Iterator, Iterable
+from collections import defaultdict, OrderedDict
 import platform
+import argparse
+import sys
+import bisect
+import itertools
+import math
+import queue
 import psutil
 import matplotlib.pyplot as plt
 #import numpy as np
 from tqdm import tqdm
 import numpy as np
 import pandas as pd
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
 #import mplfinance as mpf
 
 
@@ -73,14 +108,190 @@ COLLECTIONS = ['stores', 'products', 'sales']
 USER = 'admin'
 PASS = 'admin'
 
+# Perfis do pool de conexões (opções repassadas ao MongoClient)
+POOL_PROFILES: Dict[str, Dict[str, Any]] = {
+    'default': {'maxPoolSize': 100, 'minPoolSize': 0, 'serverSelectionTimeoutMS': 5000},
+    'warm': {'maxPoolSize': 100, 'minPoolSize': 32, 'waitQueueTimeoutMS': 10000, 'serverSelectionTimeoutMS': 5000},
+    'large': {'maxPoolSize': 500, 'minPoolSize': 64, 'waitQueueTimeoutMS': 30000, 'serverSelectionTimeoutMS': 5000},
+    'compressed': {'maxPoolSize': 100, 'minPoolSize': 32, 'waitQueueTimeoutMS': 10000, 'serverSelectionTimeoutMS': 5000, 'compressors': 'zlib'},
+}
+POOL_PROFILE = 'default'
 
+# Replica set do mongod (ex.: 'rs0' num replica set local de um nó), exigido pelos change streams; None conecta ao mongod diretamente
+REPLICA_SET = None
+
+# Backends de armazenamento: o mongod configurado acima ou o banco em memória
+BACKENDS = ['mongodb', 'memory']
+BACKEND = 'mongodb'
+MEMORY_LATENCY_MS = 0.0
+
+
+# Monitorar a espera por conexões do pool
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Collect how long operations wait to check a connection out of the pool.
+
+    Only counters are kept, so the memory used does not grow with the number of operations.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.connections_created = 0
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset the checkout wait counters (the number of connections created is kept)."""
+        with self.lock:
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+
+    def summary(self) -> Dict[str, float]:
+        """Summarize the checkout waits since the last reset.
+
+        Returns:
+            Dict[str, float]: The number of checkouts and failures, the average and max wait (ms) and the connections created.
+        """
+        with self.lock:
+            return {
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'avg_wait_ms': self.total_wait / self.checkouts * 1000 if self.checkouts else 0.0,
+                'max_wait_ms': self.max_wait * 1000,
+                'connections_created': self.connections_created,
+            }
+
+    def connection_checked_out(self, event: monitoring.ConnectionCheckedOutEvent) -> None:
+        with self.lock:
+            self.checkouts += 1
+            self.total_wait += event.duration or 0.0
+            self.max_wait = max(self.max_wait, event.duration or 0.0)
+
+    def connection_check_out_failed(self, event: monitoring.ConnectionCheckOutFailedEvent) -> None:
+        with self.lock:
+            self.checkout_failures += 1
+
+    def connection_created(self, event: monitoring.ConnectionCreatedEvent) -> None:
+        with self.lock:
+            self.connections_created += 1
+
+    def pool_created(self, event: monitoring.PoolCreatedEvent) -> None:
+        pass
+
+    def pool_ready(self, event: monitoring.PoolReadyEvent) -> None:
+        pass
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent) -> None:
+        pass
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent) -> None:
+        pass
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent) -> None:
+        pass
+
+    def connection_closed(self, event: monitoring.ConnectionClosedEvent) -> None:
+        pass
+
+    def connection_check_out_started(self, event: monitoring.ConnectionCheckOutStartedEvent) -> None:
+        pass
+
+    def connection_checked_in(self, event: monitoring.ConnectionCheckedInEvent) -> None:
+        pass
+
+
+client = None
+client_settings = None
+pool_monitor = PoolMonitor()
 db = None
 stores_collection = None
 products_collection = None
 sales_collection = None
+rollup_collection = None
+
+
+# Função para associar as coleções globais a um banco
+def bind_collections(database: Any) -> None:
+    """Bind the module-level database and collection globals to a database.
+
+    Args:
+        database (Any): The MongoDB database.
+    """
+    global db, stores_collection, products_collection, sales_collection, rollup_collection
+    db = database
+    stores_collection = database['stores']
+    products_collection = database['products']
+    sales_collection = database['sales']
+    rollup_collection = database[ROLLUP_COLLECTION]
+
+
+# Função para obter o cliente compartilhado
+def get_client(host: str, port: int, username: str = 'admin', password: str = 'admin', pool_profile: str = POOL_PROFILE, max_workers: int = 0) -> pymongo.MongoClient:
+    """Get the shared MongoClient, creating it with the given pool profile on first use.
+
+    Later calls return the same client; a warning is logged when they ask for other settings, which are not applied.
+
+    Args:
+        host (str): The MongoDB host.
+        port (int): The MongoDB port.
+        username (str, optional): The username for authentication. Defaults to 'admin'.
+        password (str, optional): The password for authentication. Defaults to 'admin'.
+        pool_profile (str, optional): The name of the pool profile in POOL_PROFILES. Defaults to POOL_PROFILE.
+        max_workers (int, optional): The number of concurrent workers; maxPoolSize is raised to it so workers don't queue for sockets. Defaults to 0.
+
+    Returns:
+        pymongo.MongoClient: The shared client.
+    """
+    global client, client_settings
+    settings = {'host': host, 'port': port, 'username': username, 'pool_profile': pool_profile, 'max_workers': max_workers}
+    if client is not None:
+        if settings != client_settings:
+            changed = {key: value for key, value in settings.items() if client_settings[key] != value}
+            logging.warning(f"The MongoClient already exists with {client_settings}; ignoring the new settings {changed}.")
+        return client
+    if pool_profile not in POOL_PROFILES:
+        raise ValueError(f"Unknown pool profile '{pool_profile}', expected one of {list(POOL_PROFILES)}.")
+
+    options = dict(POOL_PROFILES[pool_profile])
+    if max_workers > options['maxPoolSize']:
+        logging.info(f"Raising maxPoolSize from {options['maxPoolSize']} to {max_workers} to match the workers.")
+        options['maxPoolSize'] = max_workers
+    options['minPoolSize'] = min(options['minPoolSize'], options['maxPoolSize'])
+    if REPLICA_SET:
+        options['replicaSet'] = REPLICA_SET
+    logging.info(f"Pool profile '{pool_profile}': {options}")
+    client = pymongo.MongoClient(f'mongodb://{username}:{password}@{host}', port, event_listeners=[pool_monitor, operation_timer], **options)
+    client_settings = settings
+    return client
+
+
+# Função para aquecer o pool antes da fase cronometrada
+def prewarm_pool(mongo_client: pymongo.MongoClient, connections: int) -> int:
+    """Open pool connections ahead of the timed phase by running concurrent pings.
+
+    Args:
+        mongo_client (pymongo.MongoClient): The client whose pool is warmed.
+        connections (int): The number of connections to open.
+
+    Returns:
+        int: The number of connections created by the client so far.
+    """
+    connections = max(1, min(connections, mongo_client.options.pool_options.max_pool_size))
+    barrier = threading.Barrier(connections)
+
+    def ping() -> None:
+        barrier.wait()
+        mongo_client.admin.command('ping')
+
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        for future in [executor.submit(ping) for _ in range(connections)]:
+            future.result()
+    created = pool_monitor.summary()['connections_created']
+    logging.info(f"Pool prewarmed: {connections} concurrent pings, {created} connections created.")
+    return created
 
 
-def check_and_create_db(host: str, port: int, db_name: str, username: str = 'admin', password: str = 'admin', collections: list = []) -> Any:
+def check_and_create_db(host: str, port: int, db_name: str, username: str = 'admin', password: str = 'admin', collections: list = [], pool_profile: str = POOL_PROFILE, max_workers: int = 0) -> Any:
     """Check if the MongoDB database and collections exist, and create them if they don't.
 
     Args:
@@ -90,12 +301,12 @@ def check_and_create_db(host: str, port: int, db_name: str, username: str = 'adm
         username (str, optional): The username for authentication. Defaults to 'admin'.
         password (str, optional): The password for authentication. Defaults to 'admin'.
         collections (list, optional): A list of collection names to check/create. Defaults to an empty list.
+        pool_profile (str, optional): The name of the pool profile in POOL_PROFILES. Defaults to POOL_PROFILE.
+        max_workers (int, optional): The number of concurrent workers the pool is sized for. Defaults to 0.
     """
-    uri = f'mongodb://{username}:{password}@{host}'
     db = None
     try:
-        #client = pymongo.MongoClient(uri, port, serverSelectionTimeoutMS=5000)
-        client = pymongo.MongoClient(uri, port)
+        client = get_client(host, port, username, password, pool_profile, max_workers)
         # Test the connection
         client.admin.command('ping')
         logging.info(f"Connected to MongoDB ({MONGO_HOST}) successfully.")
@@ -112,407 +323,5909 @@ def check_and_create_db(host: str, port: int, db_name: str, username: str = 'adm
            
     except (ConnectionFailure, ServerSelectionTimeoutError) as e:
         logging.error(f"Failed to connect to MongoDB ({MONGO_HOST}): {e}")
-        
+
     return db
-    
+
+
+# Função para abrir o banco de um backend de armazenamento
+def open_backend(backend: str = BACKEND, latency_ms: float = MEMORY_LATENCY_MS, pool_profile: str = POOL_PROFILE, max_workers: int = 0) -> Any:
+    """Open the database of a storage backend and bind the collection globals to it.
+
+    Args:
+        backend (str, optional): The storage backend, one of BACKENDS. Defaults to BACKEND.
+        latency_ms (float, optional): The round trip injected in each call of the 'memory' backend, in milliseconds. Defaults to MEMORY_LATENCY_MS.
+        pool_profile (str, optional): The name of the pool profile of the 'mongodb' backend. Defaults to POOL_PROFILE.
+        max_workers (int, optional): The number of concurrent workers the pool is sized for. Defaults to 0.
+
+    Returns:
+        Any: The database the collections are bound to.
+
+    Raises:
+        ConnectionFailure: If the 'mongodb' backend cannot connect.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}.")
+    if backend == 'memory':
+        database = MemoryDatabase(DB_NAME, latency_ms)
+        for collection in COLLECTIONS:
+            database.create_collection(collection)
+        logging.info(f"Using the in-memory backend ({latency_ms} ms injected per call).")
+    else:
+        database = check_and_create_db(MONGO_HOST, MONGO_PORT, DB_NAME, USER, PASS, COLLECTIONS, pool_profile, max_workers)
+        if database is None:
+            raise ConnectionFailure(f"Could not connect to MongoDB ({MONGO_HOST}:{MONGO_PORT}).")
+    bind_collections(database)
+    return database
+
+
+###########
+# Índices #
+###########
+
+# Limites dos alertas de reposição: estoque baixo e validade próxima
+LOW_STOCK_THRESHOLD = 20
+EXPIRY_DAYS = 30
+
+# Índices declarativos por coleção: (chaves, opções)
+INDEXES: Dict[str, List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]] = {
+    'products': [
+        ([('store_id', pymongo.ASCENDING), ('product_id', pymongo.ASCENDING)], {'name': 'store_product_unique', 'unique': True}),
+        ([('product_id', pymongo.ASCENDING)], {'name': 'product_id'}),
+        ([('sku', pymongo.ASCENDING)], {'name': 'sku'}),
+        ([('store_id', pymongo.ASCENDING), ('stock_quantity', pymongo.ASCENDING)], {'name': 'store_low_stock', 'partialFilterExpression': {'stock_quantity': {'$lt': LOW_STOCK_THRESHOLD}}}),
+        ([('store_id', pymongo.ASCENDING), ('expiry_date', pymongo.ASCENDING)], {'name': 'store_expiry'}),
+    ],
+    'sales': [
+        ([('store_id', pymongo.ASCENDING), ('sale_date', pymongo.DESCENDING)], {'name': 'store_sale_date'}),
+        ([('product_id', pymongo.ASCENDING)], {'name': 'product_id'}),
+        ([('batch', pymongo.ASCENDING)], {'name': 'batch'}),
+    ],
+    'stores': [
+        ([('store_id', pymongo.ASCENDING)], {'name': 'store_id_unique', 'unique': True}),
+    ],
+    'sales_daily': [
+        ([('store_id', pymongo.ASCENDING), ('day', pymongo.ASCENDING), ('product_id', pymongo.ASCENDING)], {'name': 'store_day_product_unique', 'unique': True}),
+    ],
+}
+
+# Índices que servem os alertas de reposição
+ALERT_INDEXES: Dict[str, List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]] = {
+    'products': [index for index in INDEXES['products'] if index[1]['name'] in ['store_low_stock', 'store_expiry']],
+}
+
+
+# Função para criar os índices declarados
+def create_indexes(db: Any, indexes: Dict[str, List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]] = INDEXES) -> None:
+    """Create the declared indexes, skipping the ones that already exist.
+
+    Args:
+        db (Any): The MongoDB database.
+        indexes (Dict[str, List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]], optional): The index keys and options by collection. Defaults to INDEXES.
+    """
+    for collection_name, collection_indexes in indexes.items():
+        existing_indexes = db[collection_name].index_information()
+        for keys, options in collection_indexes:
+            if options['name'] in existing_indexes:
+                logging.info(f"Index '{options['name']}' already exists on '{collection_name}'.")
+                continue
+            db[collection_name].create_index(keys, **options)
+            logging.info(f"Index '{options['name']}' created on '{collection_name}'.")
+
+
+# Função para remover os índices declarados
+def drop_indexes(db: Any, indexes: Dict[str, List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]] = INDEXES) -> None:
+    """Drop the declared indexes, so runs can be measured without them.
+
+    Args:
+        db (Any): The MongoDB database.
+        indexes (Dict[str, List[Tuple[List[Tuple[str, int]], Dict[str, Any]]]], optional): The index keys and options by collection. Defaults to INDEXES.
+    """
+    for collection_name, collection_indexes in indexes.items():
+        existing_indexes = db[collection_name].index_information()
+        for _, options in collection_indexes:
+            if options['name'] in existing_indexes:
+                db[collection_name].drop_index(options['name'])
+                logging.info(f"Index '{options['name']}' dropped from '{collection_name}'.")
+
+
+# Função para identificar o estágio vencedor de um plano de execução
+def get_winning_stage(plan: Dict[str, Any]) -> str:
+    """Get the access stage (IXSCAN, COLLSCAN, ...) of a query plan.
+
+    Args:
+        plan (Dict[str, Any]): The winning plan of an explain() output.
+
+    Returns:
+        str: The innermost stage name, with the index name when there is one.
+    """
+    while 'inputStage' in plan:
+        plan = plan['inputStage']
+    if 'indexName' in plan:
+        return f"{plan['stage']} ({plan['indexName']})"
+    return plan.get('stage', 'UNKNOWN')
+
+
+# Função para verificar o uso dos índices nas consultas principais
+def explain_queries(db: Any) -> Dict[str, str]:
+    """Explain the filters used by the hot operations and log the chosen access stage.
+
+    Args:
+        db (Any): The MongoDB database.
+
+    Returns:
+        Dict[str, str]: The winning stage of each explained query.
+    """
+    sample = db['products'].find_one({}, {'store_id': 1, 'product_id': 1}) or {}
+    queries = {
+        'query_stock': ('products', {'store_id': sample.get('store_id')}),
+        'update_inventory': ('products', {'product_id': sample.get('product_id'), 'store_id': sample.get('store_id')}),
+        'low_stock': ('products', {'store_id': sample.get('store_id'), **alert_filter('low_stock')}),
+        'expiring_products': ('products', {'store_id': sample.get('store_id'), **alert_filter('expiring_products')}),
+        'sales_by_store': ('sales', {'store_id': sample.get('store_id')}),
+    }
+    stages = {}
+    for name, (collection_name, query) in queries.items():
+        explain = db[collection_name].find(query).explain()
+        stages[name] = get_winning_stage(explain['queryPlanner']['winningPlan'])
+        logging.info(f"Explain {name}: {stages[name]}")
+    return stages
+
+
+# Função para registrar o tamanho das coleções e índices
+def log_storage_stats(db: Any, collections: List[str] = COLLECTIONS) -> Dict[str, Dict[str, float]]:
+    """Log document size, storage size and index size of each collection.
+
+    Args:
+        db (Any): The MongoDB database.
+        collections (List[str], optional): The collections to inspect. Defaults to COLLECTIONS.
+
+    Returns:
+        Dict[str, Dict[str, float]]: The statistics of each collection.
+    """
+    stats = {}
+    for collection_name in collections:
+        coll_stats = db.command('collStats', collection_name)
+        stats[collection_name] = {
+            'count': coll_stats.get('count', 0),
+            'avg_obj_size': coll_stats.get('avgObjSize', 0),
+            'size': coll_stats.get('size', 0),
+            'storage_size': coll_stats.get('storageSize', 0),
+            'index_size': coll_stats.get('totalIndexSize', 0),
+        }
+        logging.info(f"Storage {collection_name} ({storage_layout}): {stats[collection_name]['count']} docs, "
+                     f"avg {stats[collection_name]['avg_obj_size'] / 1024:.2f} KB/doc, "
+                     f"data {stats[collection_name]['size'] / (1024 ** 2):.2f} MB, "
+                     f"storage {stats[collection_name]['storage_size'] / (1024 ** 2):.2f} MB, "
+                     f"indexes {stats[collection_name]['index_size'] / (1024 ** 2):.2f} MB")
+    return stats
+
 
 
 ####################
-# Geração de dados #
+# Banco em memória #
 ####################
 
-# Função para gerar produtos aleatórios
-def generate_fake_product() -> Dict[str, Any]:
-    """Generate a fake product with random attributes.
+# Marcador de campo ausente nos documentos
+MISSING = object()
+
+# Ida e volta simulada de cada chamada do banco assíncrono em memória (ms)
+ASYNC_MEMORY_LATENCY_MS = 0.5
+
+
+# Função para comparar um valor com uma condição de consulta
+def match_condition(value: Any, condition: Any) -> bool:
+    """Check a document value against a query condition (a literal or an operator document).
+
+    Args:
+        value (Any): The document value, or MISSING.
+        condition (Any): The literal to compare with, or a document of $eq/$ne/$gt/$gte/$lt/$lte/$in/$exists operators
+            ($elemMatch is resolved by match_document).
 
     Returns:
-        Dict[str, Any]: A dictionary representing a fake product.
+        bool: Whether the value satisfies the condition.
     """
-    return {
-        'product_id': fake.unique.uuid4(),
-        'product_name': fake.word(),
-        'category': fake.word(),
-        'description': fake.text(max_nb_chars=200),
-        'price': round(random.uniform(5.0, 500.0), 2),
-        'stock_quantity': random.randint(0, 1000),
-        'manufacturer': fake.company(),
-        'sku': fake.unique.ean13(),
-        'expiry_date': fake.date_time_between(start_date=datetime.now(), end_date='+2y'),
-        #'expiry_date': datetime.strptime(fake.date_between(start_date='today', end_date='+2y'), '%Y-%m-%d %H:%M:%S'),
-        'supplier': fake.company()
-    }
+    if not (isinstance(condition, dict) and condition and all(key.startswith('$') for key in condition)):
+        return value is not MISSING and value == condition
+    for operator, argument in condition.items():
+        if operator == '$exists':
+            matched = (value is not MISSING) == bool(argument)
+        elif operator == '$eq':
+            matched = value is not MISSING and value == argument
+        elif operator == '$ne':
+            matched = value is MISSING or value != argument
+        elif operator == '$in':
+            matched = value is not MISSING and value in argument
+        elif value is MISSING or value is None:
+            matched = False
+        elif operator == '$gt':
+            matched = value > argument
+        elif operator == '$gte':
+            matched = value >= argument
+        elif operator == '$lt':
+            matched = value < argument
+        elif operator == '$lte':
+            matched = value <= argument
+        else:
+            raise NotImplementedError(f"Query operator '{operator}' is not supported by the in-memory engine.")
+        if not matched:
+            return False
+    return True
 
 
-# Função para gerar filiais aleatórias
-def generate_fake_store(min_products: int, max_products: int) -> Dict[str, Any]:
-    """Generate a fake store with random attributes and products.
+# Função para avaliar um filtro sobre um documento
+def match_document(document: Dict[str, Any], query: Dict[str, Any]) -> Tuple[bool, Any]:
+    """Check a document against a query, following dotted paths into embedded documents and arrays.
 
     Args:
-        min_products (int): The minimum number of products in the store.
-        max_products (int): The maximum number of products in the store.
+        document (Dict[str, Any]): The stored document.
+        query (Dict[str, Any]): The query, with one condition per (possibly dotted) field.
 
     Returns:
-        Dict[str, Any]: A dictionary representing a fake store.
+        Tuple[bool, Any]: Whether the document matches, and the array position matched by a dotted path (for the positional $ operator).
     """
-    # store_id = fake.unique.uuid4()
-    return {
-        'store_id': fake.unique.uuid4(),
-        'store_name': fake.company(),
-        'address': fake.address(),
-        'phone': fake.phone_number(),
-        'manager_name': fake.name(),
-        'email': fake.company_email(),
-        #'opening_date': fake.date_time_between(start_date='-10y', end_date='today'),
-        'opening_date': fake.date_time_between(start_date='-10y', end_date=datetime.now()),
-        #'opening_date': datetime.strptime(fake.date_between(start_date='-10y', end_date='today'), '%Y-%m-%d %H:%M:%S'),
-        'number_of_employees': random.randint(5, 50),
-        'store_area': round(random.uniform(50.0, 500.0), 2),
-        'products': [generate_fake_product() for _ in range(random.randint(min_products, max_products))]
-    }
+    position = None
+    for path, condition in query.items():
+        head, _, rest = path.partition('.')
+        value = document.get(head, MISSING)
+        if isinstance(condition, dict) and '$elemMatch' in condition:
+            for index, item in enumerate(value if isinstance(value, list) else []):
+                if isinstance(item, dict) and match_document(item, condition['$elemMatch'])[0]:
+                    position = index
+                    break
+            else:
+                return False, None
+        elif rest and isinstance(value, list):
+            for index, item in enumerate(value):
+                if isinstance(item, dict) and match_condition(item.get(rest, MISSING), condition):
+                    position = index
+                    break
+            else:
+                return False, None
+        elif rest:
+            nested = value.get(rest, MISSING) if isinstance(value, dict) else MISSING
+            if not match_condition(nested, condition):
+                return False, None
+        elif not match_condition(value, condition):
+            return False, None
+    return True, position
 
 
-# Função para gerar vendas aleatórias
-def generate_fake_sale(store_id: str, product_id: str) -> Dict[str, Any]:
-    """Generate a fake sale with random attributes.
+# Função para verificar se uma consulta está contida no filtro de um índice parcial
+def filter_implies(query: Dict[str, Any], partial: Dict[str, Any]) -> bool:
+    """Check whether every document matched by a query also matches the filter of a partial index, so the index can serve it.
+
+    Like the query planner, only the simple cases are recognized: equalities and $gt/$gte/$lt/$lte bounds at least as tight
+    as the ones of the filter, on the same top-level fields.
 
     Args:
-        store_id (str): The ID of the store.
-        product_id (str): The ID of the product.
+        query (Dict[str, Any]): The query.
+        partial (Dict[str, Any]): The partialFilterExpression of the index.
 
     Returns:
-        Dict[str, Any]: A dictionary representing a fake sale.
+        bool: Whether the index covers the query.
     """
-    return {
-        'sale_id': fake.unique.uuid4(),
-        'store_id': store_id,
-        'product_id': product_id,
-        'quantity_sold': random.randint(1, 10),
-        'sale_date': fake.date_time_this_year(),
-        #'sale_date': datetime.strptime(fake.date_time_this_year(), '%Y-%m-%d %H:%M:%S'),
-        'customer_id': fake.unique.uuid4(),
-        'customer_name': fake.name(),
-        'payment_method': random.choice(['Credit Card', 'Cash', 'Debit Card']),
-        'total_amount': round(random.uniform(10.0, 1000.0), 2),
-        'items': [fake.word() for _ in range(random.randint(1, 5))]
-    }
+    for field, condition in partial.items():
+        given = query.get(field, MISSING)
+        if given is MISSING:
+            return False
+        if not (isinstance(given, dict) and given and all(key.startswith('$') for key in given)):
+            given = {'$eq': given}
+        if '$eq' in given:
+            if not match_condition(given['$eq'], condition):
+                return False
+            continue
+        bounds = condition if isinstance(condition, dict) else {'$eq': condition}
+        for operator, argument in bounds.items():
+            if operator in ['$lt', '$lte']:
+                limits = [(key, value) for key, value in given.items() if key in ['$lt', '$lte']]
+                covered = any(value < argument or (value == argument and (key == '$lt' or operator == '$lte')) for key, value in limits)
+            elif operator in ['$gt', '$gte']:
+                limits = [(key, value) for key, value in given.items() if key in ['$gt', '$gte']]
+                covered = any(value > argument or (value == argument and (key == '$gt' or operator == '$gte')) for key, value in limits)
+            else:
+                covered = False
+            if not covered:
+                return False
+    return True
 
 
-#####################
-# Inserção de dados #
-#####################
+# Função para aplicar uma atualização sobre um documento
+def apply_update(document: Dict[str, Any], update: Dict[str, Any], position: Any = None) -> None:
+    """Apply $inc, $set and $push updates to a document, resolving the positional $ operator.
+
+    Args:
+        document (Dict[str, Any]): The stored document, updated in place.
+        update (Dict[str, Any]): The update document.
+        position (Any, optional): The array position matched by the query. Defaults to None.
+    """
+    for operator, fields in update.items():
+        for path, argument in fields.items():
+            parts = [str(position) if part == '$' else part for part in path.split('.')]
+            container = document
+            for part in parts[:-1]:
+                container = container[int(part)] if isinstance(container, list) else container.setdefault(part, {})
+            key = int(parts[-1]) if isinstance(container, list) else parts[-1]
+            if operator == '$inc':
+                container[key] = (container[key] if isinstance(container, list) else container.get(key, 0)) + argument
+            elif operator == '$set':
+                container[key] = argument
+            elif operator == '$push':
+                container.setdefault(key, []).append(argument)
+            else:
+                raise NotImplementedError(f"Update operator '{operator}' is not supported by the in-memory engine.")
 
-# Inserir dados de filiais no MongoDB
-def insert_stores(num_stores: int, min_products: int, max_products: int) -> List[Dict[str, Any]]:
-    """Insert fake store data into the MongoDB.
+
+# Função para copiar um documento aplicando a projeção
+def project_document(document: Dict[str, Any], projection: Any = None) -> Dict[str, Any]:
+    """Copy a stored document, keeping only the projected fields.
 
     Args:
-        num_stores (int): The number of stores to generate and insert.
-        min_products (int): The minimum number of products in a store.
-        max_products (int): The maximum number of products in a store.
+        document (Dict[str, Any]): The stored document.
+        projection (Any, optional): An inclusion projection ({field: 1}, dotted paths reach into embedded documents and arrays)
+            or a list of fields. Defaults to None (all fields).
 
     Returns:
-        List[Dict[str, Any]]: A list of dictionaries representing the stores inserted.
+        Dict[str, Any]: A copy that can be changed without touching the stored document.
     """
-    stores = [generate_fake_store(min_products, max_products) for _ in range(num_stores)]
-    stores_collection.insert_many(stores)
-    return stores
+    if projection is None:
+        return copy.deepcopy(document)
+    projection = dict.fromkeys(projection, 1) if isinstance(projection, (list, tuple)) else projection
+    result: Dict[str, Any] = {}
+    if projection.get('_id', 1) and '_id' in document:
+        result['_id'] = document['_id']
+    for path, included in projection.items():
+        head, _, rest = path.partition('.')
+        if not included or head not in document or path == '_id':
+            continue
+        value = document[head]
+        if not rest:
+            result[head] = copy.deepcopy(value)
+        elif isinstance(value, list):
+            items = result.setdefault(head, [{} for item in value if isinstance(item, dict)])
+            for item, projected in zip([item for item in value if isinstance(item, dict)], items):
+                if rest in item:
+                    projected[rest] = copy.deepcopy(item[rest])
+        elif isinstance(value, dict) and rest in value:
+            result.setdefault(head, {})[rest] = copy.deepcopy(value[rest])
+    return result
 
 
-# Inserir dados de vendas no MongoDB
-def insert_sales(num_sales: int, stores: List[Dict[str, Any]]) -> None:
-    """Insert fake sales data into the MongoDB.
+# Função para ler um caminho pontuado de um documento
+def resolve_path(document: Dict[str, Any], path: str) -> Any:
+    """Follow a dotted path into embedded documents and array positions.
 
     Args:
-        num_sales (int): The number of sales to generate and insert.
-        stores (List[Dict[str, Any]]): A list of stores to associate sales with.
+        document (Dict[str, Any]): The document.
+        path (str): The dotted path.
+
+    Returns:
+        Any: The value, or MISSING.
     """
-    sales = []
-    for _ in range(num_sales):
-        store = random.choice(stores)
-        product = random.choice(store['products'])
-        sale = generate_fake_sale(store['store_id'], product['product_id'])
-        sales.append(sale)
-        # Atualizar estoque do produto vendido
-        products_collection.update_one(
-            {'product_id': product['product_id'], 'store_id': store['store_id']},
-            {'$inc': {'stock_quantity': -sale['quantity_sold']}}
-        )
-    sales_collection.insert_many(sales)
+    value: Any = document
+    for part in path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(part, MISSING)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return MISSING
+        if value is MISSING:
+            return MISSING
+    return value
+
+
+# Função para avaliar uma expressão de agregação
+def evaluate_expression(document: Dict[str, Any], expression: Any) -> Any:
+    """Evaluate an aggregation expression ('$field' references, literals, documents of expressions and the
+    $add/$multiply/$divide/$max/$min/$ifNull/$dateToString operators) against a document.
+
+    Args:
+        document (Dict[str, Any]): The document.
+        expression (Any): The expression.
+
+    Returns:
+        Any: The value of the expression (None for a missing field).
+    """
+    if isinstance(expression, str) and expression.startswith('$'):
+        value = resolve_path(document, expression[1:])
+        return None if value is MISSING else value
+    if isinstance(expression, list):
+        return [evaluate_expression(document, item) for item in expression]
+    if not isinstance(expression, dict):
+        return expression
+    if len(expression) != 1 or not next(iter(expression)).startswith('$'):
+        return {field: evaluate_expression(document, value) for field, value in expression.items()}
+    operator, argument = next(iter(expression.items()))
+    if operator == '$dateToString':
+        date = evaluate_expression(document, argument['date'])
+        return None if date is None else date.strftime(argument['format'])
+    values = evaluate_expression(document, argument)
+    values = values if isinstance(values, list) else [values]
+    if operator == '$ifNull':
+        return next((value for value in values if value is not None), None)
+    if any(value is None for value in values):
+        return None
+    if operator == '$add':
+        return sum(values)
+    if operator == '$multiply':
+        product = 1
+        for value in values:
+            product *= value
+        return product
+    if operator == '$divide':
+        return values[0] / values[1]
+    if operator == '$max':
+        return max(values)
+    if operator == '$min':
+        return min(values)
+    raise NotImplementedError(f"Expression operator '{operator}' is not supported by the in-memory engine.")
+
+
+# Função para agrupar documentos no estágio $group
+def group_documents(documents: List[Dict[str, Any]], stage: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Run a $group stage with the $sum, $avg, $min, $max, $first and $push accumulators.
+
+    Args:
+        documents (List[Dict[str, Any]]): The input documents.
+        stage (Dict[str, Any]): The $group specification.
+
+    Returns:
+        List[Dict[str, Any]]: One document per group, in the order the groups were first seen.
+    """
+    accumulators = [(field, *next(iter(accumulator.items()))) for field, accumulator in stage.items() if field != '_id']
+    groups: Dict[Any, Dict[str, Any]] = {}
+    counts: Dict[Any, int] = defaultdict(int)
+    for document in documents:
+        key = evaluate_expression(document, stage['_id'])
+        hashable = tuple(key.items()) if isinstance(key, dict) else key
+        group = groups.get(hashable)
+        if group is None:
+            group = groups[hashable] = {'_id': key}
+            for field, operator, _ in accumulators:
+                group[field] = [] if operator == '$push' else (0 if operator in ['$sum', '$avg'] else MISSING)
+        counts[hashable] += 1
+        for field, operator, expression in accumulators:
+            value = evaluate_expression(document, expression)
+            if operator in ['$sum', '$avg']:
+                group[field] += value if isinstance(value, (int, float)) else 0
+            elif operator == '$push':
+                group[field].append(value)
+            elif operator == '$first':
+                group[field] = value if group[field] is MISSING else group[field]
+            elif operator in ['$min', '$max']:
+                if value is not None and (group[field] is MISSING or (value < group[field] if operator == '$min' else value > group[field])):
+                    group[field] = value
+            else:
+                raise NotImplementedError(f"Accumulator '{operator}' is not supported by the in-memory engine.")
+    for hashable, group in groups.items():
+        for field, operator, _ in accumulators:
+            if operator == '$avg':
+                group[field] /= counts[hashable]
+            elif group[field] is MISSING:
+                group[field] = None
+    return list(groups.values())
+
+
+# Função para projetar um documento no estágio $project
+def project_stage(document: Dict[str, Any], stage: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a $project stage of inclusions (field: 1) and computed fields on a document; only _id can be excluded.
+
+    Args:
+        document (Dict[str, Any]): The input document.
+        stage (Dict[str, Any]): The $project specification.
+
+    Returns:
+        Dict[str, Any]: The projected document.
+    """
+    result = {'_id': document['_id']} if stage.get('_id', 1) not in [0, False] and '_id' in document else {}
+    for field, value in stage.items():
+        if field == '_id' and value in [0, 1, False, True]:
+            continue
+        if value is True or value == 1:
+            included = resolve_path(document, field)
+            if included is not MISSING:
+                result[field] = included
+        elif value is False or value == 0:
+            raise NotImplementedError("Exclusion projections are not supported by the in-memory engine.")
+        else:
+            result[field] = evaluate_expression(document, value)
+    return result
+
+
+# Função para executar um pipeline de agregação em memória
+def run_pipeline(documents: List[Dict[str, Any]], pipeline: List[Dict[str, Any]], database: Any = None) -> List[Dict[str, Any]]:
+    """Run the $match, $group, $sort, $skip, $limit, $project, $addFields/$set, $unwind, $lookup, $count and $merge stages.
+
+    Args:
+        documents (List[Dict[str, Any]]): The documents of the collection (not modified).
+        pipeline (List[Dict[str, Any]]): The pipeline.
+        database (Any, optional): The MemoryDatabase that $lookup and $merge resolve collections in. Defaults to None.
+
+    Returns:
+        List[Dict[str, Any]]: The output documents (none after a $merge).
+    """
+    for stage in pipeline:
+        (name, spec), = stage.items()
+        if name in ['$lookup', '$merge'] and database is None:
+            raise NotImplementedError(f"Stage '{name}' needs the collection to belong to a MemoryDatabase.")
+        if name == '$match':
+            documents = [document for document in documents if match_document(document, spec)[0]]
+        elif name == '$group':
+            documents = group_documents(documents, spec)
+        elif name == '$sort':
+            documents = list(documents)
+            for field, direction in reversed(list(spec.items())):
+                documents.sort(key=lambda document: (lambda value: (0, 0) if value is MISSING or value is None else (1, value))(resolve_path(document, field)),
+                               reverse=direction < 0)
+        elif name == '$skip':
+            documents = documents[spec:]
+        elif name == '$limit':
+            documents = documents[:spec]
+        elif name == '$project':
+            documents = [project_stage(document, spec) for document in documents]
+        elif name in ['$addFields', '$set']:
+            documents = [{**document, **{field: evaluate_expression(document, value) for field, value in spec.items()}} for document in documents]
+        elif name == '$unwind':
+            path = (spec if isinstance(spec, str) else spec['path'])[1:]
+            documents = [{**document, path: item} for document in documents for item in (document.get(path) or [])]
+        elif name == '$lookup':
+            foreign = database[spec['from']]
+            with foreign.lock:
+                documents = [{**document, spec['as']: [copy.deepcopy(match) for match, _ in foreign._find_matches(
+                    {spec['foreignField']: evaluate_expression(document, '$' + spec['localField'])})]} for document in documents]
+        elif name == '$count':
+            documents = [{spec: len(documents)}]
+        elif name == '$merge':
+            target = database[spec['into'] if isinstance(spec, dict) else spec]
+            on = spec.get('on', '_id') if isinstance(spec, dict) else '_id'
+            target.merge_documents(documents, [on] if isinstance(on, str) else on, spec.get('whenMatched', 'merge') if isinstance(spec, dict) else 'merge')
+            documents = []
+        else:
+            raise NotImplementedError(f"Stage '{name}' is not supported by the in-memory engine.")
+    return documents
+
+
+# Cursor de resultados em memória
+class MemoryCursor:
+    """Iterable result of MemoryCollection.find, with the cursor methods used by the operations.
+
+    Args:
+        documents (List[Dict[str, Any]]): The documents returned by the query.
+        index_name (str, optional): The index the query used, or None for a collection scan. Defaults to None.
+        examined (int, optional): The number of documents the query examined. Defaults to None.
+    """
+
+    def __init__(self, documents: List[Dict[str, Any]], index_name: str = None, examined: int = None) -> None:
+        self.documents = documents
+        self.index_name = index_name
+        self.examined = examined
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.documents)
+
+    def batch_size(self, size: int) -> 'MemoryCursor':
+        return self
+
+    def limit(self, size: int) -> 'MemoryCursor':
+        if size:
+            self.documents = self.documents[:size]
+        return self
+
+    def explain(self) -> Dict[str, Any]:
+        stats = {'executionStats': {'nReturned': len(self.documents), 'totalDocsExamined': self.examined}} if self.examined is not None else {}
+        if self.index_name is None:
+            return {'queryPlanner': {'winningPlan': {'stage': 'COLLSCAN'}}, **stats}
+        return {'queryPlanner': {'winningPlan': {'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN', 'indexName': self.index_name}}}, **stats}
+
+
+# Change stream em memória
+class MemoryChangeStream:
+    """Stand-in for a pymongo ChangeStream over the change log of a MemoryDatabase, filtered to one collection.
+
+    The resume token of an event is its position in the change log.
+
+    Args:
+        database (Any): The MemoryDatabase.
+        collection (str): The watched collection.
+        resume_after (Dict[str, Any], optional): The token to resume after. Defaults to None (the end of the log).
+        max_await_time_ms (int, optional): How long try_next waits for a new event. Defaults to None (1 second).
+    """
+
+    def __init__(self, database: Any, collection: str, resume_after: Dict[str, Any] = None, max_await_time_ms: int = None) -> None:
+        self.database = database
+        self.collection = collection
+        self.max_await = (max_await_time_ms or 1000) / 1000
+        with database.changes_condition:
+            self.position = int(resume_after['_data'], 16) + 1 if resume_after else len(database.changes)
+        self.resume_token = {'_data': f'{self.position - 1:016X}'}
+        self.alive = True
+
+    def try_next(self) -> Any:
+        """Get the next change of the collection, waiting up to max_await_time_ms for one.
+
+        Returns:
+            Any: The change event, or None when there was none.
+        """
+        changes = self.database.changes
+        with self.database.changes_condition:
+            if self.position >= len(changes):
+                self.database.changes_condition.wait(self.max_await)
+            while self.position < len(changes):
+                event = changes[self.position]
+                self.position += 1
+                if event['ns']['coll'] == self.collection:
+                    self.resume_token = event['_id']
+                    return copy.deepcopy(event)
+            self.resume_token = {'_data': f'{self.position - 1:016X}'}
+        return None
+
+    def close(self) -> None:
+        self.alive = False
+
+    def __enter__(self) -> 'MemoryChangeStream':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+# Sessão do banco em memória
+class MemorySession:
+    """Stand-in for a pymongo ClientSession, keeping the cluster time of the last write made with it."""
+
+    def __init__(self) -> None:
+        self.operation_time = None
+
+    def end_session(self) -> None:
+        pass
+
+    def __enter__(self) -> 'MemorySession':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.end_session()
+
+
+# Índice hash em memória
+class MemoryIndex:
+    """Hash index of a MemoryCollection, with one hash table per prefix of its keys so that equality queries on any
+    prefix can use it, as they can use a B-tree index.
+
+    Documents whose key values are not hashable (arrays, embedded documents) are kept aside and always returned as candidates.
+    A partial index only holds the documents matching its filter, and only serves the queries the filter covers.
+
+    Args:
+        name (str): The index name.
+        keys (List[Tuple[str, int]]): The indexed top-level fields and their directions.
+        unique (bool, optional): Whether to reject documents with the same key. Defaults to False.
+        partial (Dict[str, Any], optional): The partialFilterExpression of the index. Defaults to None.
+    """
+
+    def __init__(self, name: str, keys: List[Tuple[str, int]], unique: bool = False, partial: Dict[str, Any] = None) -> None:
+        self.name = name
+        self.keys = list(keys)
+        self.fields = [field for field, _ in self.keys]
+        self.unique = unique
+        self.partial = partial
+        self.tables: List[Dict[Tuple[Any, ...], Dict[int, Dict[str, Any]]]] = [{} for _ in self.fields]
+        self.unhashable: Dict[int, Dict[str, Any]] = {}
+
+    def _key(self, document: Dict[str, Any]) -> Tuple[Any, ...]:
+        return tuple(document.get(field) for field in self.fields)
+
+    def add(self, document: Dict[str, Any]) -> None:
+        """Index a document.
+
+        Raises:
+            DuplicateKeyError: If the index is unique and another document has the same key.
+        """
+        if self.partial and not match_document(document, self.partial)[0]:
+            return
+        key = self._key(document)
+        try:
+            hash(key)
+        except TypeError:
+            self.unhashable[id(document)] = document
+            return
+        if self.unique and self.tables[-1].get(key):
+            raise DuplicateKeyError(f"E11000 duplicate key error index: {self.name} dup key: {dict(zip(self.fields, key))}", 11000)
+        for length, table in enumerate(self.tables, 1):
+            table.setdefault(key[:length], {})[id(document)] = document
+
+    def remove(self, document: Dict[str, Any]) -> None:
+        """Remove a document, which must still hold the values it was indexed with."""
+        if self.unhashable.pop(id(document), None) is not None:
+            return
+        if self.partial and not match_document(document, self.partial)[0]:
+            return
+        key = self._key(document)
+        for length, table in enumerate(self.tables, 1):
+            bucket = table[key[:length]]
+            del bucket[id(document)]
+            if not bucket:
+                del table[key[:length]]
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Get every indexed document, as a full scan of the index would."""
+        return [*(document for bucket in self.tables[0].values() for document in bucket.values()), *self.unhashable.values()]
+
+    def lookup(self, query: Dict[str, Any]) -> Tuple[int, List[Dict[str, Any]]]:
+        """Get the candidates of a query from the longest prefix of the keys it matches by equality.
+
+        Returns:
+            Tuple[int, List[Dict[str, Any]]]: The number of keys used (0 when the index cannot serve the query) and the candidates.
+        """
+        if self.partial and not filter_implies(query, self.partial):
+            return 0, []
+        values = []
+        for field in self.fields:
+            condition = query.get(field, MISSING)
+            if isinstance(condition, dict):
+                condition = condition['$eq'] if list(condition) == ['$eq'] else MISSING
+            if condition is MISSING or isinstance(condition, (dict, list)):
+                break
+            values.append(condition)
+        if not values:
+            return 0, []
+        bucket = self.tables[len(values) - 1].get(tuple(values), {})
+        return len(values), [*bucket.values(), *self.unhashable.values()]
+
+
+# Coleção em memória
+class MemoryCollection:
+    """In-memory stand-in for a pymongo Collection, supporting the calls made by the operations.
+
+    Equality queries are served by the hash indexes (see MemoryIndex) and every call can sleep for an injected
+    round trip, so the client-side costs can be profiled without a server.
 
+    Args:
+        name (str): The collection name.
+        latency (float, optional): The round trip injected in each call, in seconds. Defaults to 0.0.
+        database (Any, optional): The MemoryDatabase the collection belongs to, for $lookup and $merge. Defaults to None.
+    """
+
+    def __init__(self, name: str, latency: float = 0.0, database: Any = None) -> None:
+        self.name = name
+        self.latency = latency
+        self.database = database
+        self.documents: List[Dict[str, Any]] = []
+        self.indexes: Dict[str, MemoryIndex] = {'_id_': MemoryIndex('_id_', [('_id', pymongo.ASCENDING)], unique=True)}
+        self.lock = threading.RLock()
+
+    def _round_trip(self) -> None:
+        """Sleep for the injected round trip."""
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _plan(self, query: Dict[str, Any], hint: Any = None) -> Tuple[str, List[Dict[str, Any]]]:
+        """Choose the index matching the most keys of a query by equality, preferring the fewest candidates on ties.
+
+        Args:
+            query (Dict[str, Any]): The query.
+            hint (Any, optional): An index name or key pattern to use instead, or {'$natural': 1} for a collection scan. Defaults to None.
+
+        Returns:
+            Tuple[str, List[Dict[str, Any]]]: The index name and its candidates, or None and all the documents.
+
+        Raises:
+            OperationFailure: If the hint does not name an existing index.
+        """
+        if hint is not None:
+            keys = list(hint.items()) if isinstance(hint, dict) else hint
+            if not isinstance(keys, str) and keys[0][0] == '$natural':
+                return None, self.documents
+            name = keys if isinstance(keys, str) else next((name for name, index in self.indexes.items() if index.keys == list(keys)), None)
+            if name not in self.indexes:
+                raise OperationFailure("error processing query: planner returned error :: caused by :: hint provided does not correspond to an existing index")
+            length, candidates = self.indexes[name].lookup(query)
+            return name, candidates if length else self.indexes[name].entries()
+        best_name, best_length, best_candidates = None, 0, self.documents
+        for name, index in self.indexes.items():
+            length, candidates = index.lookup(query)
+            if length > best_length or (length and length == best_length and len(candidates) < len(best_candidates)):
+                best_name, best_length, best_candidates = name, length, candidates
+        return best_name, best_candidates
+
+    def _find_matches(self, query: Dict[str, Any]) -> Iterator[Tuple[Dict[str, Any], Any]]:
+        """Yield the stored documents matching a query, with the matched array position."""
+        for document in self._plan(query)[1]:
+            matched, position = match_document(document, query)
+            if matched:
+                yield document, position
+
+    def _store(self, document: Dict[str, Any]) -> None:
+        """Index and append a document, leaving no index entry behind when a unique index rejects it."""
+        indexed = []
+        try:
+            for index in self.indexes.values():
+                index.add(document)
+                indexed.append(index)
+        except DuplicateKeyError:
+            for index in indexed:
+                index.remove(document)
+            raise
+        self.documents.append(document)
+        if self.database is not None and self.database.record_changes:
+            self.database.record_change(self.name, 'insert', document)
+
+    def _update(self, document: Dict[str, Any], update: Dict[str, Any], position: Any = None) -> None:
+        """Apply an update to a stored document, re-indexing it in the indexes on the updated fields."""
+        fields = {path.partition('.')[0] for paths in update.values() for path in paths}
+        indexes = [index for index in self.indexes.values() if fields.intersection([*index.fields, *(index.partial or {})])]
+        for index in indexes:
+            index.remove(document)
+        apply_update(document, update, position)
+        for index in indexes:
+            index.add(document)
+        if self.database is not None and self.database.record_changes:
+            self.database.record_change(self.name, 'update', document, fields)
+
+    def _insert_one(self, document: Dict[str, Any]) -> InsertOneResult:
+        with self.lock:
+            document.setdefault('_id', ObjectId())
+            self._store(copy.deepcopy(document))
+        return InsertOneResult(document['_id'], True)
+
+    def _update_one(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> UpdateResult:
+        with self.lock:
+            for document, position in self._find_matches(query):
+                self._update(document, update, position)
+                return UpdateResult({'n': 1, 'nModified': 1}, True)
+            if not upsert:
+                return UpdateResult({'n': 0, 'nModified': 0}, True)
+            document = {field: value for field, value in query.items() if '.' not in field and not isinstance(value, dict)}
+            apply_update(document, update)
+            document.setdefault('_id', ObjectId())
+            self._store(document)
+            return UpdateResult({'n': 1, 'nModified': 0, 'upserted': document['_id']}, True)
+
+    def _track(self, session: Any) -> None:
+        """Copy the cluster time of the last write of the calling thread to its session."""
+        if session is not None and self.database is not None:
+            session.operation_time = getattr(self.database.thread_state, 'operation_time', None)
+
+    def insert_one(self, document: Dict[str, Any], session: Any = None) -> InsertOneResult:
+        self._round_trip()
+        result = self._insert_one(document)
+        self._track(session)
+        return result
+
+    def insert_many(self, documents: List[Dict[str, Any]], ordered: bool = True, session: Any = None) -> InsertManyResult:
+        self._round_trip()
+        result = InsertManyResult([self._insert_one(document).inserted_id for document in documents], True)
+        self._track(session)
+        return result
+
+    def find(self, query: Dict[str, Any] = None, projection: Any = None, batch_size: int = 0, hint: Any = None) -> MemoryCursor:
+        self._round_trip()
+        query = query or {}
+        with self.lock:
+            index_name, candidates = self._plan(query, hint)
+            return MemoryCursor([project_document(document, projection) for document in candidates if match_document(document, query)[0]], index_name, len(candidates))
+
+    def find_one(self, query: Dict[str, Any] = None, projection: Any = None) -> Any:
+        self._round_trip()
+        with self.lock:
+            for document, _ in self._find_matches(query or {}):
+                return project_document(document, projection)
+        return None
+
+    def update_one(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False, session: Any = None) -> UpdateResult:
+        self._round_trip()
+        result = self._update_one(query, update, upsert)
+        self._track(session)
+        return result
+
+    def find_one_and_update(self, query: Dict[str, Any], update: Dict[str, Any], projection: Any = None, return_document: bool = ReturnDocument.BEFORE) -> Any:
+        self._round_trip()
+        with self.lock:
+            for document, position in self._find_matches(query):
+                before = project_document(document, projection)
+                self._update(document, update, position)
+                return project_document(document, projection) if return_document == ReturnDocument.AFTER else before
+        return None
+
+    def bulk_write(self, requests: List[Any], ordered: bool = True) -> BulkWriteResult:
+        self._round_trip()
+        result = {'nInserted': 0, 'nUpserted': 0, 'nMatched': 0, 'nModified': 0, 'nRemoved': 0, 'upserted': []}
+        with self.lock:
+            for index, request in enumerate(requests):
+                if isinstance(request, InsertOne):
+                    self._insert_one(request._doc)
+                    result['nInserted'] += 1
+                elif isinstance(request, UpdateOne):
+                    update_result = self._update_one(request._filter, request._doc, upsert=bool(request._upsert))
+                    result['nMatched'] += update_result.matched_count
+                    result['nModified'] += update_result.modified_count
+                    if update_result.upserted_id is not None:
+                        result['nUpserted'] += 1
+                        result['upserted'].append({'index': index, '_id': update_result.upserted_id})
+                else:
+                    raise NotImplementedError(f"Bulk request '{type(request).__name__}' is not supported by the in-memory engine.")
+        return BulkWriteResult(result, True)
+
+    def count_documents(self, query: Dict[str, Any]) -> int:
+        self._round_trip()
+        with self.lock:
+            return sum(1 for _ in self._find_matches(query))
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs: Any) -> MemoryCursor:
+        self._round_trip()
+        with self.lock:
+            return MemoryCursor(copy.deepcopy(run_pipeline(self.documents, pipeline, self.database)))
+
+    def watch(self, pipeline: List[Dict[str, Any]] = None, resume_after: Dict[str, Any] = None, max_await_time_ms: int = None, **kwargs: Any) -> MemoryChangeStream:
+        if self.database is None:
+            raise NotImplementedError("Change streams need a collection bound to a MemoryDatabase.")
+        if pipeline:
+            raise NotImplementedError("Change stream pipelines are not supported by the in-memory engine.")
+        self._round_trip()
+        self.database.record_changes = True
+        return MemoryChangeStream(self.database, self.name, resume_after, max_await_time_ms)
+
+    def merge_documents(self, documents: List[Dict[str, Any]], on: List[str], when_matched: str = 'merge') -> None:
+        """Write the output of a $merge stage, matching the stored documents on the `on` fields.
+
+        Args:
+            documents (List[Dict[str, Any]]): The documents to merge.
+            on (List[str]): The fields identifying a document.
+            when_matched (Any, optional): 'replace', 'merge', 'keepExisting' or an update pipeline, in which $$new is the
+                document being merged. Defaults to 'merge'.
+        """
+        with self.lock:
+            for document in documents:
+                existing = next(self._find_matches({field: document.get(field) for field in on}), (None, None))[0]
+                if existing is None:
+                    self._store({'_id': ObjectId(), **copy.deepcopy(document)})
+                elif when_matched != 'keepExisting':
+                    if isinstance(when_matched, list):
+                        # $$new é resolvido como o campo '$new' do documento existente
+                        replacement, = run_pipeline([{**existing, '$new': document}], when_matched)
+                        replacement = {field: value for field, value in replacement.items() if field != '$new'}
+                    else:
+                        replacement = {**({'_id': existing['_id']} if when_matched == 'replace' else existing), **copy.deepcopy(document), '_id': existing['_id']}
+                    for index in self.indexes.values():
+                        index.remove(existing)
+                    existing.clear()
+                    existing.update(replacement)
+                    for index in self.indexes.values():
+                        index.add(existing)
+
+    def create_index(self, keys: Any, name: str = None, unique: bool = False, partialFilterExpression: Dict[str, Any] = None, **kwargs: Any) -> str:
+        keys = [(keys, pymongo.ASCENDING)] if isinstance(keys, str) else list(keys)
+        if any('.' in field for field, _ in keys):
+            raise NotImplementedError("Indexes on embedded fields are not supported by the in-memory engine.")
+        name = name or '_'.join(f'{field}_{direction}' for field, direction in keys)
+        with self.lock:
+            if name not in self.indexes:
+                index = MemoryIndex(name, keys, unique, partialFilterExpression)
+                for document in self.documents:
+                    index.add(document)
+                self.indexes[name] = index
+        return name
+
+    def drop_index(self, name: str) -> None:
+        if name == '_id_':
+            raise OperationFailure("cannot drop _id index")
+        with self.lock:
+            if self.indexes.pop(name, None) is None:
+                raise OperationFailure(f"index not found with name [{name}]")
+
+    def index_information(self) -> Dict[str, Dict[str, Any]]:
+        return {name: {'key': index.keys, **({'unique': True} if index.unique and name != '_id_' else {}),
+                       **({'partialFilterExpression': index.partial} if index.partial else {})} for name, index in self.indexes.items()}
+
+    def rebuild_indexes(self) -> None:
+        """Rebuild the indexes after the documents list was replaced."""
+        with self.lock:
+            self.indexes = {name: MemoryIndex(name, index.keys, index.unique, index.partial) for name, index in self.indexes.items()}
+            for index in self.indexes.values():
+                for document in self.documents:
+                    index.add(document)
+
+
+# Banco de dados em memória
+class MemoryDatabase:
+    """In-memory stand-in for a pymongo Database, creating collections on first access.
+
+    Args:
+        name (str, optional): The database name. Defaults to DB_NAME.
+        latency_ms (float, optional): The round trip injected in each collection call, in milliseconds. Defaults to MEMORY_LATENCY_MS.
+    """
+
+    def __init__(self, name: str = DB_NAME, latency_ms: float = MEMORY_LATENCY_MS) -> None:
+        self.name = name
+        self.latency_ms = latency_ms
+        self.collections: Dict[str, MemoryCollection] = {}
+        self.lock = threading.Lock()
+        self.record_changes = False
+        self.changes: List[Dict[str, Any]] = []
+        self.changes_condition = threading.Condition()
+        self.cluster_time = Timestamp(0, 0)
+        self.thread_state = threading.local()
+
+    def record_change(self, collection: str, operation: str, document: Dict[str, Any], fields: Any = None) -> Timestamp:
+        """Append an insert or update event to the change log read by the change streams, once one was opened.
+
+        Args:
+            collection (str): The collection written.
+            operation (str): 'insert' or 'update'.
+            document (Dict[str, Any]): The document after the write.
+            fields (Any, optional): The top-level fields an update changed. Defaults to None.
+
+        Returns:
+            Timestamp: The cluster time of the event, also kept as the operation time of the calling thread.
+        """
+        event = {'operationType': operation, 'ns': {'db': self.name, 'coll': collection}, 'documentKey': {'_id': document['_id']}}
+        if operation == 'insert':
+            event['fullDocument'] = copy.deepcopy(document)
+        else:
+            event['updateDescription'] = {'updatedFields': {field: copy.deepcopy(document.get(field)) for field in fields}, 'removedFields': []}
+        with self.changes_condition:
+            seconds = max(int(time.time()), self.cluster_time.time)
+            self.cluster_time = Timestamp(seconds, self.cluster_time.inc + 1 if seconds == self.cluster_time.time else 1)
+            event.update({'_id': {'_data': f'{len(self.changes):016X}'}, 'clusterTime': self.cluster_time,
+                          'wallTime': datetime.now(timezone.utc).replace(tzinfo=None)})
+            self.changes.append(event)
+            self.changes_condition.notify_all()
+        self.thread_state.operation_time = event['clusterTime']
+        return event['clusterTime']
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        with self.lock:
+            if name not in self.collections:
+                self.collections[name] = MemoryCollection(name, self.latency_ms / 1000, self)
+            return self.collections[name]
+
+    def list_collection_names(self) -> List[str]:
+        return list(self.collections)
+
+    def create_collection(self, name: str) -> MemoryCollection:
+        return self[name]
+
+    def command(self, command: str, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        if command == 'ping':
+            return {'ok': 1.0}
+        if command == 'collStats':
+            collection = self[args[0]]
+            with collection.lock:
+                size = sum(len(bson.encode(document)) for document in collection.documents)
+                count = len(collection.documents)
+            return {'ns': f'{self.name}.{collection.name}', 'count': count, 'size': size, 'avgObjSize': size // count if count else 0,
+                    'storageSize': size, 'nindexes': len(collection.indexes), 'totalIndexSize': 0, 'ok': 1.0}
+        raise NotImplementedError(f"Command '{command}' is not supported by the in-memory engine.")
+
+
+# Cursor assíncrono em memória
+class AsyncMemoryCursor:
+    """Async stand-in for a motor cursor over a MemoryCursor.
+
+    Args:
+        cursor (MemoryCursor): The in-memory cursor.
+        latency (float): The simulated round trip, in seconds.
+    """
+
+    def __init__(self, cursor: MemoryCursor, latency: float) -> None:
+        self.cursor = cursor
+        self.latency = latency
+
+    async def to_list(self, length: Any = None) -> List[Dict[str, Any]]:
+        await asyncio.sleep(self.latency)
+        documents = list(self.cursor)
+        return documents[:length] if length else documents
+
+
+# Coleção assíncrona em memória
+class AsyncMemoryCollection:
+    """Async stand-in for a motor collection, backed by a MemoryCollection and yielding to the loop on every call.
+
+    Args:
+        collection (MemoryCollection): The in-memory collection.
+        latency (float): The simulated round trip, in seconds.
+    """
+
+    def __init__(self, collection: MemoryCollection, latency: float) -> None:
+        self.collection = collection
+        self.name = collection.name
+        self.latency = latency
+
+    def find(self, *args: Any, **kwargs: Any) -> AsyncMemoryCursor:
+        return AsyncMemoryCursor(self.collection.find(*args, **kwargs), self.latency)
+
+    async def find_one(self, *args: Any, **kwargs: Any) -> Any:
+        await asyncio.sleep(self.latency)
+        return self.collection.find_one(*args, **kwargs)
+
+    async def insert_one(self, *args: Any, **kwargs: Any) -> InsertOneResult:
+        await asyncio.sleep(self.latency)
+        return self.collection.insert_one(*args, **kwargs)
+
+    async def insert_many(self, *args: Any, **kwargs: Any) -> InsertManyResult:
+        await asyncio.sleep(self.latency)
+        return self.collection.insert_many(*args, **kwargs)
+
+    async def update_one(self, *args: Any, **kwargs: Any) -> UpdateResult:
+        await asyncio.sleep(self.latency)
+        return self.collection.update_one(*args, **kwargs)
+
+
+# Banco de dados assíncrono em memória
+class AsyncMemoryDatabase:
+    """Async stand-in for a motor database, sharing the data of a MemoryDatabase.
+
+    Args:
+        database (MemoryDatabase): The in-memory database.
+        latency_ms (float, optional): The simulated round trip of each call, in milliseconds. Defaults to ASYNC_MEMORY_LATENCY_MS.
+    """
+
+    def __init__(self, database: MemoryDatabase, latency_ms: float = ASYNC_MEMORY_LATENCY_MS) -> None:
+        self.database = database
+        self.latency = latency_ms / 1000
+
+    def __getitem__(self, name: str) -> AsyncMemoryCollection:
+        return AsyncMemoryCollection(self.database[name], self.latency)
+
+
+
+####################
+# Geração de dados #
+####################
+
+# Número de operações enviadas por ida ao banco nas cargas em lote
+BATCH_SIZE = 1000
+
+# Número de filiais geradas por tarefa na carga paralela e intervalo de atualização do progresso (s)
+SEED_STORES_PER_SHARD = 10
+SEED_PROGRESS_INTERVAL = 0.2
+
+seed_progress = None
+
+# Configurar geração vetorizada
+GENERATOR_MODES = ['faker', 'vectorized']
+GENERATOR_MODE = 'faker'
+GENERATOR_SEED = 42
+VOCABULARY_SIZE = 1000
+PAYMENT_METHODS = ['Credit Card', 'Cash', 'Debit Card']
+REGIONS = ['north', 'northeast', 'central-west', 'southeast', 'south']
+
+generator_mode = GENERATOR_MODE
+bulk_generator = None
+
+
+# Função para gerar produtos aleatórios
+def generate_fake_product() -> Dict[str, Any]:
+    """Generate a fake product with random attributes.
+
+    Returns:
+        Dict[str, Any]: A dictionary representing a fake product.
+    """
+    return {
+        'product_id': fake.unique.uuid4(),
+        'product_name': fake.word(),
+        'category': fake.word(),
+        'description': fake.text(max_nb_chars=description_chars),
+        'price': round(random.uniform(5.0, 500.0), 2),
+        'stock_quantity': random.randint(0, 1000),
+        'manufacturer': fake.company(),
+        'sku': fake.unique.ean13(),
+        'expiry_date': fake.date_time_between(start_date=datetime.now(), end_date='+2y'),
+        #'expiry_date': datetime.strptime(fake.date_between(start_date='today', end_date='+2y'), '%Y-%m-%d %H:%M:%S'),
+        'supplier': fake.company()
+    }
+
+
+# Função para gerar filiais aleatórias
+def generate_fake_store(min_products: int, max_products: int) -> Dict[str, Any]:
+    """Generate a fake store with random attributes and products.
+
+    Args:
+        min_products (int): The minimum number of products in the store.
+        max_products (int): The maximum number of products in the store.
+
+    Returns:
+        Dict[str, Any]: A dictionary representing a fake store.
+    """
+    # store_id = fake.unique.uuid4()
+    return {
+        'store_id': fake.unique.uuid4(),
+        'store_name': fake.company(),
+        'address': fake.address(),
+        'phone': fake.phone_number(),
+        'manager_name': fake.name(),
+        'email': fake.company_email(),
+        #'opening_date': fake.date_time_between(start_date='-10y', end_date='today'),
+        'opening_date': fake.date_time_between(start_date='-10y', end_date=datetime.now()),
+        #'opening_date': datetime.strptime(fake.date_between(start_date='-10y', end_date='today'), '%Y-%m-%d %H:%M:%S'),
+        'number_of_employees': random.randint(5, 50),
+        'store_area': round(random.uniform(50.0, 500.0), 2),
+        'region': random.choice(REGIONS),
+        'products': [generate_fake_product() for _ in range(random.randint(min_products, max_products))]
+    }
+
+
+# Função para gerar vendas aleatórias
+def generate_fake_sale(store_id: str, product_id: str) -> Dict[str, Any]:
+    """Generate a fake sale with random attributes.
+
+    Args:
+        store_id (str): The ID of the store.
+        product_id (str): The ID of the product.
+
+    Returns:
+        Dict[str, Any]: A dictionary representing a fake sale.
+    """
+    return {
+        'sale_id': fake.unique.uuid4(),
+        'store_id': store_id,
+        'product_id': product_id,
+        'quantity_sold': random.randint(1, 10),
+        'sale_date': fake.date_time_this_year(),
+        #'sale_date': datetime.strptime(fake.date_time_this_year(), '%Y-%m-%d %H:%M:%S'),
+        'customer_id': fake.unique.uuid4(),
+        'customer_name': fake.name(),
+        'payment_method': random.choice(PAYMENT_METHODS),
+        'total_amount': round(random.uniform(10.0, 1000.0), 2),
+        'items': [fake.word() for _ in range(random.randint(1, 5))]
+    }
+
+
+# Gerador de dados em lote (colunas NumPy)
+class VectorizedGenerator:
+    """Generate products, stores and sales a whole column batch at a time with NumPy.
+
+    Free text (names, companies, addresses, descriptions) is drawn from vocabularies sampled once with Faker,
+    and IDs/EAN13s are derived from a per-shard counter, so there is no uniqueness set to keep.
+
+    Args:
+        seed (int, optional): The seed that makes the generated data deterministic. Defaults to GENERATOR_SEED.
+        shard (int, optional): The shard number, mixed into the IDs so parallel generators never collide. Defaults to 0.
+        vocabulary_size (int, optional): The number of pre-sampled entries of each vocabulary. Defaults to VOCABULARY_SIZE.
+        namespace (str, optional): Mixed into the IDs so different executions over the same database never collide. Defaults to ''.
+    """
+
+    def __init__(self, seed: int = GENERATOR_SEED, shard: int = 0, vocabulary_size: int = VOCABULARY_SIZE, namespace: str = '') -> None:
+        self.seed = seed
+        self.namespace = namespace
+        self.start_shard(shard)
+
+        vocabulary_fake = Faker()
+        vocabulary_fake.seed_instance(seed)
+        self.words = np.array([vocabulary_fake.word() for _ in range(vocabulary_size)], dtype=object)
+        self.companies = np.array([vocabulary_fake.company() for _ in range(vocabulary_size)], dtype=object)
+        self.people = np.array([vocabulary_fake.name() for _ in range(vocabulary_size)], dtype=object)
+        self.addresses = np.array([vocabulary_fake.address() for _ in range(vocabulary_size)], dtype=object)
+        self.phones = np.array([vocabulary_fake.phone_number() for _ in range(vocabulary_size)], dtype=object)
+        self.emails = np.array([vocabulary_fake.company_email() for _ in range(vocabulary_size)], dtype=object)
+        self.texts = np.array([vocabulary_fake.text(max_nb_chars=description_chars) for _ in range(max(1, vocabulary_size // 4))], dtype=object)
+        self.payment_methods = np.array(PAYMENT_METHODS, dtype=object)
+        self.regions = np.array(REGIONS, dtype=object)
+
+    def start_shard(self, shard: int) -> None:
+        """Switch to another shard, reseeding the draws and restarting the IDs while keeping the vocabularies.
+
+        Args:
+            shard (int): The shard number.
+        """
+        self.shard = shard
+        self.rng = np.random.default_rng([self.seed, shard])
+        self.counter = 0
+        self.id_prefix = int.from_bytes(hashlib.blake2b(f"{self.namespace}:{self.seed}:{shard}".encode(), digest_size=8).digest(), 'big')
+        self.sku_offset = int.from_bytes(hashlib.blake2b(f"{self.namespace}:{self.seed}".encode(), digest_size=8).digest(), 'big')
+
+    def _counters(self, size: int) -> np.ndarray:
+        """Reserve the next block of counter values."""
+        counters = np.arange(self.counter, self.counter + size, dtype=np.int64)
+        self.counter += size
+        return counters
+
+    def _uuids(self, size: int) -> List[str]:
+        """Build UUID strings from the shard hash (high bits) and the counter (low bits)."""
+        return [str(uuid.UUID(int=(self.id_prefix << 64) | counter)) for counter in self._counters(size).tolist()]
+
+    def _ean13s(self, size: int) -> List[str]:
+        """Build EAN13 codes from the shard, the counter and the namespace, with the check digit computed for the whole batch.
+
+        The 12-digit body is a block of 3 digits for the shard and 9 for the counter, both shifted by a hash of the namespace
+        and the seed. The codes are unique within a namespace (up to 1000 shards of 10^9 codes each), but 12 digits cannot
+        hold a namespace: codes of different namespaces are only unlikely to collide, not guaranteed to differ.
+        """
+        bodies = (self.shard + self.sku_offset) % 1000 * 10 ** 9 + (self._counters(size) + self.sku_offset // 1000) % 10 ** 9
+        digits = bodies[:, None] // 10 ** np.arange(11, -1, -1, dtype=np.int64) % 10
+        checksums = (10 - (digits * np.tile([1, 3], 6)).sum(axis=1) % 10) % 10
+        return [f"{body:012d}{check}" for body, check in zip(bodies.tolist(), checksums.tolist())]
+
+    def _choice(self, vocabulary: np.ndarray, size: int) -> List[Any]:
+        """Draw entries of a vocabulary."""
+        return vocabulary[self.rng.integers(0, len(vocabulary), size)].tolist()
+
+    def _dates(self, start: datetime, end: datetime, size: int) -> List[datetime]:
+        """Draw datetimes uniformly between two bounds."""
+        start_ms = np.datetime64(start, 'ms')
+        span_ms = max(1, int((np.datetime64(end, 'ms') - start_ms).astype(np.int64)))
+        return (start_ms + self.rng.integers(0, span_ms, size).astype('timedelta64[ms]')).tolist()
+
+    def products(self, size: int) -> List[Dict[str, Any]]:
+        """Generate a batch of products with the same fields as generate_fake_product.
+
+        Args:
+            size (int): The number of products to generate.
+
+        Returns:
+            List[Dict[str, Any]]: The generated products.
+        """
+        now = datetime.now()
+        columns = {
+            'product_id': self._uuids(size),
+            'product_name': self._choice(self.words, size),
+            'category': self._choice(self.words, size),
+            'description': self._choice(self.texts, size),
+            'price': np.round(self.rng.uniform(5.0, 500.0, size), 2).tolist(),
+            'stock_quantity': self.rng.integers(0, 1001, size).tolist(),
+            'manufacturer': self._choice(self.companies, size),
+            'sku': self._ean13s(size),
+            'expiry_date': self._dates(now, now + timedelta(days=2 * 365), size),
+            'supplier': self._choice(self.companies, size),
+        }
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    def stores(self, size: int, min_products: int, max_products: int) -> List[Dict[str, Any]]:
+        """Generate a batch of stores, with their products, with the same fields as generate_fake_store.
+
+        Args:
+            size (int): The number of stores to generate.
+            min_products (int): The minimum number of products in a store.
+            max_products (int): The maximum number of products in a store.
+
+        Returns:
+            List[Dict[str, Any]]: The generated stores.
+        """
+        now = datetime.now()
+        product_counts = self.rng.integers(min_products, max_products + 1, size)
+        products = self.products(int(product_counts.sum()))
+        offsets = np.concatenate(([0], np.cumsum(product_counts))).tolist()
+        columns = {
+            'store_id': self._uuids(size),
+            'store_name': self._choice(self.companies, size),
+            'address': self._choice(self.addresses, size),
+            'phone': self._choice(self.phones, size),
+            'manager_name': self._choice(self.people, size),
+            'email': self._choice(self.emails, size),
+            'opening_date': self._dates(now - timedelta(days=10 * 365), now, size),
+            'number_of_employees': self.rng.integers(5, 51, size).tolist(),
+            'store_area': np.round(self.rng.uniform(50.0, 500.0, size), 2).tolist(),
+            'region': self._choice(self.regions, size),
+            'products': [products[start:end] for start, end in zip(offsets[:-1], offsets[1:])],
+        }
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    def sales(self, store_ids: List[str], product_ids: List[str]) -> List[Dict[str, Any]]:
+        """Generate a batch of sales with the same fields as generate_fake_sale.
+
+        Args:
+            store_ids (List[str]): The store of each sale.
+            product_ids (List[str]): The product of each sale.
+
+        Returns:
+            List[Dict[str, Any]]: The generated sales.
+        """
+        size = len(store_ids)
+        now = datetime.now()
+        item_counts = self.rng.integers(1, 6, size)
+        words = self._choice(self.words, int(item_counts.sum()))
+        offsets = np.concatenate(([0], np.cumsum(item_counts))).tolist()
+        columns = {
+            'sale_id': self._uuids(size),
+            'store_id': list(store_ids),
+            'product_id': list(product_ids),
+            'quantity_sold': self.rng.integers(1, 11, size).tolist(),
+            'sale_date': self._dates(datetime(now.year, 1, 1), now, size),
+            'customer_id': self._uuids(size),
+            'customer_name': self._choice(self.people, size),
+            'payment_method': self._choice(self.payment_methods, size),
+            'total_amount': np.round(self.rng.uniform(10.0, 1000.0, size), 2).tolist(),
+            'items': [words[start:end] for start, end in zip(offsets[:-1], offsets[1:])],
+        }
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    def iter_products(self, total: int, chunk_size: int = BATCH_SIZE, raw_bson: bool = False) -> Iterator[List[Any]]:
+        """Generate products in chunks, ready to be passed to insert_many.
+
+        Args:
+            total (int): The total number of products to generate.
+            chunk_size (int, optional): The number of products in each chunk. Defaults to BATCH_SIZE.
+            raw_bson (bool, optional): Whether to emit already encoded RawBSONDocuments. Defaults to False.
+
+        Yields:
+            Iterator[List[Any]]: The chunks of products.
+        """
+        for start in range(0, total, chunk_size):
+            products = self.products(min(chunk_size, total - start))
+            yield [RawBSONDocument(bson.encode(product)) for product in products] if raw_bson else products
+
+
+# Obter o gerador vetorizado compartilhado
+def get_bulk_generator() -> VectorizedGenerator:
+    """Get the shared vectorized generator, creating it on first use.
+
+    Returns:
+        VectorizedGenerator: The generator used to seed the database.
+    """
+    global bulk_generator
+    if bulk_generator is None:
+        bulk_generator = VectorizedGenerator()
+    return bulk_generator
+
+
+# Gerar filiais conforme o modo de geração
+def generate_stores(num_stores: int, min_products: int, max_products: int) -> List[Dict[str, Any]]:
+    """Generate stores with the current generator mode.
+
+    Args:
+        num_stores (int): The number of stores to generate.
+        min_products (int): The minimum number of products in a store.
+        max_products (int): The maximum number of products in a store.
+
+    Returns:
+        List[Dict[str, Any]]: The generated stores.
+    """
+    if generator_mode == 'vectorized':
+        return get_bulk_generator().stores(num_stores, min_products, max_products)
+    return [generate_fake_store(min_products, max_products) for _ in range(num_stores)]
+
+
+# Gerar vendas conforme o modo de geração
+def generate_sales(num_sales: int, stores: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Generate sales of random products of the given stores with the current generator mode.
+
+    Args:
+        num_sales (int): The number of sales to generate.
+        stores (List[Dict[str, Any]]): The stores to associate sales with.
+
+    Returns:
+        List[Dict[str, Any]]: The generated sales.
+    """
+    if generator_mode != 'vectorized':
+        sales = []
+        for _ in range(num_sales):
+            store = pick_store(stores)
+            product = pick_product(store['products'])
+            sales.append(generate_fake_sale(store['store_id'], product['product_id']))
+        return sales
+
+    generator = get_bulk_generator()
+    product_counts = np.array([len(store['products']) for store in stores])
+    if access_distribution == 'uniform':
+        store_indexes = generator.rng.integers(0, len(stores), num_sales)
+        product_indexes = (generator.rng.random(num_sales) * product_counts[store_indexes]).astype(np.int64)
+    else:
+        store_indexes = access_sampler('stores').samples(len(stores), num_sales)
+        product_indexes = access_sampler('products').samples(product_counts[store_indexes], num_sales)
+    store_ids, product_ids = [], []
+    for store_index, product_index in zip(store_indexes.tolist(), product_indexes.tolist()):
+        store_ids.append(stores[store_index]['store_id'])
+        product_ids.append(stores[store_index]['products'][product_index]['product_id'])
+    return generator.sales(store_ids, product_ids)
+
+
+###########################
+# Distribuições de acesso #
+###########################
+
+# Configurar a distribuição de acesso às filiais e aos produtos
+DISTRIBUTIONS = ['uniform', 'zipfian', 'hotspot', 'latest']
+DISTRIBUTION = 'uniform'
+ZIPFIAN_THETA = 0.99
+HOTSPOT_FRACTION = 0.2
+HOTSPOT_PROBABILITY = 0.8
+SAMPLE_POOL_SIZE = 1 << 16
+SCATTER_MULTIPLIER = 2654435761
+
+access_distribution = DISTRIBUTION
+access_theta = ZIPFIAN_THETA
+access_samplers: Dict[str, 'AccessSampler'] = {}
+
+
+# Amostrador de índices com distribuição enviesada
+class AccessSampler:
+    """Draw item indexes from a skewed access distribution for any number of items, in O(1) per draw.
+
+    The sampler keeps one shared pool of uniform draws and maps each one to an index of the requested size through the
+    inverse CDF of the distribution, so a single sampler serves every number of items. zipfian gives rank r a weight of
+    about 1/r^theta (the continuous approximation), with ranks scattered over the items by a multiplicative hash (like
+    YCSB's scrambled zipfian); hotspot sends hot_probability of the accesses to hot_fraction of the items, also scattered;
+    latest is zipfian over recency, so the last items (the newest stores or products) are the hottest.
+
+    Args:
+        distribution (str, optional): One of DISTRIBUTIONS. Defaults to DISTRIBUTION.
+        theta (float, optional): The zipfian skew (0 is uniform). Defaults to ZIPFIAN_THETA.
+        hot_fraction (float, optional): The fraction of hot items of the hotspot distribution. Defaults to HOTSPOT_FRACTION.
+        hot_probability (float, optional): The fraction of accesses to the hot items. Defaults to HOTSPOT_PROBABILITY.
+        seed (Any, optional): The seed of the draws and of the scattering. Defaults to GENERATOR_SEED.
+        pool_size (int, optional): The number of precomputed uniform draws, cycled through. Defaults to SAMPLE_POOL_SIZE.
+    """
+
+    def __init__(self, distribution: str = DISTRIBUTION, theta: float = ZIPFIAN_THETA, hot_fraction: float = HOTSPOT_FRACTION,
+                 hot_probability: float = HOTSPOT_PROBABILITY, seed: Any = GENERATOR_SEED, pool_size: int = SAMPLE_POOL_SIZE) -> None:
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown access distribution '{distribution}', expected one of {DISTRIBUTIONS}.")
+        self.distribution = distribution
+        self.exponent = 1.0 - theta
+        self.hot_fraction = hot_fraction
+        self.hot_probability = hot_probability
+        self.rng = np.random.default_rng(seed)
+        self.offset = int(self.rng.integers(0, 1 << 31))
+        self.pool = self.rng.random(pool_size).tolist()
+        self.counter = itertools.count()
+
+    def cdf(self, size: Any, positions: Any) -> Any:
+        """Get the probability of drawing one of the first positions, hottest first.
+
+        Args:
+            size (Any): The number of items, an int or an array.
+            positions (Any): The number of hottest positions, an int or an array.
+
+        Returns:
+            Any: The probability, between 0 and 1.
+        """
+        size, positions = np.asarray(size, dtype=np.float64), np.asarray(positions, dtype=np.float64)
+        if self.distribution == 'uniform':
+            return np.minimum(1, positions / size)
+        if self.distribution == 'hotspot':
+            hot = np.minimum(size, np.maximum(1, np.ceil(size * self.hot_fraction)))
+            cold = np.maximum(1, size - hot)
+            return np.where(positions >= size, 1.0, np.where(positions <= hot, self.hot_probability * positions / hot,
+                            self.hot_probability + (1 - self.hot_probability) * np.minimum(1, (positions - hot) / cold)))
+        if abs(self.exponent) < 1e-9:
+            return np.log1p(positions) / np.log1p(size)
+        return np.expm1(self.exponent * np.log1p(positions)) / np.expm1(self.exponent * np.log1p(size))
+
+    def positions(self, size: Any, uniforms: Any) -> np.ndarray:
+        """Map uniform draws to positions in the hotness order through the inverse CDF.
+
+        Args:
+            size (Any): The number of items, an int or an array.
+            uniforms (Any): The uniform draws in [0, 1).
+
+        Returns:
+            np.ndarray: The positions, 0 being the hottest.
+        """
+        size, uniforms = np.asarray(size, dtype=np.float64), np.asarray(uniforms, dtype=np.float64)
+        if self.distribution == 'uniform':
+            positions = uniforms * size
+        elif self.distribution == 'hotspot':
+            hot = np.minimum(size, np.maximum(1, np.ceil(size * self.hot_fraction)))
+            positions = np.where(uniforms < self.hot_probability, uniforms / self.hot_probability * hot,
+                                 hot + (uniforms - self.hot_probability) / (1 - self.hot_probability) * (size - hot))
+        elif abs(self.exponent) < 1e-9:
+            positions = np.expm1(uniforms * np.log1p(size))
+        else:
+            positions = np.expm1(np.log1p(uniforms * np.expm1(self.exponent * np.log1p(size))) / self.exponent)
+        return np.minimum(positions.astype(np.int64), size.astype(np.int64) - 1)
+
+    def indexes(self, size: Any, positions: np.ndarray) -> np.ndarray:
+        """Map positions in the hotness order to item indexes.
+
+        Args:
+            size (Any): The number of items, an int or an array.
+            positions (np.ndarray): The positions, 0 being the hottest.
+
+        Returns:
+            np.ndarray: The item indexes.
+        """
+        size = np.asarray(size, dtype=np.int64)
+        if self.distribution == 'latest':
+            return size - 1 - positions
+        if self.distribution == 'uniform':
+            return positions
+        return (positions * SCATTER_MULTIPLIER + self.offset) % size
+
+    def samples(self, size: Any, count: int) -> np.ndarray:
+        """Draw many indexes at once.
+
+        Args:
+            size (Any): The number of items, an int or an array of count sizes (one per draw).
+            count (int): The number of draws.
+
+        Returns:
+            np.ndarray: The drawn indexes.
+        """
+        return self.indexes(size, self.positions(size, self.rng.random(count)))
+
+    def sample(self, size: int) -> int:
+        """Draw one index from the precomputed pool (thread-safe); the scalar twin of positions and indexes.
+
+        Args:
+            size (int): The number of items.
+
+        Returns:
+            int: The drawn index.
+        """
+        uniform = self.pool[next(self.counter) % len(self.pool)]
+        if self.distribution == 'uniform':
+            return min(int(uniform * size), size - 1)
+        if self.distribution == 'hotspot':
+            hot = min(size, max(1, math.ceil(size * self.hot_fraction)))
+            if uniform < self.hot_probability:
+                position = int(uniform / self.hot_probability * hot)
+            else:
+                position = hot + int((uniform - self.hot_probability) / (1 - self.hot_probability) * (size - hot))
+        elif abs(self.exponent) < 1e-9:
+            position = int(math.expm1(uniform * math.log1p(size)))
+        else:
+            position = int(math.expm1(math.log1p(uniform * math.expm1(self.exponent * math.log1p(size))) / self.exponent))
+        position = min(position, size - 1)
+        if self.distribution == 'latest':
+            return size - 1 - position
+        return (position * SCATTER_MULTIPLIER + self.offset) % size
+
+    def top_share(self, size: int, fraction: float) -> float:
+        """Get the share of the accesses that go to the hottest fraction of the items.
+
+        Args:
+            size (int): The number of items.
+            fraction (float): The fraction of the items, e.g. 0.01 for the hottest 1%.
+
+        Returns:
+            float: The share of the accesses, between 0 and 1.
+        """
+        return float(self.cdf(size, max(1, int(np.ceil(size * fraction)))))
+
+
+# Função para obter o amostrador de um conjunto de itens
+def access_sampler(kind: str) -> AccessSampler:
+    """Get the shared sampler of the current access distribution for a kind of item.
+
+    Args:
+        kind (str): 'stores' or 'products'; each kind gets its own hot items.
+
+    Returns:
+        AccessSampler: The sampler, created on first use and shared by every number of items.
+    """
+    sampler = access_samplers.get(kind)
+    if sampler is None or sampler.distribution != access_distribution:
+        sampler = AccessSampler(access_distribution, access_theta, seed=[GENERATOR_SEED, 0 if kind == 'stores' else 1])
+        access_samplers[kind] = sampler
+    return sampler
+
+
+# Função para configurar a distribuição de acesso
+def configure_access(distribution: str = DISTRIBUTION, theta: float = ZIPFIAN_THETA) -> None:
+    """Set the access distribution used to pick stores and products, dropping the samplers of the previous one.
+
+    Args:
+        distribution (str, optional): One of DISTRIBUTIONS. Defaults to DISTRIBUTION.
+        theta (float, optional): The zipfian skew. Defaults to ZIPFIAN_THETA.
+    """
+    global access_distribution, access_theta
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown access distribution '{distribution}', expected one of {DISTRIBUTIONS}.")
+    access_distribution = distribution
+    access_theta = theta
+    access_samplers.clear()
+
+
+# Função para escolher uma filial
+def pick_store(stores: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Pick a store with the current access distribution.
+
+    Args:
+        stores (List[Dict[str, Any]]): The stores, oldest first.
+
+    Returns:
+        Dict[str, Any]: The store picked.
+    """
+    if access_distribution == 'uniform':
+        return random.choice(stores)
+    return stores[access_sampler('stores').sample(len(stores))]
+
+
+# Função para escolher um produto de uma filial
+def pick_product(products: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Pick a product of a store with the current access distribution.
+
+    Args:
+        products (List[Dict[str, Any]]): The products of the store, oldest first.
+
+    Returns:
+        Dict[str, Any]: The product picked.
+    """
+    if access_distribution == 'uniform':
+        return random.choice(products)
+    return products[access_sampler('products').sample(len(products))]
+
+
+###################
+# Perfis de carga #
+###################
+
+# Operações da simulação e o perfil de carga padrão
+OPERATIONS = ['query_stock', 'update_inventory', 'add_store', 'add_product', 'low_stock', 'expiring_products']
+WORKLOADS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'workloads.json')
+WORKLOAD_DEFAULTS: Dict[str, Any] = {
+    'operations': {'query_stock': 0.25, 'update_inventory': 0.25, 'add_store': 0.25, 'add_product': 0.25, 'low_stock': 0.0, 'expiring_products': 0.0},
+    'distribution': DISTRIBUTION,
+    'theta': ZIPFIAN_THETA,
+    'min_products': 5,
+    'max_products': 20,
+    'new_store_products': [5, 20],
+    'description_chars': 200,
+}
+
+operation_weights = np.cumsum([WORKLOAD_DEFAULTS['operations'][operation] for operation in OPERATIONS]).tolist()
+new_store_products = tuple(WORKLOAD_DEFAULTS['new_store_products'])
+description_chars = WORKLOAD_DEFAULTS['description_chars']
+
+
+# Função para carregar os perfis de carga
+def load_workloads(path: str = WORKLOADS_FILE) -> Dict[str, Dict[str, Any]]:
+    """Load the named workload profiles from a JSON file, filling the settings a profile leaves out with WORKLOAD_DEFAULTS.
+
+    Args:
+        path (str, optional): The JSON file, mapping each profile name to its settings. Defaults to WORKLOADS_FILE.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: The profiles, by name.
+    """
+    with open(path) as file:
+        profiles = json.load(file)
+    workloads = {}
+    for name, profile in profiles.items():
+        unknown = set(profile.get('operations', {})) - set(OPERATIONS)
+        if unknown:
+            raise ValueError(f"Workload '{name}' has unknown operations {sorted(unknown)}, expected {OPERATIONS}.")
+        if profile.get('distribution', DISTRIBUTION) not in DISTRIBUTIONS:
+            raise ValueError(f"Workload '{name}' has unknown distribution '{profile['distribution']}', expected one of {DISTRIBUTIONS}.")
+        workloads[name] = {**WORKLOAD_DEFAULTS, **profile, 'operations': {**dict.fromkeys(OPERATIONS, 0.0), **profile.get('operations', WORKLOAD_DEFAULTS['operations'])}}
+    return workloads
+
+
+# Função para aplicar um perfil de carga
+def apply_workload(profile: Dict[str, Any]) -> None:
+    """Set the operation mix, the access distribution and the value sizes of a workload profile.
+
+    Args:
+        profile (Dict[str, Any]): The profile, as returned by load_workloads.
+    """
+    global operation_weights, new_store_products, description_chars
+    weights = [profile['operations'][operation] for operation in OPERATIONS]
+    if sum(weights) <= 0:
+        raise ValueError("A workload needs at least one operation with a positive weight.")
+    operation_weights = np.cumsum(weights).tolist()
+    new_store_products = tuple(profile['new_store_products'])
+    description_chars = profile['description_chars']
+    configure_access(profile['distribution'], profile['theta'])
+
+
+# Função para escolher a próxima operação
+def pick_operation() -> str:
+    """Pick an operation with the weights of the current workload.
+
+    Returns:
+        str: The operation name.
+    """
+    return random.choices(OPERATIONS, cum_weights=operation_weights)[0]
+
+
+#####################
+# Inserção de dados #
+#####################
+
+# Layout de armazenamento dos produtos: 'normalized' (coleção products) ou 'embedded' (dentro da filial)
+STORAGE_LAYOUTS = ['normalized', 'embedded']
+STORAGE_LAYOUT = 'normalized'
+storage_layout = STORAGE_LAYOUT
+
+
+# Dividir uma lista em blocos
+def chunked(items: List[Any], size: int) -> Iterator[List[Any]]:
+    """Split a list into consecutive chunks.
+
+    Args:
+        items (List[Any]): The items to split.
+        size (int): The maximum number of items in each chunk.
+
+    Yields:
+        Iterator[List[Any]]: The chunks, in order.
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+# Separar os produtos embutidos de uma filial
+def split_store(store: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Split a generated store into a compact store document and its product rows.
+
+    Args:
+        store (Dict[str, Any]): A store with its embedded products.
+
+    Returns:
+        Tuple[Dict[str, Any], List[Dict[str, Any]]]: The store with only a product-id summary, and the products tagged with the store_id and region.
+    """
+    summary = {key: value for key, value in store.items() if key != 'products'}
+    summary['product_ids'] = [product['product_id'] for product in store['products']]
+    summary['product_count'] = len(store['products'])
+    products = [{**product, 'store_id': store['store_id'], 'region': store.get('region')} for product in store['products']]
+    return summary, products
+
+
+# Inserir dados de filiais no MongoDB
+def insert_stores(num_stores: int, min_products: int, max_products: int, batch_size: int = BATCH_SIZE) -> List[Dict[str, Any]]:
+    """Insert fake store data into the MongoDB, following the current storage layout.
+
+    Args:
+        num_stores (int): The number of stores to generate and insert.
+        min_products (int): The minimum number of products in a store.
+        max_products (int): The maximum number of products in a store.
+        batch_size (int, optional): The number of products sent in each round trip. Defaults to BATCH_SIZE.
+
+    Returns:
+        List[Dict[str, Any]]: A list of dictionaries representing the stores inserted, with their products.
+    """
+    stores = generate_stores(num_stores, min_products, max_products)
+    if storage_layout == 'embedded':
+        stores_collection.insert_many(stores)
+        advance_seed_progress(len(stores) + sum(len(store['products']) for store in stores))
+        return stores
+
+    summaries, products = [], []
+    for store in stores:
+        summary, store_products = split_store(store)
+        summaries.append(summary)
+        products.extend(store_products)
+    stores_collection.insert_many(summaries)
+    advance_seed_progress(len(summaries))
+    for chunk in chunked(products, batch_size):
+        products_collection.insert_many(chunk, ordered=False)
+        advance_seed_progress(len(chunk))
+    return stores
+
+
+# Obter a coleção que guarda o estoque conforme o layout
+def stock_collection() -> Any:
+    """Get the collection holding the stock quantities in the current storage layout.
+
+    Returns:
+        Any: The stores collection with the 'embedded' layout, the products collection otherwise.
+    """
+    return stores_collection if storage_layout == 'embedded' else products_collection
+
+
+# Montar a atualização de estoque conforme o layout
+def stock_update(store_id: str, product_id: str, quantity: int) -> Tuple[Any, Dict[str, Any], Dict[str, Any]]:
+    """Build the stock update of a product for the current storage layout.
+
+    Args:
+        store_id (str): The ID of the store.
+        product_id (str): The ID of the product.
+        quantity (int): The quantity to update the stock by.
+
+    Returns:
+        Tuple[Any, Dict[str, Any], Dict[str, Any]]: The collection, the filter and the update to apply.
+    """
+    if storage_layout == 'embedded':
+        return (stock_collection(),
+                {'store_id': store_id, 'products.product_id': product_id},
+                {'$inc': {'products.$.stock_quantity': quantity}})
+    return (stock_collection(),
+            {'product_id': product_id, 'store_id': store_id},
+            {'$inc': {'stock_quantity': quantity}})
+
+
+# Ler o estoque atual de vários produtos
+def stock_levels(keys: Iterable[Tuple[str, str]], batch_size: int = BATCH_SIZE) -> Dict[Tuple[str, str], int]:
+    """Read the stock quantities of several products, a chunk of stores per round trip.
+
+    Args:
+        keys (Iterable[Tuple[str, str]]): The (store ID, product ID) pairs.
+        batch_size (int, optional): The number of stores read in each round trip. Defaults to BATCH_SIZE.
+
+    Returns:
+        Dict[Tuple[str, str], int]: The stock of each pair found; missing products are left out.
+    """
+    wanted: Dict[str, set] = defaultdict(set)
+    for store_id, product_id in keys:
+        wanted[store_id].add(product_id)
+    levels: Dict[Tuple[str, str], int] = {}
+    for store_ids in chunked(list(wanted), batch_size):
+        if storage_layout == 'embedded':
+            stores = stores_collection.find({'store_id': {'$in': store_ids}},
+                                            {'store_id': 1, 'products.product_id': 1, 'products.stock_quantity': 1})
+            rows = ({**product, 'store_id': store['store_id']} for store in stores for product in store.get('products', []))
+        else:
+            product_ids = list(set().union(*(wanted[store_id] for store_id in store_ids)))
+            rows = products_collection.find({'store_id': {'$in': store_ids}, 'product_id': {'$in': product_ids}},
+                                            {'store_id': 1, 'product_id': 1, 'stock_quantity': 1})
+        for row in rows:
+            if row['product_id'] in wanted[row['store_id']]:
+                levels[(row['store_id'], row['product_id'])] = row['stock_quantity']
+    return levels
+
+
+# Inserir dados de vendas no MongoDB
+def insert_sales(num_sales: int, stores: List[Dict[str, Any]], batch_size: int = BATCH_SIZE) -> int:
+    """Insert fake sales data into the MongoDB.
+
+    Sales that the stock cannot cover are rejected one by one: the stock of the products sold is read first, and the
+    sales are accepted in generation order while the remaining stock covers them; the others are dropped and logged.
+    The decrements of the accepted sales of the same product are then merged in memory and sent, like the sales, in
+    chunks. Each merged decrement stays guarded like a reservation, so when a concurrent writer takes the stock in
+    between it is skipped whole instead of driving the stock negative; those skipped decrements are counted from the
+    bulk write results and logged. The sales are stamped with a batch ID, recorded in SALES_BATCH_COLLECTION once they
+    are all stored (see refresh_rollup). With the 'write' rollup mode, the daily totals of the rollup collection are
+    updated as well.
+
+    Args:
+        num_sales (int): The number of sales to generate.
+        stores (List[Dict[str, Any]]): A list of stores to associate sales with.
+        batch_size (int, optional): The number of operations sent in each round trip. Defaults to BATCH_SIZE.
+
+    Returns:
+        int: The number of sales inserted.
+    """
+    generated = generate_sales(num_sales, stores)
+    batch = ObjectId()
+    remaining = stock_levels({(sale['store_id'], sale['product_id']) for sale in generated}, batch_size)
+    sales = []
+    stock_decrements: Dict[Tuple[str, str], int] = defaultdict(int)
+    for sale in generated:
+        key = (sale['store_id'], sale['product_id'])
+        if remaining.get(key, 0) >= sale['quantity_sold']:
+            remaining[key] -= sale['quantity_sold']
+            stock_decrements[key] += sale['quantity_sold']
+            sales.append({**sale, 'batch': batch})
+    if len(sales) < len(generated):
+        logging.warning(f"Rejected {len(generated) - len(sales)} of {len(generated)} seeded sales for lack of stock.")
+    advance_seed_progress(len(generated) - len(sales))
+
+    # Atualizar estoque dos produtos vendidos
+    collection = stock_collection()
+    updates = []
+    for (store_id, product_id), quantity in stock_decrements.items():
+        _, query, update = stock_reservation(store_id, product_id, quantity)
+        updates.append(UpdateOne(query, update))
+    applied = sum(collection.bulk_write(chunk, ordered=False).matched_count for chunk in chunked(updates, batch_size))
+    if applied < len(updates):
+        logging.warning(f"Skipped {len(updates) - applied} of {len(updates)} seeded stock decrements for lack of stock.")
+    for chunk in chunked(sales, batch_size):
+        sales_collection.insert_many(chunk, ordered=False)
+        advance_seed_progress(len(chunk))
+    if sales:
+        db[SALES_BATCH_COLLECTION].insert_one({'_id': batch, 'sales': len(sales), 'folded': False})
+    if rollup_mode == 'write':
+        update_rollup(sales, batch_size)
+    if stock_cache is not None:
+        for store_id in {store_id for store_id, _ in stock_decrements}:
+            stock_cache.invalidate(store_id)
+    return len(sales)
+
+
+# Preparar a conexão de cada processo de carga
+def init_seed_worker(host: str, port: int, db_name: str, username: str, password: str, layout: str, profile: Dict[str, Any],
+                     seed: int, namespace: str, progress: Any) -> None:
+    """Open a MongoClient owned by the seeding process, bind its collections, apply the workload profile of the parent
+    and build the process's generator, reused by all its shards.
+
+    Args:
+        host (str): The MongoDB host.
+        port (int): The MongoDB port.
+        db_name (str): The name of the database.
+        username (str): The username for authentication.
+        password (str): The password for authentication.
+        layout (str): The storage layout to write with.
+        profile (Dict[str, Any]): The workload profile (value sizes and access distribution) to generate with.
+        seed (int): The generator seed.
+        namespace (str): The generator ID namespace.
+        progress (Any): The shared counter of inserted records, read by the parent for its progress bar.
+    """
+    global storage_layout, generator_mode, bulk_generator, seed_progress
+    client = pymongo.MongoClient(f'mongodb://{username}:{password}@{host}', port)
+    bind_collections(client[db_name])
+    storage_layout = layout
+    generator_mode = 'vectorized'
+    apply_workload(profile)
+    bulk_generator = VectorizedGenerator(seed, namespace=namespace)
+    seed_progress = progress
+
+
+# Função para contar os registros inseridos na carga paralela
+def advance_seed_progress(count: int) -> None:
+    """Add inserted records to the shared progress counter, when running in a seeding process.
+
+    Args:
+        count (int): The number of records inserted.
+    """
+    if seed_progress is not None:
+        with seed_progress.get_lock():
+            seed_progress.value += count
+
+
+# Carregar um fragmento de filiais, produtos e vendas
+def seed_shard(shard: int, num_stores: int, min_products: int, max_products: int, num_sales: int, batch_size: int) -> Tuple[int, List[Dict[str, Any]]]:
+    """Generate and insert one shard of stores, products and sales in a seeding process, with the process's generator.
+
+    Args:
+        shard (int): The shard number, which keeps the generated IDs unique across processes.
+        num_stores (int): The number of stores of the shard.
+        min_products (int): The minimum number of products in a store.
+        max_products (int): The maximum number of products in a store.
+        num_sales (int): The number of sales of the shard.
+        batch_size (int): The number of documents sent in each round trip.
+
+    Returns:
+        Tuple[int, List[Dict[str, Any]]]: The number of records inserted, and the stores with only their product IDs.
+    """
+    bulk_generator.start_shard(shard)
+    stores = insert_stores(num_stores, min_products, max_products, batch_size)
+    if num_sales:
+        insert_sales(num_sales, stores, batch_size)
+    num_records = len(stores) + sum(len(store['products']) for store in stores) + num_sales
+    compact_stores = [
+        {'store_id': store['store_id'], 'region': store['region'], 'products': [{'product_id': product['product_id']} for product in store['products']]}
+        for store in stores
+    ]
+    return num_records, compact_stores
+
+
+# Carregar os dados em paralelo, com um processo e um MongoClient por worker
+def parallel_seed(num_stores: int, min_products: int, max_products: int, num_sales: int, num_workers: int,
+                  stores_per_shard: int = SEED_STORES_PER_SHARD, seed: int = GENERATOR_SEED, namespace: str = '',
+                  batch_size: int = BATCH_SIZE, profile: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    """Seed stores, products and sales in parallel processes, each with its own MongoClient.
+
+    Args:
+        num_stores (int): The total number of stores.
+        min_products (int): The minimum number of products in a store.
+        max_products (int): The maximum number of products in a store.
+        num_sales (int): The total number of sales.
+        num_workers (int): The number of seeding processes.
+        stores_per_shard (int, optional): The number of stores generated by each task. Defaults to SEED_STORES_PER_SHARD.
+        seed (int, optional): The generator seed. Defaults to GENERATOR_SEED.
+        namespace (str, optional): The generator ID namespace. Defaults to ''.
+        batch_size (int, optional): The number of documents sent in each round trip. Defaults to BATCH_SIZE.
+        profile (Dict[str, Any], optional): The workload profile applied in the processes. Defaults to None (WORKLOAD_DEFAULTS).
+
+    Returns:
+        List[Dict[str, Any]]: The stores inserted, with only their product IDs.
+    """
+    num_shards = max(1, -(-num_stores // stores_per_shard))
+    shard_stores = [num_stores // num_shards + (1 if shard < num_stores % num_shards else 0) for shard in range(num_shards)]
+    shard_sales = [num_sales // num_shards + (1 if shard < num_sales % num_shards else 0) for shard in range(num_shards)]
+    expected_records = num_stores * (1 + (min_products + max_products) / 2) + num_sales
+
+    stores: List[Dict[str, Any]] = []
+    context = multiprocessing.get_context('spawn')
+    inserted = context.Value('q', 0)
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context, initializer=init_seed_worker,
+                             initargs=(MONGO_HOST, MONGO_PORT, DB_NAME, USER, PASS, storage_layout, profile or WORKLOAD_DEFAULTS,
+                                       seed, namespace, inserted)) as executor:
+        pending = {
+            executor.submit(seed_shard, shard, shard_stores[shard], min_products, max_products, shard_sales[shard], batch_size)
+            for shard in range(num_shards) if shard_stores[shard]
+        }
+        with tqdm(total=int(expected_records), desc="Seeding Progress") as progress:
+            while pending:
+                done, pending = wait(pending, timeout=SEED_PROGRESS_INTERVAL)
+                for future in done:
+                    stores.extend(future.result()[1])
+                progress.update(inserted.value - progress.n)
+    logging.info(f"Seeded {len(stores)} stores and {num_sales} sales with {num_workers} processes in {num_shards} shards.")
+    return stores
+
+
+#####################
+# Análise de vendas #
+#####################
+
+# Configurar as consultas analíticas e o resumo diário de vendas
+ROLLUP_COLLECTION = 'sales_daily'
+SALES_BATCH_COLLECTION = 'sales_batches'
+ROLLUP_MODES = ['none', 'write', 'merge']
+ROLLUP_MODE = 'none'
+DAY_FORMAT = '%Y-%m-%d'
+ANALYTICS_TOP_N = 10
+ANALYTICS_VOLUMES = [10_000, 100_000, 1_000_000]
+ANALYTICS_CHUNK_SIZE = 50_000
+
+rollup_mode = ROLLUP_MODE
+
+
+# Função para atualizar o resumo diário na escrita das vendas
+def update_rollup(sales: List[Dict[str, Any]], batch_size: int = BATCH_SIZE) -> None:
+    """Add sales to the daily per-store/product totals of the rollup collection, merging the sales of the same day first.
+
+    Args:
+        sales (List[Dict[str, Any]]): The sales just inserted.
+        batch_size (int, optional): The number of upserts sent in each round trip. Defaults to BATCH_SIZE.
+    """
+    totals: Dict[Tuple[str, str, str], List[float]] = defaultdict(lambda: [0, 0.0, 0])
+    for sale in sales:
+        total = totals[(sale['store_id'], sale['product_id'], sale['sale_date'].strftime(DAY_FORMAT))]
+        total[0] += sale['quantity_sold']
+        total[1] += sale['total_amount']
+        total[2] += 1
+    updates = [UpdateOne({'store_id': store_id, 'day': day, 'product_id': product_id},
+                         {'$inc': {'quantity': quantity, 'revenue': revenue, 'sales': count}}, upsert=True)
+               for (store_id, product_id, day), (quantity, revenue, count) in totals.items()]
+    for chunk in chunked(updates, batch_size):
+        rollup_collection.bulk_write(chunk, ordered=False)
+
+
+# Função para montar o pipeline que recalcula o resumo diário
+def rollup_pipeline(batches: List[Any] = None) -> List[Dict[str, Any]]:
+    """Build the pipeline that totals the sales per store, product and day and writes them with $merge.
+
+    Without batches the totals of every sale replace the stored ones; with batches only the sales of those insert_sales
+    batches are totalled, and their totals are added to the stored ones.
+
+    Args:
+        batches (List[Any], optional): The IDs of the batches to total. Defaults to None (a full rebuild).
+
+    Returns:
+        List[Dict[str, Any]]: The pipeline.
+    """
+    incremental = batches is not None
+    when_matched = [{'$set': {field: {'$add': [f'${field}', f'$$new.{field}']} for field in ['quantity', 'revenue', 'sales']}}]
+    return [
+        *([{'$match': {'batch': {'$in': batches}}}] if incremental else []),
+        {'$group': {
+            '_id': {'store_id': '$store_id', 'product_id': '$product_id', 'day': {'$dateToString': {'format': DAY_FORMAT, 'date': '$sale_date'}}},
+            'quantity': {'$sum': '$quantity_sold'},
+            'revenue': {'$sum': '$total_amount'},
+            'sales': {'$sum': 1},
+        }},
+        {'$project': {'_id': 0, 'store_id': '$_id.store_id', 'day': '$_id.day', 'product_id': '$_id.product_id', 'quantity': 1, 'revenue': 1, 'sales': 1}},
+        {'$merge': {'into': ROLLUP_COLLECTION, 'on': ['store_id', 'day', 'product_id'], 'whenMatched': when_matched if incremental else 'replace',
+                    'whenNotMatched': 'insert'}},
+    ]
+
+
+# Função para atualizar o resumo diário com $merge
+def refresh_rollup(full: bool = False) -> float:
+    """Fold the sales stored since the last refresh into the rollup collection, or rebuild it from all the sales.
+
+    Each insert_sales call stamps its sales with a batch ID and records the batch in SALES_BATCH_COLLECTION once all its
+    sales are stored, so the refresh folds in the recorded batches not folded yet and marks them. Unlike a watermark on
+    the sale _ids (ObjectIds are not ordered across clients, e.g. the parallel_seed workers), this never skips sales
+    stored by a concurrent writer: their batch is picked up by the next refresh. Before any batch was folded the refresh
+    is a full rebuild; sales inserted outside insert_sales (the transactional reservations) only reach the rollup through
+    a full rebuild. The refresh assumes it is the only writer of the rollup since the previous one, and a full rebuild
+    assumes no insert_sales runs meanwhile; after the rollup was kept at write time ('write' mode), rebuild it with
+    full=True.
+
+    Args:
+        full (bool, optional): Whether to rebuild the rollup from all the sales. Defaults to False.
+
+    Returns:
+        float: The execution time, in seconds.
+    """
+    start_time = time.perf_counter()
+    batches = db[SALES_BATCH_COLLECTION]
+    pending = [batch['_id'] for batch in batches.find({'folded': False}, {'_id': 1})]
+    if full or batches.find_one({'folded': True}, {'_id': 1}) is None:
+        list(sales_collection.aggregate(rollup_pipeline(), allowDiskUse=True))
+    elif pending:
+        list(sales_collection.aggregate(rollup_pipeline(pending), allowDiskUse=True))
+    if pending:
+        batches.bulk_write([UpdateOne({'_id': batch}, {'$set': {'folded': True}}) for batch in pending], ordered=False)
+    return time.perf_counter() - start_time
+
+
+# Função para montar os pipelines analíticos
+def analytics_pipelines(source: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Build the analytics reports over the raw sales or over the rollup collection.
+
+    The payment method report needs the raw sales, and the stock turnover report joins the products collection, so it
+    is only built for the normalized layout.
+
+    Args:
+        source (str): 'raw' or 'rollup'.
+
+    Returns:
+        Dict[str, List[Dict[str, Any]]]: The pipeline of each report.
+    """
+    raw = source == 'raw'
+    quantity, revenue, count = ('$quantity_sold', '$total_amount', 1) if raw else ('$quantity', '$revenue', '$sales')
+    day = {'$dateToString': {'format': DAY_FORMAT, 'date': '$sale_date'}} if raw else '$day'
+    pipelines = {
+        'revenue_by_store': [
+            {'$group': {'_id': '$store_id', 'revenue': {'$sum': revenue}, 'sales': {'$sum': count}}},
+            {'$sort': {'revenue': -1}},
+        ],
+        'top_products': [
+            {'$group': {'_id': '$product_id', 'units': {'$sum': quantity}, 'revenue': {'$sum': revenue}}},
+            {'$sort': {'units': -1}},
+            {'$limit': ANALYTICS_TOP_N},
+        ],
+        'daily_revenue': [
+            {'$group': {'_id': {'store_id': '$store_id', 'day': day}, 'revenue': {'$sum': revenue}, 'sales': {'$sum': count}}},
+            {'$sort': {'_id.day': 1, '_id.store_id': 1}},
+        ],
+    }
+    if raw:
+        pipelines['revenue_by_payment_method'] = [
+            {'$group': {'_id': '$payment_method', 'revenue': {'$sum': '$total_amount'}, 'sales': {'$sum': 1}, 'average_ticket': {'$avg': '$total_amount'}}},
+            {'$sort': {'revenue': -1}},
+        ]
+    if storage_layout == 'normalized':
+        pipelines['stock_turnover'] = [
+            {'$group': {'_id': {'store_id': '$store_id', 'product_id': '$product_id'}, 'units': {'$sum': quantity}}},
+            {'$lookup': {'from': 'products', 'localField': '_id.product_id', 'foreignField': 'product_id', 'as': 'product'}},
+            {'$unwind': '$product'},
+            {'$project': {'_id': 0, 'store_id': '$_id.store_id', 'product_id': '$_id.product_id', 'units': 1, 'stock': '$product.stock_quantity',
+                          'turnover': {'$divide': ['$units', {'$max': ['$product.stock_quantity', 1]}]}}},
+            {'$sort': {'turnover': -1}},
+            {'$limit': ANALYTICS_TOP_N},
+        ]
+    return pipelines
+
+
+# Função para executar um relatório analítico
+def run_analytics(name: str, source: str = 'raw') -> Tuple[List[Dict[str, Any]], float]:
+    """Run an analytics report.
+
+    Args:
+        name (str): The report, a key of analytics_pipelines.
+        source (str, optional): 'raw' or 'rollup'. Defaults to 'raw'.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], float]: The report rows and the execution time, in seconds.
+    """
+    pipelines = analytics_pipelines(source)
+    if name not in pipelines:
+        raise ValueError(f"Unknown {source} report '{name}', expected one of {list(pipelines)}.")
+    collection = sales_collection if source == 'raw' else rollup_collection
+    start_time = time.perf_counter()
+    rows = list(collection.aggregate(pipelines[name], allowDiskUse=True))
+    return rows, time.perf_counter() - start_time
+
+
+# Medir os relatórios sobre as vendas brutas e sobre o resumo diário
+def measure_analytics(volumes: List[int] = ANALYTICS_VOLUMES, rollup: str = 'write', repeats: int = 3, num_stores: int = 20, min_products: int = 5, max_products: int = 20, batch_size: int = BATCH_SIZE, chart_width: int = 600) -> pd.DataFrame:
+    """Grow the sales collection through each volume and time every analytics report on the raw sales and on the rollup.
+
+    The rollup is first rebuilt with $merge so that it covers the sales already stored, then kept up to date at write
+    time ('write') or refreshed with $merge at each volume from the sales added since the previous refresh ('merge').
+    Sales are generated with the vectorized generator. The results are saved to executions/<timestamp>_analytics/.
+
+    Args:
+        volumes (List[int], optional): The sales volumes to measure at. Defaults to ANALYTICS_VOLUMES.
+        rollup (str, optional): How the rollup is maintained, 'write' or 'merge'. Defaults to 'write'.
+        repeats (int, optional): The executions of each report; the median is kept. Defaults to 3.
+        num_stores (int, optional): The number of stores the sales are spread over. Defaults to 20.
+        min_products (int, optional): The minimum number of products in a store. Defaults to 5.
+        max_products (int, optional): The maximum number of products in a store. Defaults to 20.
+        batch_size (int, optional): The number of documents sent in each round trip. Defaults to BATCH_SIZE.
+        chart_width (int, optional): The chart width, in pixels. Defaults to 600.
+
+    Returns:
+        pd.DataFrame: One row per volume, report and source.
+    """
+    global rollup_mode, generator_mode
+    if rollup not in ROLLUP_MODES[1:]:
+        raise ValueError(f"Unknown rollup mode '{rollup}', expected one of {ROLLUP_MODES[1:]}.")
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_folder = os.path.join("executions", f"{timestamp}_analytics")
+    os.makedirs(output_folder, exist_ok=True)
+
+    create_indexes(db, {ROLLUP_COLLECTION: INDEXES[ROLLUP_COLLECTION]})
+    stores = insert_stores(num_stores, min_products, max_products)
+    logging.info(f"Analytics - Rollup rebuilt from the stored sales in {refresh_rollup(full=True) * 1000:.2f} ms")
+    previous_rollup_mode, previous_generator_mode = rollup_mode, generator_mode
+    rollup_mode, generator_mode = ('write' if rollup == 'write' else 'none'), 'vectorized'
+    rows, ingest_rows = [], []
+    try:
+        volume = sales_collection.count_documents({})
+        for target in sorted(volumes):
+            added = max(0, target - volume)
+            start_time = time.perf_counter()
+            for offset in range(0, added, ANALYTICS_CHUNK_SIZE):
+                insert_sales(min(ANALYTICS_CHUNK_SIZE, added - offset), stores, batch_size)
+            insert_ms = (time.perf_counter() - start_time) * 1000
+            refresh_ms = refresh_rollup() * 1000 if rollup == 'merge' else 0.0
+            volume += added
+            rollup_documents = rollup_collection.count_documents({})
+            ingest_rows.append({'volume': volume, 'added': added, 'insert_ms': insert_ms, 'ms_per_1k_sales': insert_ms / added * 1000 if added else 0.0,
+                                'refresh_ms': refresh_ms, 'rollup_documents': rollup_documents})
+            logging.info(f"Analytics - {volume} sales ({rollup_documents} rollup documents): {added} inserted in {insert_ms:.2f} ms"
+                         + (f", rollup refreshed in {refresh_ms:.2f} ms" if rollup == 'merge' else ''))
+
+            for source in ['raw', 'rollup']:
+                for name in analytics_pipelines(source):
+                    times = [run_analytics(name, source)[1] * 1000 for _ in range(repeats)]
+                    rows.append({'volume': volume, 'report': name, 'source': source, 'documents_read': volume if source == 'raw' else rollup_documents,
+                                 'median_ms': float(np.median(times)), 'min_ms': min(times), 'max_ms': max(times)})
+                    logging.info(f"Analytics - {volume} sales, {name} ({source}): median {rows[-1]['median_ms']:.2f} ms")
+            raw_revenue = sum(row['revenue'] for row in run_analytics('revenue_by_store', 'raw')[0])
+            rollup_revenue = sum(row['revenue'] for row in run_analytics('revenue_by_store', 'rollup')[0])
+            if not np.isclose(raw_revenue, rollup_revenue):
+                logging.warning(f"Analytics - Rollup revenue {rollup_revenue:.2f} differs from the raw revenue {raw_revenue:.2f}")
+    finally:
+        rollup_mode, generator_mode = previous_rollup_mode, previous_generator_mode
+
+    df = pd.DataFrame(rows)
+    df.to_csv(os.path.join(output_folder, 'analytics.csv'), index=False)
+    pd.DataFrame(ingest_rows).to_csv(os.path.join(output_folder, 'analytics_ingest.csv'), index=False)
+
+    plt.figure(figsize=(chart_width / 100, 6))
+    for (name, report), color in zip(df.groupby('report', sort=False), itertools.cycle(plt.rcParams['axes.prop_cycle'].by_key()['color'])):
+        for source, style in [('raw', '-'), ('rollup', '--')]:
+            series = report[report['source'] == source]
+            if len(series):
+                plt.plot(series['volume'], series['median_ms'], style, marker='o', color=color, label=f'{name} ({source})')
+    plt.xscale('log')
+    plt.yscale('log')
+    plt.title(f'Analytics Reports: Raw Sales vs Daily Rollup ({rollup})')
+    plt.xlabel('Sales')
+    plt.ylabel('Median time (ms)')
+    plt.legend(fontsize='small')
+    plt.savefig(os.path.join(output_folder, 'analytics.png'))
+    plt.close()
+    return df
+
+
+#####################
+# Cache de estoque #
+#####################
+
+# Configurar o cache de estoque
+CACHE_MAX_ENTRIES = 1000
+CACHE_TTL_SECONDS = 30.0
+CACHE_MAX_BYTES = 64 * 1024 ** 2
+
+stock_cache = None
+
+
+# Cache de leitura do estoque por filial
+class StockCache:
+    """In-process read-through cache of query_stock results, keyed by store_id.
+
+    Entries are evicted by LRU order, by TTL and by a memory budget (the BSON size of the cached products).
+    The cache keeps its own copies of the products, so callers may mutate what put() and get() hand over.
+    Writes patch the cached entry in place and re-measure its size; a version per store keeps a read that raced
+    with a write from filling the cache with stale products.
+
+    Args:
+        max_entries (int, optional): The maximum number of cached stores. Defaults to CACHE_MAX_ENTRIES.
+        ttl_seconds (float, optional): How long an entry is served. Defaults to CACHE_TTL_SECONDS.
+        max_bytes (int, optional): The memory budget of the cached products. Defaults to CACHE_MAX_BYTES.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: float = CACHE_TTL_SECONDS, max_bytes: int = CACHE_MAX_BYTES) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries: 'OrderedDict[str, List[Any]]' = OrderedDict()  # [expires, products, products by ID, size]
+        self.versions: Dict[str, int] = defaultdict(int)
+        self.total_bytes = 0
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Reset the hit, miss and eviction counters."""
+        with self.lock:
+            self.counters = dict.fromkeys(['hits', 'misses', 'evictions', 'expirations', 'invalidations', 'patches'], 0)
+
+    def stats(self) -> Dict[str, float]:
+        """Get the cache counters.
+
+        Returns:
+            Dict[str, float]: The counters, the hit ratio, and the number and size of the cached entries.
+        """
+        with self.lock:
+            lookups = self.counters['hits'] + self.counters['misses']
+            return {
+                **self.counters,
+                'hit_ratio': self.counters['hits'] / lookups if lookups else 0.0,
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+            }
+
+    def _remove(self, store_id: str) -> None:
+        """Remove an entry; the lock must be held."""
+        _, _, _, size = self.entries.pop(store_id)
+        self.total_bytes -= size
+
+    def _resize(self, entry: List[Any], delta: int) -> None:
+        """Grow an entry by delta bytes and evict the least recently used entries past the budget; the lock must be held."""
+        entry[3] += delta
+        self.total_bytes += delta
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.counters['evictions'] += 1
+
+    def get(self, store_id: str) -> Any:
+        """Get the cached products of a store.
+
+        Args:
+            store_id (str): The ID of the store.
+
+        Returns:
+            Any: A copy of the cached products, or None on a miss.
+        """
+        with self.lock:
+            entry = self.entries.get(store_id)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(store_id)
+                self.counters['expirations'] += 1
+                entry = None
+            if entry is None:
+                self.counters['misses'] += 1
+                return None
+            self.entries.move_to_end(store_id)
+            self.counters['hits'] += 1
+            return [dict(product) for product in entry[1]]
+
+    def version(self, store_id: str) -> int:
+        """Get the write version of a store, to be passed to put() after reading the database.
+
+        Args:
+            store_id (str): The ID of the store.
+
+        Returns:
+            int: The current version.
+        """
+        with self.lock:
+            return self.versions[store_id]
+
+    def put(self, store_id: str, products: List[Dict[str, Any]], version: int) -> None:
+        """Cache the products read from the database, unless the store was written since the read started.
+
+        Args:
+            store_id (str): The ID of the store.
+            products (List[Dict[str, Any]]): The products read.
+            version (int): The version returned by version() before the read.
+        """
+        size = len(bson.encode({'products': products}))
+        products = [dict(product) for product in products]
+        with self.lock:
+            if self.versions[store_id] != version or size > self.max_bytes:
+                return
+            if store_id in self.entries:
+                self._remove(store_id)
+            entry = self.entries[store_id] = [time.monotonic() + self.ttl_seconds, products, {product['product_id']: product for product in products}, 0]
+            self._resize(entry, size)
+
+    def invalidate(self, store_id: str) -> None:
+        """Drop the cached products of a store.
+
+        Args:
+            store_id (str): The ID of the store.
+        """
+        with self.lock:
+            self.versions[store_id] += 1
+            if store_id in self.entries:
+                self._remove(store_id)
+                self.counters['invalidations'] += 1
+
+    def patch_stock(self, store_id: str, product_id: str, quantity: int) -> None:
+        """Apply a stock update to the cached product, or drop the entry when the product is not cached.
+
+        Args:
+            store_id (str): The ID of the store.
+            product_id (str): The ID of the product.
+            quantity (int): The quantity the stock was updated by.
+        """
+        with self.lock:
+            self.versions[store_id] += 1
+            entry = self.entries.get(store_id)
+            if entry is None:
+                return
+            product = entry[2].get(product_id)
+            if product is None:
+                self._remove(store_id)
+                self.counters['invalidations'] += 1
+                return
+            size = len(bson.encode(product))
+            product['stock_quantity'] = product.get('stock_quantity', 0) + quantity
+            self.counters['patches'] += 1
+            self._resize(entry, len(bson.encode(product)) - size)
+
+    def add_product(self, store_id: str, product: Dict[str, Any]) -> None:
+        """Append a new product to the cached products of a store.
+
+        Args:
+            store_id (str): The ID of the store.
+            product (Dict[str, Any]): The product added.
+        """
+        product = dict(product)
+        size = len(bson.encode({'products': [product]})) - len(bson.encode({'products': []}))
+        with self.lock:
+            self.versions[store_id] += 1
+            entry = self.entries.get(store_id)
+            if entry is None:
+                return
+            entry[1].append(product)
+            entry[2][product['product_id']] = product
+            self.counters['patches'] += 1
+            self._resize(entry, size)
+
+
+# Função para registrar as estatísticas do cache
+def log_cache_stats(prefix: str) -> None:
+    """Log the stock cache counters, when the cache is enabled.
+
+    Args:
+        prefix (str): The prefix of the log line (e.g. 'Run 1').
+    """
+    if stock_cache is None:
+        return
+    stats = stock_cache.stats()
+    logging.info(f"{prefix} - Stock cache: hits {stats['hits']}, misses {stats['misses']} (hit ratio {stats['hit_ratio']:.2%}), "
+                 f"evictions {stats['evictions']}, expirations {stats['expirations']}, invalidations {stats['invalidations']}, "
+                 f"patches {stats['patches']}, {stats['entries']} entries / {stats['bytes'] / 1024:.2f} KB")
+
+
+######################
+# Réplica de estoque #
+######################
+
+# Configurar a réplica de estoque alimentada pelo change stream
+STOCK_VIEW_MODES = ['off', 'eventual', 'read_your_writes']
+STOCK_VIEW_CHECKPOINT_EVENTS = 500
+STOCK_VIEW_MAX_AWAIT_MS = 50
+STOCK_VIEW_RYW_TIMEOUT_MS = 100.0
+STOCK_VIEW_CHECKPOINT_FILE = 'stock_view_checkpoint.json'
+
+stock_view = None
+
+
+# Réplica local do estoque por filial
+class StockView:
+    """Per-store materialized view of the products, kept up to date by a change stream on the products collection and
+    served to query_stock in place of the primary.
+
+    The stream is opened before the snapshot is read, so no write is missed; the events replayed over the snapshot are
+    idempotent, as updates carry the new field values. The resume token is checkpointed every `checkpoint_events`
+    events, and when the stream fails the consumer reopens it after the last checkpoint and skips the events up to the
+    last one it applied, so they are neither applied nor counted twice. The replication lag of each event is the time
+    from its wallTime to its application.
+
+    Product documents and the per-store dicts are replaced, never changed in place, once the view is loaded, so a read
+    takes a reference to its store under the condition and projects the products outside it.
+
+    Writes fenced with view_fence() record their operation time per store. In 'read_your_writes' mode a read of a store
+    waits for the view to apply its last write, up to `ryw_timeout_ms`, and then falls back to the primary; in 'eventual'
+    mode it is served at once and counted as stale, with the age of the write it missed.
+
+    Change streams need a replica set: a local single-node one is enough (mongod --replSet rs0, rs.initiate() and
+    REPLICA_SET = 'rs0').
+
+    Args:
+        mode (str, optional): 'eventual' or 'read_your_writes'. Defaults to 'read_your_writes'.
+        output_folder (str, optional): The folder the checkpoints are written to. Defaults to None (kept in memory only).
+        checkpoint_events (int, optional): The events applied between checkpoints. Defaults to STOCK_VIEW_CHECKPOINT_EVENTS.
+        max_await_ms (int, optional): How long each poll of the stream waits for new events. Defaults to STOCK_VIEW_MAX_AWAIT_MS.
+        ryw_timeout_ms (float, optional): How long a read waits for its store's last write. Defaults to STOCK_VIEW_RYW_TIMEOUT_MS.
+    """
+
+    def __init__(self, mode: str = 'read_your_writes', output_folder: str = None, checkpoint_events: int = STOCK_VIEW_CHECKPOINT_EVENTS,
+                 max_await_ms: int = STOCK_VIEW_MAX_AWAIT_MS, ryw_timeout_ms: float = STOCK_VIEW_RYW_TIMEOUT_MS) -> None:
+        if mode not in STOCK_VIEW_MODES[1:]:
+            raise ValueError(f"Unknown stock view mode '{mode}', expected one of {STOCK_VIEW_MODES[1:]}.")
+        self.mode = mode
+        self.checkpoint_path = os.path.join(output_folder, STOCK_VIEW_CHECKPOINT_FILE) if output_folder else None
+        self.checkpoint_events = checkpoint_events
+        self.max_await_ms = max_await_ms
+        self.ryw_timeout = ryw_timeout_ms / 1000
+        self.condition = threading.Condition()
+        self.stores: Dict[Any, Dict[str, Dict[str, Any]]] = {}
+        self.keys: Dict[Any, Tuple[Any, str]] = {}
+        self.fences: Dict[Any, Tuple[Any, int]] = {}
+        self.applied_time = None
+        self.applied_token = None
+        self.checkpoint_token = None
+        self.stream = None
+        self.thread = None
+        self.stopping = threading.Event()
+        self.ready = False
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Reset the read counters and the lag, staleness and wait histograms."""
+        with self.condition:
+            self.counters = dict.fromkeys(['view_reads', 'primary_reads', 'stale_reads', 'ryw_waits', 'ryw_timeouts', 'events', 'checkpoints', 'restarts'], 0)
+            self.lag = LatencyHistogram()
+            self.staleness = LatencyHistogram()
+            self.ryw_wait = LatencyHistogram()
+
+    def stats(self) -> Dict[str, float]:
+        """Get the view counters.
+
+        Returns:
+            Dict[str, float]: The counters, the read offload and stale ratios, and the lag, staleness and wait percentiles (ms).
+        """
+        with self.condition:
+            reads = self.counters['view_reads'] + self.counters['primary_reads']
+            return {
+                **self.counters,
+                'offload': self.counters['view_reads'] / reads if reads else 0.0,
+                'stale_ratio': self.counters['stale_reads'] / self.counters['view_reads'] if self.counters['view_reads'] else 0.0,
+                'lag_p50_ms': self.lag.percentile(50),
+                'lag_p99_ms': self.lag.percentile(99),
+                'staleness_p50_ms': self.staleness.percentile(50),
+                'staleness_p99_ms': self.staleness.percentile(99),
+                'ryw_wait_p99_ms': self.ryw_wait.percentile(99),
+            }
+
+    def _put(self, product: Dict[str, Any]) -> None:
+        """Store a full product document, copying its store's dict when it grows after loading; the condition must be held."""
+        products = self.stores.get(product.get('store_id'), {})
+        if self.ready and product['product_id'] not in products:
+            products = dict(products)
+        products[product['product_id']] = product
+        self.stores[product.get('store_id')] = products
+        self.keys[product['_id']] = (product.get('store_id'), product['product_id'])
+
+    def _apply(self, event: Dict[str, Any]) -> int:
+        """Apply a change event to the view, record its replication lag and return the number of events applied so far."""
+        wall_time = event.get('wallTime') or event['clusterTime'].as_datetime().replace(tzinfo=None)
+        with self.condition:
+            if event['operationType'] in ['insert', 'replace']:
+                self._put(event['fullDocument'])
+            elif event['operationType'] == 'update':
+                key = self.keys.get(event['documentKey']['_id'])
+                product = self.stores.get(key[0], {}).get(key[1]) if key else None
+                if product is not None:
+                    description = event['updateDescription']
+                    product = {**product, **{field: value for field, value in description['updatedFields'].items() if '.' not in field}}
+                    for field in description.get('removedFields', []):
+                        product.pop(field, None)
+                    self.stores[key[0]][key[1]] = product
+            elif event['operationType'] == 'delete':
+                key = self.keys.pop(event['documentKey']['_id'], None)
+                if key and key[1] in self.stores.get(key[0], {}):
+                    self.stores[key[0]] = {product_id: product for product_id, product in self.stores[key[0]].items() if product_id != key[1]}
+            self.applied_time = event['clusterTime']
+            self.counters['events'] += 1
+            events = self.counters['events']
+            self.lag.record(max(0.0, (datetime.now(timezone.utc).replace(tzinfo=None) - wall_time).total_seconds() * 1000))
+            self.condition.notify_all()
+        return events
+
+    def _checkpoint(self) -> None:
+        """Keep the resume token of the last applied event, and write it to the checkpoint file."""
+        self.checkpoint_token = self.stream.resume_token
+        with self.condition:
+            self.counters['checkpoints'] += 1
+            events = self.counters['events']
+        if self.checkpoint_path:
+            temporary_path = f'{self.checkpoint_path}.tmp'
+            with open(temporary_path, 'w') as file:
+                file.write(json_util.dumps({'resume_token': self.checkpoint_token, 'applied_time': self.applied_time, 'events': events,
+                                            'saved_at': datetime.now()}))
+            os.replace(temporary_path, self.checkpoint_path)
+
+    def _consume(self) -> None:
+        """Apply the stream events until stopped, reopening the stream after the last checkpoint when it fails."""
+        while not self.stopping.is_set():
+            try:
+                event = self.stream.try_next()
+            except PyMongoError as e:
+                logging.warning(f"Stock view - Change stream failed ({e}); resuming after the last checkpoint.")
+                with self.condition:
+                    self.counters['restarts'] += 1
+                try:
+                    self.stream.close()
+                    self.stream = products_collection.watch(resume_after=self.checkpoint_token, max_await_time_ms=self.max_await_ms)
+                except PyMongoError as e:
+                    logging.error(f"Stock view - Could not reopen the change stream: {e}")
+                    self.stopping.wait(self.max_await_ms / 1000)
+                continue
+            if event is None:
+                continue
+            if self.applied_token is not None and event['_id']['_data'] <= self.applied_token['_data']:
+                continue  # Já aplicado antes de o stream ser reaberto
+            events = self._apply(event)
+            self.applied_token = event['_id']
+            if events % self.checkpoint_events == 0:
+                self._checkpoint()
+
+    def start(self) -> None:
+        """Open the change stream, load the snapshot of the products and start the consumer thread.
+
+        Raises:
+            ValueError: If the products are embedded in the stores.
+        """
+        if storage_layout == 'embedded':
+            raise ValueError("The stock view needs the normalized layout: it watches the products collection.")
+        self.stream = products_collection.watch(max_await_time_ms=self.max_await_ms)
+        self._checkpoint()
+        snapshot = list(products_collection.find({}))
+        with self.condition:
+            for product in snapshot:
+                self._put(product)
+            self.ready = True
+        self.thread = threading.Thread(target=self._consume, name='stock-view', daemon=True)
+        self.thread.start()
+        logging.info(f"Stock view - {len(snapshot)} products of {len(self.stores)} stores loaded ({self.mode}).")
+
+    def stop(self) -> None:
+        """Stop the consumer thread, checkpoint and close the stream."""
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+        self._checkpoint()
+        self.stream.close()
+        with self.condition:
+            self.ready = False
+
+    def note_write(self, store_id: Any, operation_time: Any) -> None:
+        """Fence a store with the operation time of a write, so later reads can tell whether the view applied it.
+
+        Args:
+            store_id (Any): The store written.
+            operation_time (Any): The operation time of the write session (None on a standalone mongod, which is not fenced).
+        """
+        if operation_time is None:
+            return
+        with self.condition:
+            fence = self.fences.get(store_id)
+            if fence is None or operation_time > fence[0]:
+                self.fences[store_id] = (operation_time, time.perf_counter_ns())
+
+    def read(self, store_id: Any) -> Any:
+        """Read the products of a store from the view, with the projection of the current query mode.
+
+        Args:
+            store_id (Any): The ID of the store.
+
+        Returns:
+            Any: The products, or None when the read must go to the primary (view not loaded, or read-your-writes timeout).
+        """
+        fields = QUERY_PROJECTIONS[query_mode]
+        projection = None if fields is None else {'_id': 0, **dict.fromkeys(fields, 1)}
+        with self.condition:
+            fence = self.fences.get(store_id)
+            behind = self.ready and fence is not None and (self.applied_time is None or self.applied_time < fence[0])
+            if behind and self.mode == 'read_your_writes':
+                self.counters['ryw_waits'] += 1
+                wait_start = time.perf_counter_ns()
+                caught_up = self.condition.wait_for(lambda: self.applied_time is not None and self.applied_time >= fence[0], self.ryw_timeout)
+                self.ryw_wait.record((time.perf_counter_ns() - wait_start) / 1e6)
+                if not caught_up:
+                    self.counters['ryw_timeouts'] += 1
+                behind = not caught_up
+            if not self.ready or (behind and self.mode == 'read_your_writes'):
+                self.counters['primary_reads'] += 1
+                return None
+            if behind:
+                self.counters['stale_reads'] += 1
+                self.staleness.record((time.perf_counter_ns() - fence[1]) / 1e6)
+            self.counters['view_reads'] += 1
+            products = self.stores.get(store_id, {})
+        return [project_document(product, projection) for product in products.values()]
+
+
+# Executar uma escrita em sessão e registrá-la na réplica de estoque
+@contextmanager
+def view_fence(store_id: Any) -> Iterator[Any]:
+    """Run a write in a session and fence its store in the stock view with the operation time, for read-your-writes.
+
+    Args:
+        store_id (Any): The store written.
+
+    Yields:
+        Iterator[Any]: The session the write must use, or None when the stock view is off.
+    """
+    if stock_view is None:
+        yield None
+        return
+    session = MemorySession() if isinstance(db, MemoryDatabase) else db.client.start_session(causal_consistency=False)
+    with session:
+        yield session
+    stock_view.note_write(store_id, session.operation_time)
+
+
+# Função para registrar as estatísticas da réplica de estoque
+def log_stock_view_stats(prefix: str) -> None:
+    """Log the stock view counters, when the view is enabled.
+
+    Args:
+        prefix (str): The prefix of the log line (e.g. 'Run 1').
+    """
+    if stock_view is None:
+        return
+    stats = stock_view.stats()
+    logging.info(f"{prefix} - Stock view ({stock_view.mode}): {stats['view_reads']} reads served, {stats['primary_reads']} on the primary "
+                 f"(offload {stats['offload']:.2%}), stale {stats['stale_reads']} ({stats['stale_ratio']:.2%}, p99 {stats['staleness_p99_ms']:.4f} ms), "
+                 f"read-your-writes waits {stats['ryw_waits']} (timeouts {stats['ryw_timeouts']}, p99 {stats['ryw_wait_p99_ms']:.4f} ms), "
+                 f"lag p50 {stats['lag_p50_ms']:.4f} ms / p99 {stats['lag_p99_ms']:.4f} ms, {stats['events']} events, "
+                 f"{stats['checkpoints']} checkpoints, {stats['restarts']} restarts")
+
+
+# Medir o desvio de leituras para a réplica de estoque e a sua defasagem
+def measure_stock_view(modes: List[str] = STOCK_VIEW_MODES, num_operations: int = 2000, percent_cores: float = 0.5, workload: str = None, workloads_file: str = WORKLOADS_FILE, num_stores: int = 20, min_products: int = 5, max_products: int = 20, chart_width: int = 600) -> pd.DataFrame:
+    """Run the simulate_operations mix with query_stock served by the primary ('off') and by the stock view in each
+    consistency mode, and report the read offload, the stale reads, the read-your-writes waits and the replication lag.
+
+    The results and the resume token checkpoints are saved to executions/<timestamp>_stock_view/. The workload profile
+    in effect before the call is restored afterwards.
+
+    Args:
+        modes (List[str], optional): The modes to run, from STOCK_VIEW_MODES. Defaults to STOCK_VIEW_MODES.
+        num_operations (int, optional): The operations run in each mode. Defaults to 2000.
+        percent_cores (float, optional): The percentage of CPU cores to use for the simulation. Defaults to 0.5.
+        workload (str, optional): The workload profile; None runs the default mix. Defaults to None.
+        workloads_file (str, optional): The JSON file with the workload profiles. Defaults to WORKLOADS_FILE.
+        num_stores (int, optional): The number of stores seeded. Defaults to 20.
+        min_products (int, optional): The minimum number of products in a store. Defaults to 5.
+        max_products (int, optional): The maximum number of products in a store. Defaults to 20.
+        chart_width (int, optional): The chart width, in pixels. Defaults to 600.
+
+    Returns:
+        pd.DataFrame: One row per mode.
+    """
+    global stock_view, operation_weights, new_store_products, description_chars
+    unknown = set(modes) - set(STOCK_VIEW_MODES)
+    if unknown:
+        raise ValueError(f"Unknown stock view modes {sorted(unknown)}, expected {STOCK_VIEW_MODES}.")
+    profile = load_workloads(workloads_file)[workload] if workload else WORKLOAD_DEFAULTS
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_folder = os.path.join("executions", f"{timestamp}_stock_view")
+    os.makedirs(output_folder, exist_ok=True)
+
+    previous_workload = (operation_weights, new_store_products, description_chars, access_distribution, access_theta)
+    rows = []
+    try:
+        apply_workload(profile)
+        stores = insert_stores(num_stores, min_products, max_products)
+        for run, mode in enumerate(modes):
+            stock_view = StockView(mode, output_folder) if mode != 'off' else None
+            if stock_view is not None:
+                stock_view.start()
+            recorder = LatencyRecorder()
+            start_time = time.perf_counter()
+            simulate_operations(num_operations, stores, percent_cores, run, output_folder, recorder, keep_raw_times=False)
+            duration = time.perf_counter() - start_time
+            if stock_view is not None:
+                stock_view.stop()
+            histograms = recorder.merged()
+            row = {'mode': mode, 'throughput': num_operations / duration}
+            for operation in ['query_stock', 'update_inventory']:
+                summary = histograms.get(operation, LatencyHistogram()).summary()
+                row.update({f'{operation}_p50_ms': summary['p50'], f'{operation}_p99_ms': summary['p99']})
+            row.update(stock_view.stats() if stock_view is not None else {'offload': 0.0, 'stale_ratio': 0.0})
+            rows.append(row)
+            logging.info(f"Stock view {mode} - {row['throughput']:.2f} ops/s, query_stock p99 {row['query_stock_p99_ms']:.4f} ms, "
+                         f"update_inventory p99 {row['update_inventory_p99_ms']:.4f} ms")
+            log_stock_view_stats(f"Stock view {mode}")
+    finally:
+        stock_view = None
+        operation_weights, new_store_products, description_chars = previous_workload[:3]
+        configure_access(*previous_workload[3:])
+
+    results = pd.DataFrame(rows)
+    results.to_csv(os.path.join(output_folder, 'stock_view.csv'), index=False)
+
+    # Desvio de leituras e leituras defasadas por modo, e percentis de defasagem
+    fig, (offload_ax, lag_ax) = plt.subplots(1, 2, figsize=(2 * chart_width / 100, 6))
+    results.set_index('mode')[['offload', 'stale_ratio']].mul(100).plot.bar(ax=offload_ax, rot=0)
+    offload_ax.set_title('Reads Served by the Stock View')
+    offload_ax.set_ylabel('Share of query_stock reads (%)')
+    views = results[results['mode'] != 'off'].set_index('mode')
+    if len(views):
+        views[['lag_p50_ms', 'lag_p99_ms', 'staleness_p99_ms', 'ryw_wait_p99_ms']].plot.bar(ax=lag_ax, rot=0)
+    lag_ax.set_title('Replication Lag and Staleness')
+    lag_ax.set_ylabel('ms')
+    fig.tight_layout()
+    plt.savefig(os.path.join(output_folder, 'stock_view.png'))
+    plt.close()
+    return results
+
+
+#############
+# Operações #
+#############
+
+# Projeções de consulta do estoque (None devolve o documento completo)
+QUERY_PROJECTIONS: Dict[str, Any] = {
+    'full': None,
+    'lean': ['product_id', 'sku', 'stock_quantity'],
+}
+QUERY_MODE = 'full'
+QUERY_BATCH_SIZE = 500
+
+query_mode = QUERY_MODE
+query_batch_size = QUERY_BATCH_SIZE
+
+
+# Função para montar a consulta de estoque conforme o layout e a projeção
+def stock_query(store_id: str, mode: str) -> Tuple[Any, Dict[str, Any], Any]:
+    """Build the stock query of a store for the current storage layout.
+
+    Args:
+        store_id (str): The ID of the store.
+        mode (str): The query mode, a key of QUERY_PROJECTIONS.
+
+    Returns:
+        Tuple[Any, Dict[str, Any], Any]: The collection, the filter and the projection to read.
+    """
+    if mode not in QUERY_PROJECTIONS:
+        raise ValueError(f"Unknown query mode '{mode}', expected one of {list(QUERY_PROJECTIONS)}.")
+    fields = QUERY_PROJECTIONS[mode]
+    if storage_layout == 'embedded':
+        projection = {'products': 1} if fields is None else {'_id': 0, **{f'products.{field}': 1 for field in fields}}
+        return stores_collection, {'store_id': store_id}, projection
+    projection = None if fields is None else {'_id': 0, **dict.fromkeys(fields, 1)}
+    return products_collection, {'store_id': store_id}, projection
+
+
+# Função para consultar estoque
+def query_stock(store_id: str) -> Tuple[List[Dict[str, Any]], float]:
+    """Query the stock of a specific store.
+
+    Args:
+        store_id (str): The ID of the store to query.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], float]: A list of products in the store and the query execution time.
+    """
+    start_time = operation_timer.start()
+    if stock_view is not None:
+        products = stock_view.read(store_id)
+        if products is not None:
+            return products, operation_timer.stop('query_stock', start_time)
+    if stock_cache is not None:
+        cached = stock_cache.get(store_id)
+        if cached is not None:
+            return cached, operation_timer.stop('query_stock', start_time)
+        version = stock_cache.version(store_id)
+    result = fetch_stock(store_id)
+    if stock_cache is not None:
+        stock_cache.put(store_id, result, version)
+    return result, operation_timer.stop('query_stock', start_time)
+
+
+# Função para ler o estoque completo do banco
+def fetch_stock(store_id: str, mode: str = None) -> List[Dict[str, Any]]:
+    """Read the whole stock of a store from the database as decoded documents, bypassing the stock view and cache.
+
+    Args:
+        store_id (str): The ID of the store to query.
+        mode (str, optional): The query mode, a key of QUERY_PROJECTIONS. Defaults to None (the current query mode).
+
+    Returns:
+        List[Dict[str, Any]]: The products of the store.
+    """
+    collection, query, projection = stock_query(store_id, mode or query_mode)
+    if storage_layout == 'embedded':
+        store = collection.find_one(query, projection)
+        return store['products'] if store else []
+    return list(collection.find(query, projection, batch_size=query_batch_size))
+
+
+# Função para consultar estoque em lotes
+def stream_stock(store_id: str, mode: str = None, batch_size: int = 0, raw_bson: bool = False) -> Iterator[List[Any]]:
+    """Stream the stock of a specific store in batches, so that only one batch is held in memory at a time.
+
+    Args:
+        store_id (str): The ID of the store to query.
+        mode (str, optional): The query mode, a key of QUERY_PROJECTIONS. Defaults to None (the current query mode).
+        batch_size (int, optional): The number of products per batch and cursor round trip. Defaults to 0 (the current batch size).
+        raw_bson (bool, optional): Whether to return undecoded RawBSONDocument products. Defaults to False.
+
+    Yields:
+        Iterator[List[Any]]: The products of the store, one batch at a time.
+    """
+    batch_size = batch_size or query_batch_size
+    collection, query, projection = stock_query(store_id, mode or query_mode)
+    if raw_bson and not isinstance(collection, MemoryCollection):
+        collection = collection.with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+    if storage_layout == 'embedded':
+        store = collection.find_one(query, projection)
+        yield from chunked(list(store['products']) if store else [], batch_size)
+        return
+    batch = []
+    for product in collection.find(query, projection, batch_size=batch_size):
+        batch.append(product)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# Função para atualizar inventário
+def update_inventory(store_id: str, product_id: str, quantity: int) -> float:
+    """Update the inventory of a specific product in a store.
+
+    Args:
+        store_id (str): The ID of the store.
+        product_id (str): The ID of the product.
+        quantity (int): The quantity to update the stock by.
+
+    Returns:
+        float: The execution time of the update operation.
+    """
+    collection, query, update = stock_update(store_id, product_id, quantity)
+    start_time = operation_timer.start()
+    with view_fence(store_id) as session:
+        result = collection.update_one(query, update, session=session)
+    if stock_cache is not None and result.matched_count:
+        stock_cache.patch_stock(store_id, product_id, quantity)
+    return operation_timer.stop('update_inventory', start_time)
+
+
+# Função para adicionar uma nova filial
+def add_store() -> float:
+    """Add a new store to the database with a 30% chance."""
+    #if random.random() < 0.3:  # 30% de chance de adicionar uma nova filial
+    generation_start = time.perf_counter_ns()
+    store = generate_fake_store(*new_store_products)
+    if storage_layout != 'embedded':
+        summary, products = split_store(store)
+    start_time = operation_timer.start()
+    if storage_layout == 'embedded':
+        stores_collection.insert_one(store)
+    else:
+        stores_collection.insert_one(summary)
+        with view_fence(store['store_id']) as session:
+            products_collection.insert_many(products, session=session)
+    return operation_timer.stop('add_store', start_time, start_time - generation_start)
+    
+
+# Função para adicionar um novo produto
+def add_product(store_id: str, region: str = None) -> float:
+    """Add a new product to a store with a 30% chance.
+
+    Args:
+        store_id (str): The ID of the store to add the product to.
+        region (str, optional): The region of the store, copied to the product row. Defaults to None.
+    """
+    #if random.random() < 0.3:  # 30% de chance de adicionar um novo produto
+    generation_start = time.perf_counter_ns()
+    new_product = generate_fake_product()
+    start_time = operation_timer.start()
+    if storage_layout == 'embedded':
+        stores_collection.update_one({'store_id': store_id}, {'$push': {'products': new_product}})
+    else:
+        with view_fence(store_id) as session:
+            products_collection.insert_one({**new_product, 'store_id': store_id, 'region': region}, session=session)
+        stores_collection.update_one(
+            {'store_id': store_id},
+            {'$push': {'product_ids': new_product['product_id']}, '$inc': {'product_count': 1}}
+        )
+    if stock_cache is not None:
+        stock_cache.add_product(store_id, {**new_product, 'store_id': store_id, 'region': region})
+    return operation_timer.stop('add_product', start_time, start_time - generation_start)
+
+
+########################
+# Alertas de reposição #
+########################
+
+# Campos devolvidos pelos alertas, e o índice forçado em cada plano comparado
+ALERT_FIELDS = ['product_id', 'sku', 'stock_quantity', 'expiry_date']
+ALERT_PLANS: Dict[str, Dict[str, str]] = {
+    'index': {'low_stock': 'store_low_stock', 'expiring_products': 'store_expiry'},
+    'store_scan': {'low_stock': 'store_product_unique', 'expiring_products': 'store_product_unique'},
+}
+
+
+# Função para montar o filtro de um alerta de reposição
+def alert_filter(alert: str, threshold: int = LOW_STOCK_THRESHOLD, days: int = EXPIRY_DAYS) -> Dict[str, Any]:
+    """Build the product condition of a replenishment alert.
+
+    Args:
+        alert (str): 'low_stock' (stock below the threshold) or 'expiring_products' (expiring within the next days).
+        threshold (int, optional): The low stock threshold; above LOW_STOCK_THRESHOLD the partial index cannot serve it. Defaults to LOW_STOCK_THRESHOLD.
+        days (int, optional): The expiry window, in days. Defaults to EXPIRY_DAYS.
+
+    Returns:
+        Dict[str, Any]: The condition on the product fields.
+    """
+    if alert == 'low_stock':
+        return {'stock_quantity': {'$lt': threshold}}
+    if alert == 'expiring_products':
+        now = datetime.now()
+        return {'expiry_date': {'$gte': now, '$lt': now + timedelta(days=days)}}
+    raise ValueError(f"Unknown alert '{alert}', expected one of {list(ALERT_OPERATIONS)}.")
+
+
+# Função para consultar um alerta de reposição
+def query_alert(alert: str, store_id: str, condition: Dict[str, Any] = None, hint: Any = None) -> Tuple[List[Dict[str, Any]], float]:
+    """Query the products of a store that raise a replenishment alert.
+
+    With the embedded layout the products of the store are read and filtered on the client, as no index can serve them.
+
+    Args:
+        alert (str): The alert, a key of ALERT_OPERATIONS.
+        store_id (str): The ID of the store.
+        condition (Dict[str, Any], optional): The product condition. Defaults to None (alert_filter with the default limits).
+        hint (Any, optional): The index to force, or {'$natural': 1} for a collection scan. Defaults to None (the planner's choice).
+
+    Returns:
+        Tuple[List[Dict[str, Any]], float]: The products raising the alert and the query execution time.
+    """
+    condition = condition or alert_filter(alert)
+    start_time = operation_timer.start()
+    if storage_layout == 'embedded':
+        store = stores_collection.find_one({'store_id': store_id}, {'products': 1})
+        result = [product for product in (store['products'] if store else []) if match_document(product, condition)[0]]
+    else:
+        projection = {'_id': 0, **dict.fromkeys(ALERT_FIELDS, 1)}
+        result = list(products_collection.find({'store_id': store_id, **condition}, projection, batch_size=query_batch_size, hint=hint))
+    return result, operation_timer.stop(alert, start_time)
+
+
+# Função para consultar os produtos com estoque baixo
+def low_stock(store_id: str, threshold: int = LOW_STOCK_THRESHOLD) -> Tuple[List[Dict[str, Any]], float]:
+    """Query the products of a store whose stock is below a threshold.
+
+    Args:
+        store_id (str): The ID of the store to query.
+        threshold (int, optional): The low stock threshold. Defaults to LOW_STOCK_THRESHOLD.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], float]: The low stock products and the query execution time.
+    """
+    return query_alert('low_stock', store_id, alert_filter('low_stock', threshold=threshold))
+
+
+# Função para consultar os produtos com validade próxima
+def expiring_products(store_id: str, days: int = EXPIRY_DAYS) -> Tuple[List[Dict[str, Any]], float]:
+    """Query the products of a store that expire within the next days.
+
+    Args:
+        store_id (str): The ID of the store to query.
+        days (int, optional): The expiry window, in days. Defaults to EXPIRY_DAYS.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], float]: The expiring products and the query execution time.
+    """
+    return query_alert('expiring_products', store_id, alert_filter('expiring_products', days=days))
+
+
+# Operações de alerta da simulação
+ALERT_OPERATIONS: Dict[str, Any] = {'low_stock': low_stock, 'expiring_products': expiring_products}
+
+
+# Medir os alertas com e sem os seus índices, e o custo desses índices nas atualizações de estoque
+def measure_alerts(queries_per_plan: int = 200, update_operations: int = 5000, percent_cores: float = 0.5, num_stores: int = 20, min_products: int = 200, max_products: int = 1000, chart_width: int = 600) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Compare the alert queries served by their indexes with scans of all the products of each store, then measure the
+    update_inventory $inc rate with no alert index, with the declared ones (partial on low stock) and with a full
+    store_id + stock_quantity index, whose entry moves on every update.
+
+    The results are saved to executions/<timestamp>_alerts/.
+
+    Args:
+        queries_per_plan (int, optional): The queries of each alert and plan, on stores picked by the access distribution. Defaults to 200.
+        update_operations (int, optional): The stock updates of each index variant. Defaults to 5000.
+        percent_cores (float, optional): The percentage of CPU cores running the updates. Defaults to 0.5.
+        num_stores (int, optional): The number of stores seeded. Defaults to 20.
+        min_products (int, optional): The minimum number of products in a store. Defaults to 200.
+        max_products (int, optional): The maximum number of products in a store. Defaults to 1000.
+        chart_width (int, optional): The chart width, in pixels. Defaults to 600.
+
+    Returns:
+        Tuple[pd.DataFrame, pd.DataFrame]: One row per alert and plan, and one row per index variant.
+    """
+    if storage_layout == 'embedded':
+        raise ValueError("The alert benchmark needs the normalized layout: embedded products are not indexed per store.")
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_folder = os.path.join("executions", f"{timestamp}_alerts")
+    os.makedirs(output_folder, exist_ok=True)
+
+    create_indexes(db, ALERT_INDEXES)
+    stores = insert_stores(num_stores, min_products, max_products)
+    logging.info(f"Alerts - {sum(len(store['products']) for store in stores)} products seeded in {num_stores} stores.")
+
+    # Consultas servidas pelos índices dos alertas ou pela varredura dos produtos da filial
+    scan_rows = []
+    for alert in ALERT_OPERATIONS:
+        condition = alert_filter(alert)
+        for plan, hints in ALERT_PLANS.items():
+            histogram = LatencyHistogram()
+            returned = 0
+            for _ in range(queries_per_plan):
+                result, elapsed = query_alert(alert, pick_store(stores)['store_id'], condition, hints[alert])
+                histogram.record(elapsed * 1000)
+                returned += len(result)
+            explain = products_collection.find({'store_id': stores[0]['store_id'], **condition}, hint=hints[alert]).explain()
+            execution_stats = explain.get('executionStats', {})
+            summary = histogram.summary()
+            scan_rows.append({'alert': alert, 'plan': plan, 'stage': get_winning_stage(explain['queryPlanner']['winningPlan']),
+                              'p50_ms': summary['p50'], 'p99_ms': summary['p99'], 'avg_returned': returned / queries_per_plan,
+                              'docs_examined': execution_stats.get('totalDocsExamined'), 'keys_examined': execution_stats.get('totalKeysExamined')})
+            logging.info(f"Alerts - {alert} ({plan}, {scan_rows[-1]['stage']}): p50 {summary['p50']:.4f} ms, p99 {summary['p99']:.4f} ms, "
+                         f"{scan_rows[-1]['avg_returned']:.1f} products returned, {scan_rows[-1]['docs_examined']} documents examined")
+
+    # Taxa de $inc do update_inventory conforme os índices de alerta mantidos
+    stock_index = ([('store_id', pymongo.ASCENDING), ('stock_quantity', pymongo.ASCENDING)], {'name': 'store_stock'})
+    variants = {
+        'none': [],
+        'partial': ALERT_INDEXES['products'],
+        'full': [index for index in ALERT_INDEXES['products'] if index[1]['name'] != 'store_low_stock'] + [stock_index],
+    }
+    every_index = {'products': [*ALERT_INDEXES['products'], stock_index]}
+    updates = []
+    for _ in range(update_operations):
+        store = pick_store(stores)
+        updates.append((store['store_id'], pick_product(store['products'])['product_id']))
+    max_workers = max(1, int(get_num_cores() * percent_cores))
+    update_rows = []
+    try:
+        for variant, indexes in variants.items():
+            drop_indexes(db, every_index)
+            create_indexes(db, {'products': indexes})
+            histogram = LatencyHistogram()
+            start_time = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for elapsed in executor.map(lambda update: update_inventory(*update, random.randint(1, 10)), updates):
+                    histogram.record(elapsed * 1000)
+            duration = time.perf_counter() - start_time
+            coll_stats = db.command('collStats', 'products')
+            summary = histogram.summary()
+            update_rows.append({'indexes': variant, 'throughput': update_operations / duration, 'p50_ms': summary['p50'], 'p99_ms': summary['p99'],
+                                'index_count': coll_stats.get('nindexes', 0), 'index_size': coll_stats.get('totalIndexSize', 0)})
+            logging.info(f"Alerts - update_inventory with '{variant}' alert indexes: {update_rows[-1]['throughput']:.2f} ops/s, "
+                         f"p50 {summary['p50']:.4f} ms, p99 {summary['p99']:.4f} ms, indexes {update_rows[-1]['index_size'] / (1024 ** 2):.2f} MB")
+    finally:
+        drop_indexes(db, every_index)
+        create_indexes(db, ALERT_INDEXES)
+
+    scans = pd.DataFrame(scan_rows)
+    updates_df = pd.DataFrame(update_rows)
+    updates_df['relative_throughput'] = updates_df['throughput'] / updates_df['throughput'].iloc[0]
+    scans.to_csv(os.path.join(output_folder, 'alert_queries.csv'), index=False)
+    updates_df.to_csv(os.path.join(output_folder, 'alert_index_updates.csv'), index=False)
+
+    # Latência dos alertas por plano e taxa de atualização por variante de índices
+    fig, (scan_ax, update_ax) = plt.subplots(1, 2, figsize=(2 * chart_width / 100, 6))
+    scans.pivot(index='alert', columns='plan', values='p50_ms').plot.bar(ax=scan_ax, rot=0)
+    scan_ax.set_title('Alert Queries: Index vs Store Scan')
+    scan_ax.set_ylabel('p50 latency (ms)')
+    update_ax.bar(updates_df['indexes'], updates_df['throughput'])
+    update_ax.set_title('update_inventory Rate by Alert Indexes')
+    update_ax.set_xlabel('Alert indexes')
+    update_ax.set_ylabel('Updates (ops/s)')
+    fig.tight_layout()
+    plt.savefig(os.path.join(output_folder, 'alerts.png'))
+    plt.close()
+    return scans, updates_df
+
+
+#######################
+# Reserva de estoque #
+#######################
+
+# Configurar as tentativas da reserva de estoque
+RESERVE_MAX_RETRIES = 5
+RESERVE_BACKOFF_MS = 1.0
+RESERVE_CONCURRENCY_LEVELS = [1, 2, 4, 8, 16, 32]
+
+# Código de erro do MongoDB para conflito de escrita
+WRITE_CONFLICT_CODE = 112
+
+
+# Conflitos de escrita das transações em memória
+class MemoryTransactionLocks:
+    """Emulate the optimistic write conflicts of MongoDB transactions on the in-memory engine: a transaction writing a
+    document that another transaction holds fails at once with a WriteConflict, instead of waiting for it."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.owners: set = set()
+
+    @contextmanager
+    def hold(self, key: Any) -> Iterator[None]:
+        """Hold a document for the duration of a transaction.
+
+        Args:
+            key (Any): The document key.
+
+        Raises:
+            OperationFailure: A TransientTransactionError WriteConflict when another transaction holds the document.
+        """
+        with self.lock:
+            if key in self.owners:
+                raise OperationFailure('Write conflict during plan execution', WRITE_CONFLICT_CODE,
+                                       {'codeName': 'WriteConflict', 'errorLabels': ['TransientTransactionError']})
+            self.owners.add(key)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.owners.discard(key)
+
+
+memory_transactions = MemoryTransactionLocks()
+
+
+# Montar a reserva de estoque conforme o layout
+def stock_reservation(store_id: str, product_id: str, quantity: int) -> Tuple[Any, Dict[str, Any], Dict[str, Any]]:
+    """Build the guarded stock decrement of a product for the current storage layout.
+
+    Args:
+        store_id (str): The ID of the store.
+        product_id (str): The ID of the product.
+        quantity (int): The quantity to reserve.
+
+    Returns:
+        Tuple[Any, Dict[str, Any], Dict[str, Any]]: The collection, the filter (matching only when enough stock remains) and the update.
+    """
+    if storage_layout == 'embedded':
+        return (stock_collection(),
+                {'store_id': store_id, 'products': {'$elemMatch': {'product_id': product_id, 'stock_quantity': {'$gte': quantity}}}},
+                {'$inc': {'products.$.stock_quantity': -quantity}})
+    return (stock_collection(),
+            {'product_id': product_id, 'store_id': store_id, 'stock_quantity': {'$gte': quantity}},
+            {'$inc': {'stock_quantity': -quantity}})
+
+
+# Função para identificar conflitos que podem ser repetidos
+def is_retryable_conflict(error: PyMongoError) -> bool:
+    """Check whether an error is a write conflict or a transient transaction error worth retrying.
+
+    Args:
+        error (PyMongoError): The error raised.
+
+    Returns:
+        bool: Whether the reservation can be retried.
+    """
+    return ((isinstance(error, OperationFailure) and error.code == WRITE_CONFLICT_CODE)
+            or error.has_error_label('TransientTransactionError'))
+
+
+# Função para verificar se o servidor aceita transações
+def supports_transactions(database: Any) -> bool:
+    """Check whether the database accepts multi-document transactions (a replica set, a sharded cluster or the in-memory engine).
+
+    Args:
+        database (Any): The database.
+
+    Returns:
+        bool: Whether transactions can be used.
+    """
+    if isinstance(database, MemoryDatabase):
+        return True
+    hello = database.client.admin.command('hello')
+    return 'setName' in hello or hello.get('msg') == 'isdbgrid'
+
+
+# Função para confirmar uma transação, repetindo só o commit quando o resultado é desconhecido
+def commit_with_retry(session: Any) -> None:
+    """Commit the transaction of a session, retrying only the commit on an UnknownTransactionCommitResult error, as the
+    transaction body may already be applied.
+
+    Args:
+        session (Any): The session in a transaction.
+
+    Raises:
+        PyMongoError: If the commit fails for another reason, or keeps an unknown result after RESERVE_MAX_RETRIES retries.
+    """
+    for attempt in range(RESERVE_MAX_RETRIES + 1):
+        try:
+            session.commit_transaction()
+            return
+        except PyMongoError as e:
+            if attempt == RESERVE_MAX_RETRIES or not e.has_error_label('UnknownTransactionCommitResult'):
+                raise
+
+
+# Função para reservar o estoque e registrar a venda na mesma transação
+def reserve_in_transaction(store_id: str, product_id: str, collection: Any, query: Dict[str, Any], update: Dict[str, Any], sale: Dict[str, Any]) -> bool:
+    """Apply the guarded decrement and insert the sale in one multi-document transaction.
+
+    Args:
+        store_id (str): The ID of the store.
+        product_id (str): The ID of the product.
+        collection (Any): The collection of the decrement.
+        query (Dict[str, Any]): The guarded filter.
+        update (Dict[str, Any]): The decrement.
+        sale (Dict[str, Any]): The sale to record.
+
+    Returns:
+        bool: Whether the stock was reserved (the transaction is aborted when it was not).
+
+    Raises:
+        PyMongoError: A TransientTransactionError, after which the whole transaction can be run again.
+    """
+    if isinstance(db, MemoryDatabase):
+        with memory_transactions.hold((store_id, product_id)):
+            if collection.find_one_and_update(query, update, projection={'_id': 1}) is None:
+                return False
+            try:
+                sales_collection.insert_one(sale)
+            except Exception:
+                # Desfazer a baixa, como o abort de uma transação
+                collection, undo_query, undo = stock_update(store_id, product_id, sale['quantity_sold'])
+                collection.update_one(undo_query, undo)
+                raise
+            return True
+    with db.client.start_session() as session:
+        with session.start_transaction():
+            if collection.find_one_and_update(query, update, projection={'_id': 1}, session=session) is None:
+                session.abort_transaction()
+                return False
+            sales_collection.insert_one(sale, session=session)
+            commit_with_retry(session)
+    return True
+
+
+# Função para reservar estoque
+def reserve_stock(store_id: str, product_id: str, quantity: int, transactional: bool = False) -> Tuple[bool, int, float]:
+    """Reserve stock of a product only when enough remains, retrying write conflicts with exponential backoff and jitter.
+
+    Args:
+        store_id (str): The ID of the store.
+        product_id (str): The ID of the product.
+        quantity (int): The quantity to reserve.
+        transactional (bool, optional): Whether to record the sale in the same transaction as the decrement. Defaults to False.
+
+    Returns:
+        Tuple[bool, int, float]: Whether the stock was reserved, the number of retried conflicts, and the execution time.
+    """
+    collection, query, update = stock_reservation(store_id, product_id, quantity)
+    generation_start = time.perf_counter_ns()
+    sale = {**generate_fake_sale(store_id, product_id), 'quantity_sold': quantity} if transactional else None
+    start_time = operation_timer.start()
+    for attempt in range(RESERVE_MAX_RETRIES + 1):
+        try:
+            if transactional:
+                reserved = reserve_in_transaction(store_id, product_id, collection, query, update, sale)
+            else:
+                reserved = collection.find_one_and_update(query, update, projection={'_id': 1}) is not None
+            break
+        except PyMongoError as e:
+            if attempt == RESERVE_MAX_RETRIES or not is_retryable_conflict(e):
+                raise
+            time.sleep(random.uniform(0, RESERVE_BACKOFF_MS * 2 ** attempt) / 1000)
+    if reserved and stock_cache is not None:
+        stock_cache.patch_stock(store_id, product_id, -quantity)
+    return reserved, attempt, operation_timer.stop('reserve_stock', start_time, start_time - generation_start)
+
+
+# Função para ler o estoque atual de um produto
+def current_stock(store_id: str, product_id: str) -> int:
+    """Read the stock quantity of a product.
+
+    Args:
+        store_id (str): The ID of the store.
+        product_id (str): The ID of the product.
+
+    Returns:
+        int: The stock quantity, or 0 when the product is not found.
+    """
+    if storage_layout == 'embedded':
+        store = stores_collection.find_one({'store_id': store_id}, {'products': 1})
+        products = store['products'] if store else []
+    else:
+        products = products_collection.find({'store_id': store_id, 'product_id': product_id}, {'product_id': 1, 'stock_quantity': 1})
+    return next((product['stock_quantity'] for product in products if product['product_id'] == product_id), 0)
+
+
+# Medir a disputa por produtos concorridos
+def measure_reservation_contention(concurrency_levels: List[int] = RESERVE_CONCURRENCY_LEVELS, operations_per_level: int = 1000, transactional: bool = False, hot_products: int = 1, quantity: int = 1, num_stores: int = 5, min_products: int = 5, max_products: int = 20, chart_width: int = 600) -> pd.DataFrame:
+    """Reserve stock of a few hot products from an increasing number of threads and report throughput, abort rate and
+    whether the stock stayed consistent (never negative, decremented exactly by the reservations made).
+
+    Each level starts from enough stock for half of its reservations, so the guard is exercised too. The abort rate
+    (retried conflicts over attempts) only applies to the transactional variant: the conditional reservation is a single
+    document update, whose write conflicts the server retries internally, so its abort rate is left empty and only the
+    throughput is charted.
+
+    Args:
+        concurrency_levels (List[int], optional): The numbers of threads. Defaults to RESERVE_CONCURRENCY_LEVELS.
+        operations_per_level (int, optional): The number of reservations at each level. Defaults to 1000.
+        transactional (bool, optional): Whether to use the transaction variant. Defaults to False.
+        hot_products (int, optional): The number of products competed for. Defaults to 1.
+        quantity (int, optional): The quantity of each reservation. Defaults to 1.
+        num_stores (int, optional): The number of stores seeded. Defaults to 5.
+        min_products (int, optional): The minimum number of products in a store. Defaults to 5.
+        max_products (int, optional): The maximum number of products in a store. Defaults to 20.
+        chart_width (int, optional): The chart width, in pixels. Defaults to 600.
+
+    Returns:
+        pd.DataFrame: One row per concurrency level.
+
+    Raises:
+        ValueError: If the transactional variant is asked of a server without transactions (a standalone mongod).
+    """
+    if transactional and not supports_transactions(db):
+        raise ValueError("The transactional reservation needs a replica set or a sharded cluster (e.g. a local single-node replica set).")
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_folder = os.path.join("executions", f"{timestamp}_reservations")
+    os.makedirs(output_folder, exist_ok=True)
+    variant = 'transactional' if transactional else 'conditional'
+    logging.info(f"Starting {variant} reservation contention on {hot_products} hot products at {concurrency_levels} threads.")
+
+    stores = insert_stores(num_stores, max(min_products, hot_products), max(max_products, hot_products))
+    hot = [(stores[0]['store_id'], product['product_id']) for product in stores[0]['products'][:hot_products]]
+    initial_stock = max(1, operations_per_level * quantity // (2 * len(hot)))
+    rows = []
+    for concurrency in concurrency_levels:
+        for store_id, product_id in hot:
+            collection, query, update = stock_update(store_id, product_id, 0)
+            collection.update_one(query, {'$set': dict.fromkeys(update['$inc'], initial_stock)})
+        histogram = LatencyHistogram()
+        reserved = out_of_stock = failed = retries = 0
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(reserve_stock, *random.choice(hot), quantity, transactional) for _ in range(operations_per_level)]
+            for future in as_completed(futures):
+                try:
+                    success, attempt_retries, elapsed = future.result()
+                except PyMongoError as e:
+                    failed += 1
+                    logging.error(e)
+                    continue
+                reserved += success
+                out_of_stock += not success
+                retries += attempt_retries
+                histogram.record(elapsed * 1000)
+        duration = time.perf_counter() - start_time
+        stocks = [current_stock(store_id, product_id) for store_id, product_id in hot]
+        summary = histogram.summary()
+        row = {
+            'concurrency': concurrency,
+            'throughput': operations_per_level / duration,
+            'reserved_per_second': reserved / duration,
+            'reserved': reserved,
+            'out_of_stock': out_of_stock,
+            'failed': failed,
+            'retries': retries,
+            'abort_rate': retries / (operations_per_level + retries) if transactional else float('nan'),
+            'p50_ms': summary['p50'],
+            'p99_ms': summary['p99'],
+            'consistent': min(stocks) >= 0 and sum(stocks) == initial_stock * len(hot) - reserved * quantity,
+        }
+        rows.append(row)
+        abort_rate = f"abort rate {row['abort_rate']:.2%}, " if transactional else ''
+        logging.info(f"Reservations at {concurrency} threads ({variant}) - {row['throughput']:.2f} ops/s, {reserved} reserved, "
+                     f"{out_of_stock} out of stock, {failed} failed, {abort_rate}p99 {row['p99_ms']:.4f} ms, "
+                     f"stock {'consistent' if row['consistent'] else 'INCONSISTENT'}")
+
+    results = pd.DataFrame(rows)
+    results.to_csv(os.path.join(output_folder, f'reservation_contention_{variant}.csv'), index=False)
+
+    # Throughput and abort rate by concurrency
+    fig, ax = plt.subplots(figsize=(chart_width / 100, 6))
+    ax.plot(results['concurrency'], results['throughput'], marker='o', label='Throughput')
+    ax.set_xlabel('Threads')
+    ax.set_ylabel('Reservations (ops/s)')
+    if transactional:
+        abort_ax = ax.twinx()
+        abort_ax.plot(results['concurrency'], results['abort_rate'] * 100, marker='x', linestyle='--', color='red', label='Abort rate')
+        abort_ax.set_ylabel('Abort rate (%)')
+    fig.legend(loc='upper left')
+    plt.title(f'Reservation Contention ({variant})')
+    plt.savefig(os.path.join(output_folder, f'reservation_contention_{variant}.png'))
+    plt.close()
+    return results
+
+
+#########################
+# Métricas por operação #
+#########################
+
+# Configurar o registro colunar das operações
+METRICS_FOLDER = 'metrics'
+METRICS_CHUNK_SIZE = 10_000
+METRICS_SCHEMA = None if pa is None else pa.schema([
+    ('operation', pa.string()),
+    ('store_id', pa.string()),
+    ('start_ns', pa.int64()),
+    ('duration_ns', pa.int64()),
+    ('thread_id', pa.int64()),
+    ('pid', pa.int32()),
+    ('run', pa.int32()),
+    ('outcome', pa.string()),
+])
+
+
+# Registro colunar das operações de uma rodada
+class MetricsSink:
+    """Stream one record per operation to a Parquet file of the execution, buffered per thread and flushed in
+    chunks of `chunk_size` rows (one row group each).
+
+    A full buffer is swapped out and handed to a writer thread, which encodes and writes it, so the operation threads
+    never wait on Parquet encoding or on each other's writes.
+
+    Args:
+        output_folder (str): The folder of the execution; the file goes to its METRICS_FOLDER subfolder.
+        run (int): The run number.
+        chunk_size (int, optional): The rows buffered by a thread before they are written. Defaults to METRICS_CHUNK_SIZE.
+    """
+
+    def __init__(self, output_folder: str, run: int, chunk_size: int = METRICS_CHUNK_SIZE) -> None:
+        if pa is None:
+            raise ImportError("The metrics sink needs the pyarrow package (pip install pyarrow).")
+        folder = os.path.join(output_folder, METRICS_FOLDER)
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, f'run_{run + 1}.parquet')
+        self.run = run + 1
+        self.chunk_size = chunk_size
+        self.pid = os.getpid()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.buffers: List[List[Tuple[str, Any, int, int, int, str]]] = []
+        self.writer = pq.ParquetWriter(self.path, METRICS_SCHEMA)
+        self.rows = 0
+        self.chunks: 'queue.Queue[Any]' = queue.Queue()
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def record(self, operation: str, store_id: Any, start_ns: int, duration_ns: int, outcome: str = 'ok') -> None:
+        """Buffer the record of an operation in the calling thread.
+
+        Args:
+            operation (str): The operation type.
+            store_id (Any): The store the operation targeted, or None.
+            start_ns (int): The start of the operation, on the perf_counter_ns clock.
+            duration_ns (int): The duration of the operation, in nanoseconds.
+            outcome (str, optional): 'ok', or the name of the exception the operation raised. Defaults to 'ok'.
+        """
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            buffer = self.local.buffer = []
+            with self.lock:
+                self.buffers.append(buffer)
+        buffer.append((operation, None if store_id is None else str(store_id), start_ns, duration_ns, threading.get_ident(), outcome))
+        if len(buffer) >= self.chunk_size:
+            self.flush(buffer)
+
+    def flush(self, buffer: List[Tuple[str, Any, int, int, int, str]]) -> None:
+        """Hand the records of a buffer to the writer thread and empty it.
+
+        Args:
+            buffer (List[Tuple[str, Any, int, int, int, str]]): The buffer of a thread.
+        """
+        with self.lock:
+            rows = buffer[:]
+            buffer.clear()
+        if rows:
+            self.chunks.put(rows)
+
+    def _write(self) -> None:
+        """Write the chunks handed over by flush() as row groups, until close() sends None."""
+        for rows in iter(self.chunks.get, None):
+            operations, store_ids, starts, durations, thread_ids, outcomes = zip(*rows)
+            table = pa.table({
+                'operation': pa.array(operations, pa.string()),
+                'store_id': pa.array(store_ids, pa.string()),
+                'start_ns': pa.array(starts, pa.int64()),
+                'duration_ns': pa.array(durations, pa.int64()),
+                'thread_id': pa.array(thread_ids, pa.int64()),
+                'pid': pa.array([self.pid] * len(rows), pa.int32()),
+                'run': pa.array([self.run] * len(rows), pa.int32()),
+                'outcome': pa.array(outcomes, pa.string()),
+            }, schema=METRICS_SCHEMA)
+            self.writer.write_table(table)
+            self.rows += len(rows)
+
+    def close(self) -> None:
+        """Flush the buffers of all threads, wait for the writer thread and close the file."""
+        for buffer in list(self.buffers):
+            self.flush(buffer)
+        self.chunks.put(None)
+        self.thread.join()
+        self.writer.close()
+        logging.info(f"Run {self.run} - Metrics: {self.rows} operations saved to {self.path}")
+
+
+# Função para carregar as métricas por operação
+def load_metrics(path: str) -> pd.DataFrame:
+    """Load the per-operation records saved by MetricsSink, for offline analysis.
+
+    Args:
+        path (str): An execution folder, its metrics folder or a single Parquet file.
+
+    Returns:
+        pd.DataFrame: The records ordered by run and start, with categorical operation and outcome columns and a duration_ms column.
+    """
+    if pa is None:
+        raise ImportError("Loading the metrics needs the pyarrow package (pip install pyarrow).")
+    if os.path.isdir(os.path.join(path, METRICS_FOLDER)):
+        path = os.path.join(path, METRICS_FOLDER)
+    metrics = pd.read_parquet(path)
+    metrics['operation'] = metrics['operation'].astype('category')
+    metrics['outcome'] = metrics['outcome'].astype('category')
+    metrics['duration_ms'] = metrics['duration_ns'] / 1e6
+    return metrics.sort_values(['run', 'start_ns'], ignore_index=True)
+
+
+# Função para resumir as métricas por operação
+def summarize_metrics(metrics: pd.DataFrame) -> pd.DataFrame:
+    """Summarize the records of each operation type.
+
+    Args:
+        metrics (pd.DataFrame): The records, as returned by load_metrics.
+
+    Returns:
+        pd.DataFrame: Per operation, the count, the error rate and the mean and REPORT_PERCENTILES of the successful durations (ms).
+    """
+    succeeded = metrics[metrics['outcome'] == 'ok'].groupby('operation', observed=True)['duration_ms']
+    summary = succeeded.quantile([percentile / 100 for percentile in REPORT_PERCENTILES]).unstack()
+    summary.columns = [f'p{percentile:g}_ms' for percentile in REPORT_PERCENTILES]
+    summary.insert(0, 'mean_ms', succeeded.mean())
+    outcomes = metrics.groupby('operation', observed=True)['outcome']
+    summary.insert(0, 'error_rate', outcomes.apply(lambda outcome: (outcome != 'ok').mean()))
+    summary.insert(0, 'count', outcomes.size())
+    return summary
+
+
+# Função para comparar as métricas de duas execuções
+def compare_metrics(baseline: pd.DataFrame, candidate: pd.DataFrame) -> pd.DataFrame:
+    """Compare the summaries of a baseline and a candidate execution.
+
+    Args:
+        baseline (pd.DataFrame): The records of the baseline, as returned by load_metrics.
+        candidate (pd.DataFrame): The records of the candidate, as returned by load_metrics.
+
+    Returns:
+        pd.DataFrame: Per operation, each statistic of both executions and, for the durations, the candidate/baseline ratio.
+    """
+    baseline_summary = summarize_metrics(baseline)
+    candidate_summary = summarize_metrics(candidate)
+    comparison = baseline_summary.join(candidate_summary, how='outer', lsuffix='_baseline', rsuffix='_candidate')
+    for column in baseline_summary.columns:
+        if column.endswith('_ms'):
+            comparison[f'{column}_ratio'] = comparison[f'{column}_candidate'] / comparison[f'{column}_baseline']
+    return comparison
+
+
+##########################
+# Amostragem de recursos #
+##########################
+
+# Configurar a amostragem de recursos
+RESOURCES_FOLDER = 'resources'
+RESOURCE_SAMPLE_INTERVAL_MS = 250.0
+
+# Contadores do serverStatus/dbStats registrados como variação por amostra
+SERVER_COUNTERS: Dict[str, Tuple[str, ...]] = {
+    'op_insert': ('opcounters', 'insert'),
+    'op_query': ('opcounters', 'query'),
+    'op_update': ('opcounters', 'update'),
+    'op_delete': ('opcounters', 'delete'),
+    'op_getmore': ('opcounters', 'getmore'),
+    'op_command': ('opcounters', 'command'),
+    'cache_read_bytes': ('wiredTiger', 'cache', 'bytes read into cache'),
+    'cache_written_bytes': ('wiredTiger', 'cache', 'bytes written from cache'),
+    'cache_evicted_unmodified': ('wiredTiger', 'cache', 'unmodified pages evicted'),
+    'cache_evicted_modified': ('wiredTiger', 'cache', 'modified pages evicted'),
+    'cache_evicted_by_app': ('wiredTiger', 'cache', 'pages evicted by application threads'),
+    'db_objects': ('dbStats', 'objects'),
+    'db_data_bytes': ('dbStats', 'dataSize'),
+    'db_index_bytes': ('dbStats', 'indexSize'),
+}
+
+# Medidores do serverStatus registrados como valor atual
+SERVER_GAUGES: Dict[str, Tuple[str, ...]] = {
+    'cache_bytes': ('wiredTiger', 'cache', 'bytes currently in the cache'),
+    'cache_dirty_bytes': ('wiredTiger', 'cache', 'tracked dirty bytes in the cache'),
+    'queue_readers': ('globalLock', 'currentQueue', 'readers'),
+    'queue_writers': ('globalLock', 'currentQueue', 'writers'),
+    'active_readers': ('globalLock', 'activeClients', 'readers'),
+    'active_writers': ('globalLock', 'activeClients', 'writers'),
+    'connections': ('connections', 'current'),
+}
+
+
+# Função para ler um valor aninhado de um documento de status
+def status_value(status: Dict[str, Any], path: Tuple[str, ...]) -> float:
+    """Get a nested value of a serverStatus/dbStats document.
+
+    Args:
+        status (Dict[str, Any]): The status document.
+        path (Tuple[str, ...]): The keys leading to the value.
+
+    Returns:
+        float: The value, or NaN when the server does not report it.
+    """
+    for key in path:
+        if not isinstance(status, dict) or key not in status:
+            return np.nan
+        status = status[key]
+    return float(status)
+
+
+# Amostragem periódica dos recursos do cliente e do servidor
+class ResourceSampler:
+    """Sample the client process (CPU, RSS, threads, context switches) and, on the 'mongodb' backend, the serverStatus
+    and dbStats counters in a background thread, timestamping each sample with perf_counter_ns so that it lines up
+    with the start_ns of the per-operation metrics. The samples are saved to the RESOURCES_FOLDER of the execution.
+
+    The server is polled through its own single-connection client, so the sampling does not show up in the pool or
+    phase statistics of the run.
+
+    Args:
+        output_folder (str): The folder of the execution.
+        run (int): The run number.
+        database (Any, optional): The database of the run; None or a MemoryDatabase samples the client only. Defaults to None.
+        interval_ms (float, optional): The sampling interval, in milliseconds. Defaults to RESOURCE_SAMPLE_INTERVAL_MS.
+    """
+
+    def __init__(self, output_folder: str, run: int, database: Any = None, interval_ms: float = RESOURCE_SAMPLE_INTERVAL_MS) -> None:
+        folder = os.path.join(output_folder, RESOURCES_FOLDER)
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, f'run_{run + 1}.parquet' if pa is not None else f'run_{run + 1}.csv')
+        self.run = run + 1
+        self.interval = interval_ms / 1000
+        self.process = psutil.Process()
+        self.database_name = None if database is None or isinstance(database, MemoryDatabase) else database.name
+        self.server_client = None
+        self.stopped = threading.Event()
+        self.rows: List[Dict[str, Any]] = []
+
+    def _server_status(self) -> Dict[str, Any]:
+        """Read serverStatus with dbStats under the 'dbStats' key, or an empty document without a server."""
+        if self.server_client is None:
+            return {}
+        try:
+            status = self.server_client.admin.command('serverStatus')
+            status['dbStats'] = self.server_client[self.database_name].command('dbStats')
+            return status
+        except PyMongoError as e:
+            logging.warning(f"Run {self.run} - Server sampling disabled: {e}")
+            self.server_client.close()
+            self.server_client = None
+            return {}
+
+    def _sample(self, previous: Dict[str, Any]) -> Dict[str, Any]:
+        """Take a sample and record its deltas since the previous one."""
+        t_ns = time.perf_counter_ns()
+        system_cpu_percent = psutil.cpu_percent()
+        with self.process.oneshot():
+            switches = self.process.num_ctx_switches()
+            current = {
+                't_ns': t_ns,
+                'cpu_seconds': sum(self.process.cpu_times()[:2]),
+                'ctx_voluntary': switches.voluntary,
+                'ctx_involuntary': switches.involuntary,
+                'rss_mb': self.process.memory_info().rss / 1024 ** 2,
+                'threads': self.process.num_threads(),
+                'status': self._server_status(),
+            }
+        if previous:
+            elapsed = (t_ns - previous['t_ns']) / 1e9
+            row = {
+                't_ns': t_ns,
+                'run': self.run,
+                'process_cpu_percent': (current['cpu_seconds'] - previous['cpu_seconds']) / elapsed * 100,
+                'system_cpu_percent': system_cpu_percent,
+                'rss_mb': current['rss_mb'],
+                'threads': current['threads'],
+                'ctx_voluntary': current['ctx_voluntary'] - previous['ctx_voluntary'],
+                'ctx_involuntary': current['ctx_involuntary'] - previous['ctx_involuntary'],
+            }
+            if current['status'] and previous['status']:
+                for column, path in SERVER_COUNTERS.items():
+                    row[column] = status_value(current['status'], path) - status_value(previous['status'], path)
+                for column, path in SERVER_GAUGES.items():
+                    row[column] = status_value(current['status'], path)
+            self.rows.append(row)
+        return current
+
+    def _loop(self) -> None:
+        previous = self._sample({})
+        while not self.stopped.wait(self.interval):
+            previous = self._sample(previous)
+        self._sample(previous)
+
+    def start(self) -> None:
+        """Start sampling."""
+        if self.database_name is not None:
+            self.server_client = pymongo.MongoClient(f'mongodb://{USER}:{PASS}@{MONGO_HOST}', MONGO_PORT, maxPoolSize=1)
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> pd.DataFrame:
+        """Stop sampling, save the samples and log their peaks.
+
+        Returns:
+            pd.DataFrame: One row per sample.
+        """
+        self.stopped.set()
+        self.thread.join()
+        if self.server_client is not None:
+            self.server_client.close()
+        samples = pd.DataFrame(self.rows)
+        if samples.empty:
+            return samples
+        if pa is not None:
+            samples.to_parquet(self.path, index=False)
+        else:
+            samples.to_csv(self.path, index=False)
+        logging.info(f"Run {self.run} - Resources: process CPU max {samples['process_cpu_percent'].max():.1f}%, "
+                     f"system CPU max {samples['system_cpu_percent'].max():.1f}%, RSS max {samples['rss_mb'].max():.1f} MB, "
+                     f"context switches {int(samples['ctx_voluntary'].sum())} voluntary / {int(samples['ctx_involuntary'].sum())} involuntary")
+        if 'queue_readers' in samples:
+            logging.info(f"Run {self.run} - Server: queue max {samples['queue_readers'].max():.0f} readers / {samples['queue_writers'].max():.0f} writers, "
+                         f"pages evicted {samples['cache_evicted_unmodified'].sum() + samples['cache_evicted_modified'].sum():.0f}")
+        return samples
+
+    def __enter__(self) -> 'ResourceSampler':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+
+# Função para carregar as amostras de recursos
+def load_resources(path: str) -> pd.DataFrame:
+    """Load the resource samples saved by ResourceSampler.
+
+    Args:
+        path (str): An execution folder or a single sample file.
+
+    Returns:
+        pd.DataFrame: The samples ordered by run and time.
+    """
+    if os.path.isdir(os.path.join(path, RESOURCES_FOLDER)):
+        folder = os.path.join(path, RESOURCES_FOLDER)
+        files = [os.path.join(folder, name) for name in os.listdir(folder)]
+    else:
+        files = [path]
+    samples = pd.concat([pd.read_parquet(file) if file.endswith('.parquet') else pd.read_csv(file) for file in files], ignore_index=True)
+    return samples.sort_values(['run', 't_ns'], ignore_index=True)
+
+
+#########################
+# Métricas de latência #
+#########################
+
+# Configurar os histogramas de latência
+HISTOGRAM_SIGNIFICANT_DIGITS = 3
+HISTOGRAM_HIGHEST_MS = 60_000
+REPORT_PERCENTILES = [50, 90, 99, 99.9]
+READ_OPERATIONS = ['query_stock', 'low_stock', 'expiring_products']
+WRITE_OPERATIONS = ['update_inventory', 'add_store', 'add_product', 'reserve_stock']
+
+
+# Histograma de latências com memória constante (estilo HDR)
+class LatencyHistogram:
+    """Record latencies in log-linear buckets with constant memory, in the style of HdrHistogram.
+
+    Values are kept in microseconds with the requested number of significant digits, so percentiles are exact
+    within that precision no matter how many values are recorded. Histograms with the same settings can be merged.
+
+    Args:
+        significant_digits (int, optional): The number of significant decimal digits kept. Defaults to HISTOGRAM_SIGNIFICANT_DIGITS.
+        highest_ms (float, optional): The highest trackable value; larger values are clamped to it. Defaults to HISTOGRAM_HIGHEST_MS.
+    """
+
+    def __init__(self, significant_digits: int = HISTOGRAM_SIGNIFICANT_DIGITS, highest_ms: float = HISTOGRAM_HIGHEST_MS) -> None:
+        self.significant_digits = significant_digits
+        self.highest_ms = highest_ms
+        self.highest_us = int(highest_ms * 1000)
+        sub_bucket_count = 1 << int(np.ceil(np.log2(2 * 10 ** significant_digits)))
+        self.sub_bucket_half_count_magnitude = int(np.log2(sub_bucket_count)) - 1
+        self.sub_bucket_half_count = sub_bucket_count // 2
+        self.sub_bucket_mask = sub_bucket_count - 1
+        bucket_count = 1
+        while sub_bucket_count << (bucket_count - 1) <= self.highest_us:
+            bucket_count += 1
+        self.counts = np.zeros((bucket_count + 1) * self.sub_bucket_half_count, dtype=np.int64)
+        self.total_count = 0
+        self.total_us = 0
+        self.min_us = 0
+        self.max_us = 0
+
+    def _index(self, value_us: int) -> int:
+        """Get the counts index of a value."""
+        bucket_index = (value_us | self.sub_bucket_mask).bit_length() - (self.sub_bucket_half_count_magnitude + 1)
+        sub_bucket_index = value_us >> bucket_index
+        return ((bucket_index + 1) << self.sub_bucket_half_count_magnitude) + sub_bucket_index - self.sub_bucket_half_count
+
+    def _highest_equivalent_us(self, indexes: np.ndarray) -> np.ndarray:
+        """Get the highest value that falls in each counts index."""
+        bucket_indexes = (indexes >> self.sub_bucket_half_count_magnitude) - 1
+        sub_bucket_indexes = (indexes & (self.sub_bucket_half_count - 1)) + self.sub_bucket_half_count
+        first_bucket = bucket_indexes < 0
+        sub_bucket_indexes = np.where(first_bucket, sub_bucket_indexes - self.sub_bucket_half_count, sub_bucket_indexes)
+        bucket_indexes = np.where(first_bucket, 0, bucket_indexes)
+        return (sub_bucket_indexes << bucket_indexes) + (1 << bucket_indexes) - 1
+
+    def record(self, value_ms: float) -> None:
+        """Record a latency.
+
+        Args:
+            value_ms (float): The latency, in milliseconds.
+        """
+        value_us = min(max(0, int(round(value_ms * 1000))), self.highest_us)
+        self.counts[self._index(value_us)] += 1
+        self.min_us = value_us if self.total_count == 0 else min(self.min_us, value_us)
+        self.max_us = max(self.max_us, value_us)
+        self.total_count += 1
+        self.total_us += value_us
+
+    def merge(self, other: 'LatencyHistogram') -> 'LatencyHistogram':
+        """Add the values of another histogram with the same settings to this one.
+
+        Args:
+            other (LatencyHistogram): The histogram to merge.
+
+        Returns:
+            LatencyHistogram: This histogram.
+        """
+        if (other.significant_digits, other.highest_ms) != (self.significant_digits, self.highest_ms):
+            raise ValueError("Only histograms with the same significant digits and highest value can be merged.")
+        if other.total_count:
+            self.min_us = other.min_us if self.total_count == 0 else min(self.min_us, other.min_us)
+            self.max_us = max(self.max_us, other.max_us)
+        self.counts += other.counts
+        self.total_count += other.total_count
+        self.total_us += other.total_us
+        return self
+
+    def percentile(self, percentile: float) -> float:
+        """Get the latency at a percentile.
+
+        Args:
+            percentile (float): The percentile, between 0 and 100.
+
+        Returns:
+            float: The latency, in milliseconds (0 when nothing was recorded).
+        """
+        if self.total_count == 0:
+            return 0.0
+        target = max(1, int(np.ceil(percentile / 100 * self.total_count)))
+        index = int(np.searchsorted(np.cumsum(self.counts), target))
+        return min(int(self._highest_equivalent_us(np.array([index]))[0]), self.max_us) / 1000
+
+    def distribution(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the non-empty buckets of the histogram.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The highest latency of each bucket (ms) and its count.
+        """
+        indexes = np.flatnonzero(self.counts)
+        return self._highest_equivalent_us(indexes) / 1000, self.counts[indexes]
+
+    def summary(self) -> Dict[str, float]:
+        """Summarize the histogram.
+
+        Returns:
+            Dict[str, float]: The count, mean, min, REPORT_PERCENTILES and max (ms).
+        """
+        summary = {
+            'count': self.total_count,
+            'mean': self.total_us / self.total_count / 1000 if self.total_count else 0.0,
+            'min': self.min_us / 1000,
+        }
+        for percentile in REPORT_PERCENTILES:
+            summary[f'p{percentile:g}'] = self.percentile(percentile)
+        summary['max'] = self.max_us / 1000
+        return summary
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the histogram, keeping only the non-empty buckets (zlib-compressed, base64-encoded).
+
+        Returns:
+            Dict[str, Any]: The JSON-serializable histogram.
+        """
+        indexes = np.flatnonzero(self.counts)
+        buckets = np.stack([indexes, self.counts[indexes]]).astype(np.int64)
+        return {
+            'significant_digits': self.significant_digits,
+            'highest_ms': self.highest_ms,
+            'total_count': self.total_count,
+            'total_us': self.total_us,
+            'min_us': self.min_us,
+            'max_us': self.max_us,
+            'buckets': base64.b64encode(zlib.compress(buckets.tobytes())).decode('ascii'),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'LatencyHistogram':
+        """Rebuild a histogram serialized with to_dict.
+
+        Args:
+            data (Dict[str, Any]): The serialized histogram.
+
+        Returns:
+            LatencyHistogram: The histogram.
+        """
+        histogram = cls(data['significant_digits'], data['highest_ms'])
+        buckets = np.frombuffer(zlib.decompress(base64.b64decode(data['buckets'])), dtype=np.int64).reshape(2, -1)
+        histogram.counts[buckets[0]] = buckets[1]
+        histogram.total_count = data['total_count']
+        histogram.total_us = data['total_us']
+        histogram.min_us = data['min_us']
+        histogram.max_us = data['max_us']
+        return histogram
+
+
+# Registro de latências por operação e por thread
+class LatencyRecorder:
+    """Keep one LatencyHistogram per operation type and per thread, merged when the run ends.
+
+    Each thread writes only to its own histograms, so recording takes no lock.
+
+    Args:
+        sink (MetricsSink, optional): Also receives one record per operation. Defaults to None.
+    """
+
+    def __init__(self, sink: MetricsSink = None) -> None:
+        self.sink = sink
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.histograms: List[Tuple[str, LatencyHistogram]] = []
+
+    def record(self, operation: str, value_ms: float) -> None:
+        """Record a latency of an operation in the histogram of the calling thread.
+
+        Args:
+            operation (str): The operation type.
+            value_ms (float): The latency, in milliseconds.
+        """
+        histograms = getattr(self.local, 'histograms', None)
+        if histograms is None:
+            histograms = self.local.histograms = {}
+        if operation not in histograms:
+            histograms[operation] = LatencyHistogram()
+            with self.lock:
+                self.histograms.append((operation, histograms[operation]))
+        histograms[operation].record(value_ms)
+
+    def merged(self) -> Dict[str, LatencyHistogram]:
+        """Merge the histograms of all threads.
+
+        Returns:
+            Dict[str, LatencyHistogram]: One histogram per operation type.
+        """
+        merged: Dict[str, LatencyHistogram] = {}
+        with self.lock:
+            for operation, histogram in self.histograms:
+                merged.setdefault(operation, LatencyHistogram()).merge(histogram)
+        return merged
+
+
+# Função para executar uma operação registrando sua latência
+def run_recorded(recorder: LatencyRecorder, operation: str, function: Any, *args: Any, store_id: Any = None) -> Any:
+    """Run an operation and record the execution time it reports, in the calling thread.
+
+    The start recorded in the metrics sink is the one the operation took with operation_timer.start(), after generating its
+    documents, so that start_ns + duration_ns is the end of the operation, for successes and failures alike.
+
+    Args:
+        recorder (LatencyRecorder): The recorder of the run.
+        operation (str): The operation type.
+        function (Any): The operation function, which returns its execution time (or a tuple ending with it).
+        *args (Any): The arguments of the operation.
+        store_id (Any, optional): The store the operation targets, for the metrics sink. Defaults to None.
+
+    Returns:
+        Any: The result of the operation.
+    """
+    operation_timer.local.start_ns = 0
+    call_ns = time.perf_counter_ns()
+    try:
+        result = function(*args)
+    except Exception as e:
+        if recorder.sink is not None:
+            start_ns = operation_timer.local.start_ns or call_ns
+            recorder.sink.record(operation, store_id, start_ns, time.perf_counter_ns() - start_ns, type(e).__name__)
+        raise
+    elapsed = result[-1] if isinstance(result, tuple) else result
+    recorder.record(operation, elapsed * 1000)  # Convert to milliseconds
+    if recorder.sink is not None:
+        recorder.sink.record(operation, store_id, operation_timer.local.start_ns or call_ns, int(elapsed * 1e9))
+    return result
+
+
+# Função para combinar histogramas por tipo de acesso
+def combine_histograms(histograms: Dict[str, LatencyHistogram], operations: List[str]) -> LatencyHistogram:
+    """Merge the histograms of some operation types, e.g. all the writes.
+
+    Args:
+        histograms (Dict[str, LatencyHistogram]): The histograms by operation type.
+        operations (List[str]): The operation types to combine.
+
+    Returns:
+        LatencyHistogram: The combined histogram.
+    """
+    combined = LatencyHistogram()
+    for operation in operations:
+        if operation in histograms:
+            combined.merge(histograms[operation])
+    return combined
+
+
+# Função para registrar os percentis de latência
+def log_latency_summary(histograms: Dict[str, LatencyHistogram], prefix: str) -> None:
+    """Log the latency percentiles of each operation type.
+
+    Args:
+        histograms (Dict[str, LatencyHistogram]): The histograms by operation type.
+        prefix (str): The prefix of each log line (e.g. 'Run 1').
+    """
+    for operation, histogram in sorted(histograms.items()):
+        summary = histogram.summary()
+        percentiles = ', '.join(f"p{percentile:g} {summary[f'p{percentile:g}']:.4f} ms" for percentile in REPORT_PERCENTILES)
+        logging.info(f"{prefix} - {operation} latency: count {summary['count']}, mean {summary['mean']:.4f} ms, {percentiles}, max {summary['max']:.4f} ms")
+
+
+# Função para salvar histogramas em arquivo
+def save_histograms(histograms: Dict[str, LatencyHistogram], path: str) -> None:
+    """Save histograms by operation type as JSON.
+
+    Args:
+        histograms (Dict[str, LatencyHistogram]): The histograms by operation type.
+        path (str): The JSON file path.
+    """
+    with open(path, 'w') as file:
+        json.dump({operation: histogram.to_dict() for operation, histogram in histograms.items()}, file)
+
+
+# Função para carregar histogramas de arquivo
+def load_histograms(path: str) -> Dict[str, LatencyHistogram]:
+    """Load histograms saved with save_histograms.
+
+    Args:
+        path (str): The JSON file path.
+
+    Returns:
+        Dict[str, LatencyHistogram]: The histograms by operation type.
+    """
+    with open(path) as file:
+        return {operation: LatencyHistogram.from_dict(data) for operation, data in json.load(file).items()}
+
+
+###################
+# Instrumentação #
+###################
+
+# Fases de cada operação
+PHASES = ['generation', 'serialization', 'round_trip', 'decode']
+
+
+# Cronômetro das operações, dividido em fases
+class OperationTimer(monitoring.CommandListener):
+    """Time operations with perf_counter_ns and split them into phases.
+
+    The phases are document generation (measured by the operation), driver serialization (call start to the first
+    command started event, including the pool checkout), server round trip (the durations reported by the command
+    monitoring events) and result decode (the remainder: reply decoding and cursor materialization). Command events
+    are published on the calling thread, so the state of each operation is thread-local. Only sums are kept.
+    """
+
+    def __init__(self) -> None:
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """Reset the phase sums."""
+        with self.lock:
+            self.totals: Dict[str, List[int]] = {}
+
+    def start(self) -> int:
+        """Start timing an operation on the calling thread, after its documents were generated.
+
+        Returns:
+            int: The start time, in nanoseconds, also kept as the thread's start_ns for run_recorded.
+        """
+        self.local.active = True
+        self.local.first_started_ns = 0
+        self.local.round_trip_ns = 0
+        self.local.start_ns = time.perf_counter_ns()
+        return self.local.start_ns
+
+    def stop(self, operation: str, start_ns: int, generation_ns: int = 0) -> float:
+        """Stop timing an operation and add its phases to the sums.
+
+        Args:
+            operation (str): The operation type.
+            start_ns (int): The start time returned by start().
+            generation_ns (int, optional): The time spent generating the documents, in nanoseconds. Defaults to 0.
+
+        Returns:
+            float: The execution time of the operation, without the generation, in seconds.
+        """
+        end_ns = time.perf_counter_ns()
+        self.local.active = False
+        total_ns = end_ns - start_ns
+        serialization_ns = self.local.first_started_ns - start_ns if self.local.first_started_ns else 0
+        round_trip_ns = self.local.round_trip_ns
+        decode_ns = max(0, total_ns - serialization_ns - round_trip_ns)
+        with self.lock:
+            totals = self.totals.setdefault(operation, [0] * (len(PHASES) + 1))
+            totals[0] += 1
+            totals[1] += generation_ns
+            totals[2] += serialization_ns
+            totals[3] += round_trip_ns
+            totals[4] += decode_ns
+        return total_ns / 1e9
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Get the mean time of each phase by operation type.
+
+        Returns:
+            Dict[str, Dict[str, float]]: The mean of each phase (ms) by operation type.
+        """
+        with self.lock:
+            return {
+                operation: {phase: totals[index + 1] / totals[0] / 1e6 for index, phase in enumerate(PHASES)}
+                for operation, totals in self.totals.items() if totals[0]
+            }
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        if getattr(self.local, 'active', False) and not self.local.first_started_ns:
+            self.local.first_started_ns = time.perf_counter_ns()
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        if getattr(self.local, 'active', False):
+            self.local.round_trip_ns += event.duration_micros * 1000
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        if getattr(self.local, 'active', False):
+            self.local.round_trip_ns += event.duration_micros * 1000
+
+
+operation_timer = OperationTimer()
+
+
+# Função para registrar a divisão do tempo das operações em fases
+def log_phase_summary(prefix: str) -> None:
+    """Log the mean time of each phase by operation type.
+
+    Args:
+        prefix (str): The prefix of each log line (e.g. 'Run 1').
+    """
+    for operation, phases in sorted(operation_timer.summary().items()):
+        breakdown = ', '.join(f"{phase} {value:.4f} ms" for phase, value in phases.items())
+        logging.info(f"{prefix} - {operation} phases: {breakdown}")
+
+
+##############
+# Simulações #
+##############
+
+# Operações submetidas e ainda não consumidas, por thread do pool
+SUBMIT_WINDOW_PER_WORKER = 4
+
+
+# Obter o número de núcleos do processador
+def get_num_cores() -> int:
+    """Get the number of CPU cores available on the machine.
+
+    Returns:
+        int: The number of CPU cores.
+    """
+    return multiprocessing.cpu_count()
+
+
+# Simular consultas simultâneas
+def simulate_operations(num_operations: int, stores: List[Dict[str, Any]], percent_cores: float, run_number: int, output_folder: str, recorder: LatencyRecorder = None, keep_raw_times: bool = False) -> Tuple[List[float], List[float], Dict[str, int]]:
+    """Simulate concurrent operations on the database.
+
+    At most SUBMIT_WINDOW_PER_WORKER operations per thread are submitted ahead of the ones consumed, and each result is
+    dropped once counted, so memory stays constant however many operations are run.
+
+    Args:
+        num_operations (int): The number of operations to simulate.
+        stores (List[Dict[str, Any]]): A list of stores to use in the simulation.
+        percent_cores (float): The percentage of CPU cores to use for the simulation.
+        recorder (LatencyRecorder, optional): Records the latency of each operation in per-thread histograms. Defaults to None.
+        keep_raw_times (bool, optional): Whether to keep every time in the returned lists (and save them for the reports); memory then grows with the operations. Defaults to False.
+
+    Returns:
+        Tuple[List[float], List[float], Dict[str, int]]: Lists of read and write times, and a count of each operation type.
+    """
+    num_cores = get_num_cores()
+    max_workers = max(1, int(num_cores * percent_cores))
+    logging.info(f"Number of cores to be used: {max_workers}")
+    recorder = recorder or LatencyRecorder()
+
+    read_times: List[float] = []
+    write_times: List[float] = []
+    operation_counts: Dict[str, int] = dict.fromkeys(OPERATIONS, 0)
+
+    window = max_workers * SUBMIT_WINDOW_PER_WORKER
+    pending: Dict[Any, str] = {}
+
+    def consume(done: Any) -> None:
+        for future in done:
+            operation = pending.pop(future)
+            try:
+                result = future.result()
+                if operation in READ_OPERATIONS:
+                    if keep_raw_times:
+                        read_times.append(result[1] * 1000)  # Convert to milliseconds
+                else:
+                    if keep_raw_times:
+                        write_times.append(result * 1000)  # Convert to milliseconds
+                operation_counts[operation] += 1
+            except Exception as e:
+                logging.error(e)
+            progress.update(1)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor, tqdm(total=num_operations, desc=f"Operations Progress {run_number}") as progress:
+        for _ in range(num_operations):
+            if len(pending) >= window:
+                consume(wait(pending, return_when=FIRST_COMPLETED).done)
+            store = pick_store(stores)
+            operation = pick_operation()
+            if operation == 'query_stock':
+                future = executor.submit(run_recorded, recorder, operation, query_stock, store['store_id'], store_id=store['store_id'])
+            elif operation == 'update_inventory':
+                product = pick_product(store['products'])
+                future = executor.submit(run_recorded, recorder, operation, update_inventory, store['store_id'], product['product_id'], random.randint(1, 10), store_id=store['store_id'])
+            elif operation == 'add_store':
+                future = executor.submit(run_recorded, recorder, operation, add_store)
+            elif operation == 'add_product':
+                future = executor.submit(run_recorded, recorder, operation, add_product, store['store_id'], store.get('region'), store_id=store['store_id'])
+            elif operation in ALERT_OPERATIONS:
+                future = executor.submit(run_recorded, recorder, operation, ALERT_OPERATIONS[operation], store['store_id'], store_id=store['store_id'])
+            pending[future] = operation
+        consume(wait(pending).done)
+
+    # Save the raw times for the reports
+    if keep_raw_times:
+        save_raw_times(run_number, read_times, write_times, output_folder)
+
+    return read_times, write_times, operation_counts
+
+
+###########################
+# Simulações assíncronas #
+###########################
+
+# Configurar o motor de simulação assíncrono
+ENGINES = ['threads', 'asyncio']
+ENGINE = 'threads'
+ASYNC_BACKENDS = ['motor', 'memory']
+ASYNC_BACKEND = 'motor'
+ASYNC_CONCURRENCY = 1000
+
+async_db = None
+
+
+# Função para abrir o banco assíncrono
+def open_async_db(backend: str, concurrency: int) -> Any:
+    """Open the async database used by the asyncio engine; must be called inside the running event loop.
+
+    Args:
+        backend (str): 'motor' for a real mongod, or 'memory' for the in-process stand-in over the bound MemoryDatabase.
+        concurrency (int): The in-flight operation limit, used as the motor pool size.
+
+    Returns:
+        Any: The async database.
+    """
+    if backend == 'memory':
+        if not isinstance(db, MemoryDatabase):
+            raise ValueError("The 'memory' async backend needs the collections bound to a MemoryDatabase.")
+        return AsyncMemoryDatabase(db)
+    if AsyncIOMotorClient is None:
+        raise ImportError("The 'motor' async backend needs the motor package (pip install motor).")
+    async_client = AsyncIOMotorClient(f'mongodb://{USER}:{PASS}@{MONGO_HOST}', MONGO_PORT, maxPoolSize=concurrency)
+    return async_client[DB_NAME]
+
+
+# Função assíncrona para consultar estoque
+async def query_stock_async(store_id: str) -> Tuple[List[Dict[str, Any]], float]:
+    """Query the stock of a specific store with the async database.
+
+    Args:
+        store_id (str): The ID of the store to query.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], float]: A list of products in the store and the query execution time.
+    """
+    collection, query, projection = stock_query(store_id, query_mode)
+    start_time = time.perf_counter_ns()
+    if stock_cache is not None:
+        cached = stock_cache.get(store_id)
+        if cached is not None:
+            return cached, (time.perf_counter_ns() - start_time) / 1e9
+        version = stock_cache.version(store_id)
+    if storage_layout == 'embedded':
+        store = await async_db[collection.name].find_one(query, projection)
+        result = store['products'] if store else []
+    else:
+        result = await async_db[collection.name].find(query, projection, batch_size=query_batch_size).to_list(length=None)
+    if stock_cache is not None:
+        stock_cache.put(store_id, result, version)
+    return result, (time.perf_counter_ns() - start_time) / 1e9
+
+
+# Função assíncrona para atualizar inventário
+async def update_inventory_async(store_id: str, product_id: str, quantity: int) -> float:
+    """Update the inventory of a specific product in a store with the async database.
+
+    Args:
+        store_id (str): The ID of the store.
+        product_id (str): The ID of the product.
+        quantity (int): The quantity to update the stock by.
+
+    Returns:
+        float: The execution time of the update operation.
+    """
+    collection, query, update = stock_update(store_id, product_id, quantity)
+    start_time = time.perf_counter_ns()
+    result = await async_db[collection.name].update_one(query, update)
+    if stock_cache is not None and result.matched_count:
+        stock_cache.patch_stock(store_id, product_id, quantity)
+    return (time.perf_counter_ns() - start_time) / 1e9
+
+
+# Função assíncrona para adicionar uma nova filial
+async def add_store_async() -> float:
+    """Add a new store with the async database.
+
+    Returns:
+        float: The execution time of the insert operation.
+    """
+    store = generate_fake_store(*new_store_products)
+    if storage_layout != 'embedded':
+        summary, products = split_store(store)
+    start_time = time.perf_counter_ns()
+    if storage_layout == 'embedded':
+        await async_db['stores'].insert_one(store)
+    else:
+        await async_db['stores'].insert_one(summary)
+        await async_db['products'].insert_many(products)
+    return (time.perf_counter_ns() - start_time) / 1e9
+
+
+# Função assíncrona para adicionar um novo produto
+async def add_product_async(store_id: str, region: str = None) -> float:
+    """Add a new product to a store with the async database.
+
+    Args:
+        store_id (str): The ID of the store to add the product to.
+        region (str, optional): The region of the store, copied to the product row. Defaults to None.
+
+    Returns:
+        float: The execution time of the insert operation.
+    """
+    new_product = generate_fake_product()
+    start_time = time.perf_counter_ns()
+    if storage_layout == 'embedded':
+        await async_db['stores'].update_one({'store_id': store_id}, {'$push': {'products': new_product}})
+    else:
+        await async_db['products'].insert_one({**new_product, 'store_id': store_id, 'region': region})
+        await async_db['stores'].update_one(
+            {'store_id': store_id},
+            {'$push': {'product_ids': new_product['product_id']}, '$inc': {'product_count': 1}}
+        )
+    if stock_cache is not None:
+        stock_cache.add_product(store_id, {**new_product, 'store_id': store_id, 'region': region})
+    return (time.perf_counter_ns() - start_time) / 1e9
+
+
+# Função assíncrona para consultar um alerta de reposição
+async def query_alert_async(alert: str, store_id: str) -> Tuple[List[Dict[str, Any]], float]:
+    """Query the products of a store that raise a replenishment alert with the async database.
+
+    Args:
+        alert (str): The alert, a key of ALERT_OPERATIONS.
+        store_id (str): The ID of the store.
+
+    Returns:
+        Tuple[List[Dict[str, Any]], float]: The products raising the alert and the query execution time.
+    """
+    condition = alert_filter(alert)
+    start_time = time.perf_counter_ns()
+    if storage_layout == 'embedded':
+        store = await async_db['stores'].find_one({'store_id': store_id}, {'products': 1})
+        result = [product for product in (store['products'] if store else []) if match_document(product, condition)[0]]
+    else:
+        projection = {'_id': 0, **dict.fromkeys(ALERT_FIELDS, 1)}
+        result = await async_db['products'].find({'store_id': store_id, **condition}, projection, batch_size=query_batch_size).to_list(length=None)
+    return result, (time.perf_counter_ns() - start_time) / 1e9
+
+
+# Executar a carga de operações no laço de eventos
+async def run_operations_async(num_operations: int, stores: List[Dict[str, Any]], concurrency: int, run_number: int, backend: str, recorder: LatencyRecorder, keep_raw_times: bool) -> Tuple[List[float], List[float], Dict[str, int]]:
+    """Run the operation mix on the event loop, keeping at most `concurrency` operations in flight.
+
+    Args:
+        num_operations (int): The number of operations to simulate.
+        stores (List[Dict[str, Any]]): A list of stores to use in the simulation.
+        concurrency (int): The maximum number of operations in flight.
+        run_number (int): The number of the run, shown in the progress bar.
+        backend (str): The async backend, one of ASYNC_BACKENDS.
+        recorder (LatencyRecorder): Records the latency of each operation.
+        keep_raw_times (bool): Whether to keep every time in the returned lists.
+
+    Returns:
+        Tuple[List[float], List[float], Dict[str, int]]: Lists of read and write times, and a count of each operation type.
+    """
+    global async_db
+    async_db = open_async_db(backend, concurrency)
+
+    read_times: List[float] = []
+    write_times: List[float] = []
+    operation_counts: Dict[str, int] = dict.fromkeys(OPERATIONS, 0)
+    pending_operations = iter(range(num_operations))
+    progress = tqdm(total=num_operations, desc=f"Async Operations Progress {run_number}")
+
+    async def worker() -> None:
+        for _ in pending_operations:
+            store = pick_store(stores)
+            operation = pick_operation()
+            store_id = None if operation == 'add_store' else store['store_id']
+            start_ns = time.perf_counter_ns()
+            try:
+                if operation in READ_OPERATIONS:
+                    if operation == 'query_stock':
+                        _, elapsed = await query_stock_async(store['store_id'])
+                    else:
+                        _, elapsed = await query_alert_async(operation, store['store_id'])
+                    if keep_raw_times:
+                        read_times.append(elapsed * 1000)  # Convert to milliseconds
+                else:
+                    if operation == 'update_inventory':
+                        product = pick_product(store['products'])
+                        elapsed = await update_inventory_async(store['store_id'], product['product_id'], random.randint(1, 10))
+                    elif operation == 'add_store':
+                        elapsed = await add_store_async()
+                    else:
+                        elapsed = await add_product_async(store['store_id'], store.get('region'))
+                    if keep_raw_times:
+                        write_times.append(elapsed * 1000)  # Convert to milliseconds
+                recorder.record(operation, elapsed * 1000)
+                if recorder.sink is not None:
+                    # O início registrado exclui a geração dos documentos, como em run_recorded
+                    recorder.sink.record(operation, store_id, time.perf_counter_ns() - int(elapsed * 1e9), int(elapsed * 1e9))
+                operation_counts[operation] += 1
+            except Exception as e:
+                if recorder.sink is not None:
+                    recorder.sink.record(operation, store_id, start_ns, time.perf_counter_ns() - start_ns, type(e).__name__)
+                logging.error(e)
+            progress.update(1)
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, num_operations)))))
+    finally:
+        progress.close()
+        if backend == 'motor':
+            async_db.client.close()
+    return read_times, write_times, operation_counts
+
+
+# Simular operações simultâneas com asyncio
+def simulate_operations_async(num_operations: int, stores: List[Dict[str, Any]], concurrency: int, run_number: int, output_folder: str, backend: str = ASYNC_BACKEND, recorder: LatencyRecorder = None, keep_raw_times: bool = False) -> Tuple[List[float], List[float], Dict[str, int]]:
+    """Simulate concurrent operations with the asyncio engine, whose concurrency is not tied to the core count.
+
+    Args:
+        num_operations (int): The number of operations to simulate.
+        stores (List[Dict[str, Any]]): A list of stores to use in the simulation.
+        concurrency (int): The maximum number of operations in flight.
+        run_number (int): The number of the run.
+        output_folder (str): The folder where the run charts are saved.
+        backend (str, optional): The async backend, one of ASYNC_BACKENDS. Defaults to ASYNC_BACKEND.
+        recorder (LatencyRecorder, optional): Records the latency of each operation. Defaults to None.
+        keep_raw_times (bool, optional): Whether to keep every time in the returned lists (and save them for the reports). Defaults to False.
+
+    Returns:
+        Tuple[List[float], List[float], Dict[str, int]]: Lists of read and write times, and a count of each operation type.
+    """
+    if backend not in ASYNC_BACKENDS:
+        raise ValueError(f"Unknown async backend '{backend}', expected one of {ASYNC_BACKENDS}.")
+    logging.info(f"Async concurrency limit: {concurrency} ({backend})")
+    recorder = recorder or LatencyRecorder()
+    read_times, write_times, operation_counts = asyncio.run(run_operations_async(num_operations, stores, concurrency, run_number, backend, recorder, keep_raw_times))
+
+    # Save the raw times for the reports
+    if keep_raw_times:
+        save_raw_times(run_number, read_times, write_times, output_folder)
+
+    return read_times, write_times, operation_counts
+
+
+###########################
+# Carga em malha aberta #
+###########################
+
+# Configurar a carga em malha aberta
+ARRIVALS = ['constant', 'poisson', 'step']
+ARRIVAL = 'poisson'
+RAMP_STEPS = 5
+
+
+# Função para executar uma operação sorteada
+def execute_operation(operation: str, store: Dict[str, Any]) -> None:
+    """Execute one operation of the simulation mix against a store.
+
+    Args:
+        operation (str): The operation name.
+        store (Dict[str, Any]): The store the operation is about.
+    """
+    if operation == 'query_stock':
+        query_stock(store['store_id'])
+    elif operation == 'update_inventory':
+        product = pick_product(store['products'])
+        update_inventory(store['store_id'], product['product_id'], random.randint(1, 10))
+    elif operation == 'add_store':
+        add_store()
+    elif operation == 'add_product':
+        add_product(store['store_id'], store.get('region'))
+    elif operation in ALERT_OPERATIONS:
+        ALERT_OPERATIONS[operation](store['store_id'])
+
+
+# Função para calcular os instantes de chegada das operações
+def arrival_schedule(num_operations: int, rate: float, arrival: str = ARRIVAL, ramp_steps: int = RAMP_STEPS, seed: int = GENERATOR_SEED) -> np.ndarray:
+    """Compute when each operation should start, relative to the start of the run.
+
+    Args:
+        num_operations (int): The number of operations.
+        rate (float): The target arrival rate (ops/s); for 'step' it is the rate of the last step.
+        arrival (str, optional): 'constant' spacing, 'poisson' (exponential gaps) or 'step' (ramp up to the rate). Defaults to ARRIVAL.
+        ramp_steps (int, optional): The number of steps of the 'step' ramp. Defaults to RAMP_STEPS.
+        seed (int, optional): The seed of the Poisson gaps. Defaults to GENERATOR_SEED.
+
+    Returns:
+        np.ndarray: The intended start offsets, in seconds.
+    """
+    if arrival == 'constant':
+        return np.arange(num_operations) / rate
+    if arrival == 'poisson':
+        gaps = np.random.default_rng(seed).exponential(1 / rate, num_operations)
+        return np.concatenate(([0.0], np.cumsum(gaps)[:-1]))
+    if arrival == 'step':
+        step_sizes = np.diff(np.linspace(0, num_operations, ramp_steps + 1).astype(int))
+        gaps = np.concatenate([np.full(size, ramp_steps / (rate * (step + 1))) for step, size in enumerate(step_sizes)])
+        return np.concatenate(([0.0], np.cumsum(gaps)[:-1]))
+    raise ValueError(f"Unknown arrival '{arrival}', expected one of {ARRIVALS}.")
+
+
+# Simular operações em malha aberta, com taxa de chegada controlada
+def simulate_open_loop(num_operations: int, stores: List[Dict[str, Any]], rate: float, max_workers: int, arrival: str = ARRIVAL, run_number: int = 0) -> Dict[str, float]:
+    """Issue operations at a target arrival rate, regardless of how fast earlier ones complete.
+
+    Latency is measured from the intended start time, so queueing caused by a saturated system is
+    counted (coordinated omission correction); the service time from the actual start is kept as well.
+
+    Args:
+        num_operations (int): The number of operations to issue.
+        stores (List[Dict[str, Any]]): A list of stores to use in the simulation.
+        rate (float): The target arrival rate (ops/s).
+        max_workers (int): The number of threads serving the operations.
+        arrival (str, optional): The arrival process, one of ARRIVALS. Defaults to ARRIVAL.
+        run_number (int, optional): The number of the run, shown in the progress bar. Defaults to 0.
+
+    Returns:
+        Dict[str, float]: Target and achieved throughput, corrected and service latency percentiles (ms), and the mean start lag (ms).
+    """
+    offsets = arrival_schedule(num_operations, rate, arrival)
+    actual_starts = np.zeros(num_operations)
+    ends = np.zeros(num_operations)
+    failures = 0
+
+    def timed_operation(index: int, operation: str, store: Dict[str, Any]) -> None:
+        actual_starts[index] = time.perf_counter()
+        try:
+            execute_operation(operation, store)
+        finally:
+            ends[index] = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = []
+        base_time = time.perf_counter()
+        for index, offset in enumerate(tqdm(offsets, desc=f"Open Loop Progress {run_number} ({rate:g} ops/s)")):
+            delay = base_time + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            operation = pick_operation()
+            futures.append(executor.submit(timed_operation, index, operation, pick_store(stores)))
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                failures += 1
+                logging.error(e)
+
+    intended_starts = base_time + offsets
+    corrected = (ends - intended_starts) * 1000  # Convert to milliseconds
+    service = (ends - actual_starts) * 1000
+    duration = ends.max() - base_time
+    return {
+        'target_rate': rate,
+        'achieved_rate': num_operations / duration if duration > 0 else 0.0,
+        'p50_ms': float(np.percentile(corrected, 50)),
+        'p90_ms': float(np.percentile(corrected, 90)),
+        'p99_ms': float(np.percentile(corrected, 99)),
+        'max_ms': float(corrected.max()),
+        'service_p50_ms': float(np.percentile(service, 50)),
+        'service_p99_ms': float(np.percentile(service, 99)),
+        'start_lag_ms': float(((actual_starts - intended_starts) * 1000).mean()),
+        'failures': failures,
+    }
+
+
+# Medir a curva de vazão x latência
+def measure_capacity_curve(rates: List[float], operations_per_rate: int = 1000, arrival: str = ARRIVAL, percent_cores: float = 0.5, num_sales: int = 50, num_stores: int = 5, min_products: int = 5, max_products: int = 20, chart_width: int = 600) -> pd.DataFrame:
+    """Run the open-loop workload at increasing target rates and build the throughput-latency curve.
+
+    Args:
+        rates (List[float]): The target arrival rates (ops/s).
+        operations_per_rate (int, optional): The number of operations issued at each rate. Defaults to 1000.
+        arrival (str, optional): The arrival process, one of ARRIVALS. Defaults to ARRIVAL.
+        percent_cores (float, optional): The percentage of CPU cores used as serving threads. Defaults to 0.5.
+        num_sales (int, optional): The number of sales seeded before the runs. Defaults to 50.
+        num_stores (int, optional): The number of stores seeded before the runs. Defaults to 5.
+        min_products (int, optional): The minimum number of products in a store. Defaults to 5.
+        max_products (int, optional): The maximum number of products in a store. Defaults to 20.
+        chart_width (int, optional): The chart width, in pixels. Defaults to 600.
+
+    Returns:
+        pd.DataFrame: One row per target rate, with the achieved throughput and latency percentiles.
+    """
+    max_workers = max(1, int(get_num_cores() * percent_cores))
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_folder = os.path.join("executions", f"{timestamp}_capacity")
+    os.makedirs(output_folder, exist_ok=True)
+    logging.info(f"Starting capacity curve ({arrival}) at {rates} ops/s with {operations_per_rate} operations per rate and {max_workers} threads.")
+
+    stores = insert_stores(num_stores, min_products, max_products)
+    insert_sales(num_sales, stores)
+    rows = []
+    for run, rate in enumerate(rates):
+        row = simulate_open_loop(operations_per_rate, stores, rate, max_workers, arrival, run)
+        rows.append(row)
+        logging.info(f"Rate {rate:g} ops/s - achieved {row['achieved_rate']:.2f} ops/s, p50 {row['p50_ms']:.4f} ms, "
+                     f"p99 {row['p99_ms']:.4f} ms, service p99 {row['service_p99_ms']:.4f} ms, start lag {row['start_lag_ms']:.4f} ms")
+
+    curve = pd.DataFrame(rows)
+    curve.to_csv(os.path.join(output_folder, 'capacity_curve.csv'), index=False)
+
+    # Throughput-latency curve
+    plt.figure(figsize=(chart_width / 100, 6))
+    plt.plot(curve['achieved_rate'], curve['p50_ms'], marker='o', label='p50')
+    plt.plot(curve['achieved_rate'], curve['p99_ms'], marker='o', label='p99')
+    plt.plot(curve['achieved_rate'], curve['service_p99_ms'], marker='x', linestyle='--', label='p99 (service only)')
+    plt.title(f'Throughput vs Latency ({arrival} arrivals)')
+    plt.xlabel('Achieved Throughput (ops/s)')
+    plt.ylabel('Time (ms)')
+    plt.legend()
+    plt.savefig(os.path.join(output_folder, 'capacity_curve.png'))
+    plt.close()
+    return curve
+
+
+####################
+# Particionamento #
+####################
+
+# Chaves de shard de cada estratégia de particionamento, por coleção
+PARTITION_STRATEGIES: Dict[str, Dict[str, Dict[str, Any]]] = {
+    'hashed': {'stores': {'store_id': 'hashed'}, 'products': {'store_id': 'hashed'}, 'sales': {'store_id': 'hashed'}},
+    'ranged': {'stores': {'store_id': 1}, 'products': {'store_id': 1}, 'sales': {'store_id': 1}},
+    'zone': {'stores': {'region': 1, 'store_id': 1}, 'products': {'region': 1, 'store_id': 1}, 'sales': {'store_id': 'hashed'}},
+    'compound': {'stores': {'store_id': 1}, 'products': {'store_id': 1, 'category': 1}, 'sales': {'store_id': 'hashed'}},
+}
+PARTITION_STRATEGY = 'hashed'
+PARTITION_BACKENDS = ['memory', 'mongos']
+NUM_PARTITIONS = 4
+PARTITION_DB_NAME = 'inventory_partitioning'
+
+# Maior valor de chave ao buscar todos os intervalos de um prefixo
+MAX_KEY_VALUE = '\U0010ffff'
+
+# Operações do roteador contadas como leitura e como escrita
+ROUTER_READS = ['find', 'find_one', 'count']
+ROUTER_WRITES = ['insert', 'update']
+
+
+# Roteador de operações entre partições
+class PartitionRouter:
+    """Route documents and queries to partitions following the shard keys of a partition strategy.
+
+    Hashed keys place a document by an MD5 of the first key field, zone keys place each region on its own partition,
+    and ranged keys follow split points that split() recomputes from the data, like the balancer splitting chunks.
+    A query that does not fix the hashed field, the region or a prefix of the ranged key is broadcast to every partition.
+
+    Args:
+        strategy (str, optional): The partition strategy, a key of PARTITION_STRATEGIES. Defaults to PARTITION_STRATEGY.
+        num_partitions (int, optional): The number of partitions. Defaults to NUM_PARTITIONS.
+    """
+
+    def __init__(self, strategy: str = PARTITION_STRATEGY, num_partitions: int = NUM_PARTITIONS) -> None:
+        if strategy not in PARTITION_STRATEGIES:
+            raise ValueError(f"Unknown partition strategy '{strategy}', expected one of {list(PARTITION_STRATEGIES)}.")
+        self.strategy = strategy
+        self.num_partitions = num_partitions
+        self.shard_keys = PARTITION_STRATEGIES[strategy]
+        self.boundaries: Dict[str, List[Tuple[str, ...]]] = defaultdict(list)
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """Reset the per-partition load and the fan-out counters."""
+        with self.lock:
+            self.load = np.zeros(self.num_partitions, dtype=np.int64)
+            self.operations: Dict[str, int] = defaultdict(int)
+            self.visits: Dict[str, int] = defaultdict(int)
+
+    def key(self, collection: str, document: Dict[str, Any]) -> Tuple[Any, ...]:
+        """Extract the shard key of a document or of an equality query, with None for the fields it does not fix."""
+        return tuple(value if isinstance(value := document.get(field), str) else None for field in self.shard_keys.get(collection, {}))
+
+    def _hash(self, value: str) -> int:
+        """Place a value on a partition by its MD5."""
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big') % self.num_partitions
+
+    def targets(self, collection: str, document: Dict[str, Any]) -> List[int]:
+        """Get the partitions a document lives on, or that a query has to visit.
+
+        Args:
+            collection (str): The collection name.
+            document (Dict[str, Any]): The document, or the query filter.
+
+        Returns:
+            List[int]: The partitions, in order.
+        """
+        spec = self.shard_keys.get(collection)
+        if not spec:
+            return [0]  # Coleções sem chave de shard ficam na partição primária
+        everywhere = list(range(self.num_partitions))
+        fields = list(spec)
+        key = self.key(collection, document)
+        if spec[fields[0]] == 'hashed':
+            return [self._hash(key[0])] if key[0] is not None else everywhere
+        if fields[0] == 'region':
+            return [REGIONS.index(key[0]) % self.num_partitions] if key[0] in REGIONS else everywhere
+        prefix = tuple(itertools.takewhile(lambda value: value is not None, key))
+        if not prefix:
+            return everywhere
+        with self.lock:
+            boundaries = self.boundaries[collection]
+            first = bisect.bisect_right(boundaries, prefix)
+            last = first if len(prefix) == len(key) else bisect.bisect_right(boundaries, prefix + (MAX_KEY_VALUE,))
+        return list(range(first, last + 1))
+
+    def split(self, collection: str, keys: List[Tuple[Any, ...]]) -> None:
+        """Recompute the split points of a ranged collection so that each partition holds the same number of documents.
+
+        Args:
+            collection (str): The collection name.
+            keys (List[Tuple[Any, ...]]): The shard keys of the documents of the collection.
+        """
+        spec = self.shard_keys.get(collection)
+        if not spec or 'hashed' in spec.values() or 'region' in spec or not keys:
+            return
+        keys = sorted(tuple(value or '' for value in key) for key in keys)
+        boundaries = sorted({keys[len(keys) * index // self.num_partitions] for index in range(1, self.num_partitions)})
+        with self.lock:
+            self.boundaries[collection] = boundaries
+
+    def record(self, operation: str, partitions: List[int]) -> None:
+        """Count an operation and the partitions it visited.
+
+        Args:
+            operation (str): The operation kind (find, find_one, count, aggregate, insert or update).
+            partitions (List[int]): The partitions visited.
+        """
+        with self.lock:
+            self.load[partitions] += 1
+            self.operations[operation] += 1
+            self.visits[operation] += len(partitions)
+
+    def fan_out(self, operations: List[str]) -> float:
+        """Get the average number of partitions visited by some kinds of operation.
+
+        Args:
+            operations (List[str]): The operation kinds.
+
+        Returns:
+            float: The average fan-out, or 0 when none ran.
+        """
+        with self.lock:
+            count = sum(self.operations[operation] for operation in operations)
+            return sum(self.visits[operation] for operation in operations) / count if count else 0.0
+
+
+# Coleção particionada em memória
+class PartitionedCollection(MemoryCollection):
+    """In-memory collection split over the partitions of a PartitionedDatabase, routing each call through the router.
+
+    Args:
+        name (str): The collection name.
+        partitions (List[MemoryDatabase]): The partitions.
+        router (PartitionRouter): The router.
+        owner (Any, optional): The PartitionedDatabase the collection belongs to, for $lookup and $merge. Defaults to None.
+    """
+
+    def __init__(self, name: str, partitions: List[MemoryDatabase], router: PartitionRouter, owner: Any = None) -> None:
+        super().__init__(name)
+        self.partitions = [partition[name] for partition in partitions]
+        self.router = router
+        self.owner = owner
+
+    def _route(self, operation: str, query: Dict[str, Any]) -> List[MemoryCollection]:
+        """Get the partition collections an operation visits, counting the visit."""
+        targets = self.router.targets(self.name, query or {})
+        self.router.record(operation, targets)
+        return [self.partitions[target] for target in targets]
+
+    def _insert_one(self, document: Dict[str, Any]) -> InsertOneResult:
+        return self._route('insert', document)[0].insert_one(document)
+
+    def _find_matches(self, query: Dict[str, Any]) -> Iterator[Tuple[Dict[str, Any], Any]]:
+        for partition in self._route('find', query):
+            with partition.lock:
+                matches = list(partition._find_matches(query))
+            yield from matches
+
+    def find(self, query: Dict[str, Any] = None, projection: Any = None, batch_size: int = 0, hint: Any = None) -> MemoryCursor:
+        return MemoryCursor([document for partition in self._route('find', query) for document in partition.find(query, projection, hint=hint)])
+
+    def find_one(self, query: Dict[str, Any] = None, projection: Any = None) -> Any:
+        for partition in self._route('find_one', query):
+            document = partition.find_one(query, projection)
+            if document is not None:
+                return document
+        return None
+
+    def _update_one(self, query: Dict[str, Any], update: Dict[str, Any], upsert: bool = False) -> UpdateResult:
+        partitions = self._route('update', query)
+        for partition in partitions:
+            result = partition.update_one(query, update)
+            if result.matched_count:
+                return result
+        if upsert:
+            # O documento inserido é roteado pela sua própria chave, não pelo filtro
+            document = {field: value for field, value in query.items() if '.' not in field and not isinstance(value, dict)}
+            apply_update(document, update)
+            return self._route('insert', document)[0].update_one(query, update, upsert=True)
+        return UpdateResult({'n': 0, 'nModified': 0}, True)
+
+    def find_one_and_update(self, query: Dict[str, Any], update: Dict[str, Any], projection: Any = None, return_document: bool = ReturnDocument.BEFORE) -> Any:
+        for partition in self._route('update', query):
+            document = partition.find_one_and_update(query, update, projection, return_document)
+            if document is not None:
+                return document
+        return None
+
+    def count_documents(self, query: Dict[str, Any]) -> int:
+        return sum(partition.count_documents(query) for partition in self._route('count', query))
+
+    def aggregate(self, pipeline: List[Dict[str, Any]], **kwargs: Any) -> MemoryCursor:
+        documents: List[Dict[str, Any]] = []
+        for partition in self._route('aggregate', pipeline[0].get('$match', {}) if pipeline else {}):
+            with partition.lock:
+                documents.extend(partition.documents)
+        return MemoryCursor(copy.deepcopy(run_pipeline(documents, pipeline, self.owner)))
+
+    def merge_documents(self, documents: List[Dict[str, Any]], on: List[str], when_matched: str = 'merge') -> None:
+        for document in documents:
+            self._route('update', document)[0].merge_documents([document], on, when_matched)
+
+    def create_index(self, keys: Any, name: str = None, unique: bool = False, **kwargs: Any) -> str:
+        for partition in self.partitions:
+            name = partition.create_index(keys, name, unique, **kwargs)
+        return name
+
+    def drop_index(self, name: str) -> None:
+        for partition in self.partitions:
+            partition.drop_index(name)
+
+    def index_information(self) -> Dict[str, Dict[str, Any]]:
+        return self.partitions[0].index_information()
+
+
+# Banco de dados particionado em memória
+class PartitionedDatabase(MemoryDatabase):
+    """In-process multi-partition stand-in for a sharded cluster, with one MemoryDatabase per partition.
+
+    Args:
+        router (PartitionRouter): The router that places documents and targets queries.
+        name (str, optional): The database name. Defaults to DB_NAME.
+        latency_ms (float, optional): The round trip injected in each call to a partition, in milliseconds. Defaults to MEMORY_LATENCY_MS.
+    """
+
+    def __init__(self, router: PartitionRouter, name: str = DB_NAME, latency_ms: float = MEMORY_LATENCY_MS) -> None:
+        super().__init__(name)
+        self.router = router
+        self.partitions = [MemoryDatabase(name, latency_ms) for _ in range(router.num_partitions)]
+
+    def __getitem__(self, name: str) -> PartitionedCollection:
+        with self.lock:
+            if name not in self.collections:
+                self.collections[name] = PartitionedCollection(name, self.partitions, self.router, self)
+            return self.collections[name]
+
+    def rebalance(self) -> int:
+        """Recompute the ranged split points from the data and move the documents whose partition changed, like a balancer round.
+
+        Returns:
+            int: The number of documents migrated.
+        """
+        migrated = 0
+        for name in list(self.collections):
+            collections = [partition[name] for partition in self.partitions]
+            for collection in collections:
+                collection.lock.acquire()
+            try:
+                documents = [(index, document) for index, collection in enumerate(collections) for document in collection.documents]
+                self.router.split(name, [self.router.key(name, document) for _, document in documents])
+                placed: List[List[Dict[str, Any]]] = [[] for _ in collections]
+                for index, document in documents:
+                    target = self.router.targets(name, document)[0]
+                    placed[target].append(document)
+                    migrated += target != index
+                for collection, documents_placed in zip(collections, placed):
+                    collection.documents = documents_placed
+                    collection.rebuild_indexes()
+            finally:
+                for collection in collections:
+                    collection.lock.release()
+        return migrated
+
+    def partition_load(self) -> pd.DataFrame:
+        """Get the documents of each collection and the operations routed to each partition.
+
+        Returns:
+            pd.DataFrame: One row per partition and collection, with documents and operations (per partition, all collections).
+        """
+        rows = []
+        for index, partition in enumerate(self.partitions):
+            for name in self.collections:
+                rows.append({'partition': str(index), 'collection': name, 'documents': len(partition[name].documents),
+                             'operations': int(self.router.load[index])})
+        return pd.DataFrame(rows)
+
+
+# Função para configurar o sharding no mongos
+def configure_sharding(database: Any, strategy: str) -> None:
+    """Shard the collections of a database on a mongos with the shard keys of a strategy, adding one zone per region when needed.
+
+    Args:
+        database (Any): The database, opened through a mongos.
+        strategy (str): The partition strategy, a key of PARTITION_STRATEGIES.
+    """
+    admin = database.client.admin
+    if admin.command('hello').get('msg') != 'isdbgrid':
+        raise ValueError(f"Sharding needs MONGO_HOST:MONGO_PORT ({MONGO_HOST}:{MONGO_PORT}) to be a mongos.")
+    shard_keys = PARTITION_STRATEGIES[strategy]
+    admin.command('enableSharding', database.name)
+    shards = [shard['_id'] for shard in admin.command('listShards')['shards']]
+    for collection, key in shard_keys.items():
+        if 'region' in key:
+            for index, region in enumerate(REGIONS):
+                admin.command('addShardToZone', shards[index % len(shards)], zone=region)
+                admin.command('updateZoneKeyRange', f'{database.name}.{collection}',
+                              min={field: region if field == 'region' else MinKey() for field in key},
+                              max={field: region if field == 'region' else MaxKey() for field in key}, zone=region)
+        admin.command('shardCollection', f'{database.name}.{collection}', key=key)
+    logging.info(f"Sharded {list(shard_keys)} of {database.name} over {len(shards)} shards with the {strategy} strategy.")
+
+
+# Função para obter a carga de cada shard
+def shard_load(database: Any) -> pd.DataFrame:
+    """Get the documents and the operations of each collection on each shard, from $collStats.
+
+    Args:
+        database (Any): The database, opened through a mongos.
+
+    Returns:
+        pd.DataFrame: One row per shard and collection, with documents and operations (reads and writes of that collection).
+    """
+    rows = []
+    for collection in COLLECTIONS:
+        for stats in database[collection].aggregate([{'$collStats': {'latencyStats': {}, 'storageStats': {}}}]):
+            latency = stats['latencyStats']
+            rows.append({'partition': stats.get('shard', 'standalone'), 'collection': collection,
+                         'documents': stats['storageStats']['count'],
+                         'operations': latency['reads']['ops'] + latency['writes']['ops']})
+    return pd.DataFrame(rows)
+
+
+# Função para medir o espalhamento das consultas no mongos
+def explain_fan_out(database: Any, stores: List[Dict[str, Any]], samples: int = 20) -> Tuple[float, float]:
+    """Explain the query_stock and update_inventory filters of sample stores and count the shards each targets.
+
+    Args:
+        database (Any): The database, opened through a mongos.
+        stores (List[Dict[str, Any]]): The stores seeded.
+        samples (int, optional): The number of stores explained. Defaults to 20.
+
+    Returns:
+        Tuple[float, float]: The average number of shards visited by the read and by the update.
+    """
+    reads, writes = [], []
+    for store in stores[:samples]:
+        collection, query, projection = stock_query(store['store_id'], query_mode)
+        plan = database.command('explain', {'find': collection.name, 'filter': query}, verbosity='queryPlanner')
+        reads.append(len(plan['queryPlanner']['winningPlan'].get('shards', [None])))
+        collection, query, update = stock_update(store['store_id'], store['products'][0]['product_id'], 0)
+        plan = database.command('explain', {'update': collection.name, 'updates': [{'q': query, 'u': update}]}, verbosity='queryPlanner')
+        writes.append(len(plan['queryPlanner']['winningPlan'].get('shards', [None])))
+    return float(np.mean(reads)), float(np.mean(writes))
+
+
+# Comparar as estratégias de particionamento
+def measure_partitioning(strategies: List[str] = None, backend: str = 'memory', num_partitions: int = NUM_PARTITIONS, num_operations: int = 1000, percent_cores: float = 0.5, num_sales: int = 50, num_stores: int = 20, min_products: int = 5, max_products: int = 20) -> pd.DataFrame:
+    """Seed each partition strategy, run the simulate_operations workload on it and report per-partition load, skew and fan-out.
+
+    Args:
+        strategies (List[str], optional): The strategies to compare. Defaults to None (all of PARTITION_STRATEGIES).
+        backend (str, optional): 'memory' for the in-process PartitionedDatabase, or 'mongos' for the cluster behind MONGO_HOST:MONGO_PORT,
+            using the PARTITION_DB_NAME database (dropped before each strategy). Defaults to 'memory'.
+        num_partitions (int, optional): The number of in-memory partitions. Defaults to NUM_PARTITIONS.
+        num_operations (int, optional): The number of operations simulated per strategy. Defaults to 1000.
+        percent_cores (float, optional): The percentage of CPU cores used by the simulation. Defaults to 0.5.
+        num_sales (int, optional): The number of sales seeded. Defaults to 50.
+        num_stores (int, optional): The number of stores seeded. Defaults to 20.
+        min_products (int, optional): The minimum number of products in a store. Defaults to 5.
+        max_products (int, optional): The maximum number of products in a store. Defaults to 20.
+
+    Returns:
+        pd.DataFrame: One row per strategy, with the load skew (busiest partition over the mean) and the read and write fan-out.
+    """
+    if backend not in PARTITION_BACKENDS:
+        raise ValueError(f"Unknown partition backend '{backend}', expected one of {PARTITION_BACKENDS}.")
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_folder = os.path.join("executions", f"{timestamp}_partitioning")
+    os.makedirs(output_folder, exist_ok=True)
+    previous_db = db
+
+    rows, loads = [], []
+    try:
+        for run, strategy in enumerate(strategies or list(PARTITION_STRATEGIES)):
+            if backend == 'memory':
+                database = PartitionedDatabase(PartitionRouter(strategy, num_partitions))
+            else:
+                client.drop_database(PARTITION_DB_NAME)
+                database = client[PARTITION_DB_NAME]
+                configure_sharding(database, strategy)
+                # Índices únicos só valem em shards quando prefixados pela chave de shard
+                create_indexes(database, {collection: [(keys, {option: value for option, value in options.items() if option != 'unique'})
+                                                       for keys, options in indexes] for collection, indexes in INDEXES.items()})
+            bind_collections(database)
+            stores = insert_stores(num_stores, min_products, max_products)
+            insert_sales(num_sales, stores)
+
+            if backend == 'memory':
+                migrated = database.rebalance()
+                database.router.reset_stats()
+            else:
+                migrated = 0
+                before = shard_load(database).set_index(['partition', 'collection'])['operations']
+            simulate_operations(num_operations, stores, percent_cores, run, output_folder, keep_raw_times=False)
+
+            if backend == 'memory':
+                load = database.partition_load()
+                read_fan_out = database.router.fan_out(ROUTER_READS)
+                write_fan_out = database.router.fan_out(ROUTER_WRITES)
+                per_partition = load.groupby('partition')['operations'].first()
+            else:
+                load = shard_load(database)
+                load['operations'] -= load.set_index(['partition', 'collection']).index.map(before).fillna(0).astype(int)
+                read_fan_out, write_fan_out = explain_fan_out(database, stores)
+                per_partition = load.groupby('partition')['operations'].sum()
+            load.insert(0, 'strategy', strategy)
+            loads.append(load)
+            row = {
+                'strategy': strategy,
+                'partitions': len(per_partition),
+                'min_load': int(per_partition.min()),
+                'max_load': int(per_partition.max()),
+                'skew': float(per_partition.max() / per_partition.mean()) if per_partition.mean() else 0.0,
+                'read_fan_out': read_fan_out,
+                'write_fan_out': write_fan_out,
+                'migrated': migrated,
+            }
+            rows.append(row)
+            logging.info(f"Partitioning {strategy} ({backend}) - load per partition {per_partition.to_dict()}, skew {row['skew']:.2f}, "
+                         f"read fan-out {read_fan_out:.2f}, write fan-out {write_fan_out:.2f}, {migrated} documents migrated")
+    finally:
+        if previous_db is not None:
+            bind_collections(previous_db)
+
+    results = pd.DataFrame(rows)
+    results.to_csv(os.path.join(output_folder, 'partitioning.csv'), index=False)
+    pd.concat(loads, ignore_index=True).to_csv(os.path.join(output_folder, 'partition_load.csv'), index=False)
+    return results
+
+
+#######################
+# Inclusão de filial #
+#######################
+
+# Largura das janelas da linha do tempo da inclusão (ms)
+TIMELINE_BUCKET_MS = 500
+
+# Operações do tráfego de fundo durante a inclusão
+ONBOARDING_TRAFFIC = ['query_stock', 'update_inventory']
+
+# Pausa do tráfego de fundo após uma falha (s)
+TRAFFIC_BACKOFF = 0.05
+
+
+# Função para gerar tráfego de fundo até ser interrompido
+def background_traffic(stores: List[Dict[str, Any]], stop: threading.Event, base_ns: int, samples: List[Tuple[str, int, float]]) -> None:
+    """Run query_stock and update_inventory on random stores until stopped, recording when each started and how long it took.
+
+    A failed operation is logged and followed by a short pause, so a failing backend is not hammered in a tight loop.
+
+    Args:
+        stores (List[Dict[str, Any]]): The stores the traffic reads and updates.
+        stop (threading.Event): Set to end the traffic.
+        base_ns (int): The perf_counter_ns origin of the timeline.
+        samples (List[Tuple[str, int, float]]): Receives (operation, start offset in ns, latency in ms) tuples.
+    """
+    while not stop.is_set():
+        store = pick_store(stores)
+        operation = random.choice(ONBOARDING_TRAFFIC)
+        start_ns = time.perf_counter_ns() - base_ns
+        try:
+            if operation == 'query_stock':
+                elapsed = query_stock(store['store_id'])[1]
+            else:
+                product = pick_product(store['products'])
+                elapsed = update_inventory(store['store_id'], product['product_id'], random.randint(1, 10))
+        except Exception as e:
+            logging.error(e)
+            stop.wait(TRAFFIC_BACKOFF)
+            continue
+        samples.append((operation, start_ns, elapsed * 1000))
+
+
+# Função para carregar o catálogo de uma nova filial
+def onboard_store(catalogue_size: int, generator: VectorizedGenerator, batch_size: int = BATCH_SIZE) -> Dict[str, Any]:
+    """Insert a new store and bulk-load its catalogue in chunks.
+
+    The store document keeps only the product count: the IDs of a large catalogue do not fit in one document.
+
+    Args:
+        catalogue_size (int): The number of products of the new store.
+        generator (VectorizedGenerator): The generator of the store and its products.
+        batch_size (int, optional): The number of products sent in each round trip. Defaults to BATCH_SIZE.
+
+    Returns:
+        Dict[str, Any]: The store document inserted.
+    """
+    store = generator.stores(1, 0, 0)[0]
+    del store['products']
+    store['product_count'] = catalogue_size
+    stores_collection.insert_one(store)
+    for chunk in generator.iter_products(catalogue_size, batch_size):
+        products_collection.insert_many([{**product, 'store_id': store['store_id'], 'region': store['region']} for product in chunk], ordered=False)
+    return store
 
-#############
-# Operações #
-#############
 
-# Função para consultar estoque
-def query_stock(store_id: str) -> Tuple[List[Dict[str, Any]], float]:
-    """Query the stock of a specific store.
+# Função para ler as migrações de chunks registradas no cluster
+def chunk_migrations(database: Any, since: datetime) -> Dict[str, int]:
+    """Count the chunk split and migration events of a database in the config.changelog of a mongos.
 
     Args:
-        store_id (str): The ID of the store to query.
+        database (Any): The database, opened through a mongos.
+        since (datetime): The start of the window, timezone-aware.
 
     Returns:
-        Tuple[List[Dict[str, Any]], float]: A list of products in the store and the query execution time.
+        Dict[str, int]: The number of events of each kind (moveChunk.commit, split, ...).
     """
-    start_time = time.time()
-    products = products_collection.find({'store_id': store_id})
-    result = list(products)
-    end_time = time.time()
-    return result, end_time - start_time
+    pipeline = [
+        {'$match': {'ns': {'$regex': f'^{database.name}\\.'}, 'time': {'$gte': since}}},
+        {'$group': {'_id': '$what', 'count': {'$sum': 1}}},
+    ]
+    return {event['_id']: event['count'] for event in database.client.config.changelog.aggregate(pipeline)}
 
 
-# Função para atualizar inventário
-def update_inventory(store_id: str, product_id: str, quantity: int) -> float:
-    """Update the inventory of a specific product in a store.
+# Medir o impacto da inclusão de uma filial no tráfego
+def measure_onboarding(catalogue_size: int = 100_000, warmup_seconds: float = 5.0, cooldown_seconds: float = 5.0, percent_cores: float = 0.5, num_sales: int = 50, num_stores: int = 20, min_products: int = 5, max_products: int = 20, batch_size: int = BATCH_SIZE, chart_width: int = 600) -> pd.DataFrame:
+    """Bulk-load the catalogue of a new store while query_stock and update_inventory keep running, and record their latency
+    before, during and after the load (including the rebalancing that follows it).
+
+    On a PartitionedDatabase the load is followed by a balancer round; on a mongos the balancer runs by itself and the chunk
+    splits and migrations of the window are read from config.changelog.
 
     Args:
-        store_id (str): The ID of the store.
-        product_id (str): The ID of the product.
-        quantity (int): The quantity to update the stock by.
+        catalogue_size (int, optional): The number of products of the new store. Defaults to 100_000.
+        warmup_seconds (float, optional): How long the traffic runs before the load. Defaults to 5.0.
+        cooldown_seconds (float, optional): How long the traffic runs after the load. Defaults to 5.0.
+        percent_cores (float, optional): The percentage of CPU cores used as traffic threads. Defaults to 0.5.
+        num_sales (int, optional): The number of sales seeded. Defaults to 50.
+        num_stores (int, optional): The number of stores seeded. Defaults to 20.
+        min_products (int, optional): The minimum number of products in a seeded store. Defaults to 5.
+        max_products (int, optional): The maximum number of products in a seeded store. Defaults to 20.
+        batch_size (int, optional): The number of products sent in each round trip. Defaults to BATCH_SIZE.
+        chart_width (int, optional): The chart width, in pixels. Defaults to 600.
 
     Returns:
-        float: The execution time of the update operation.
+        pd.DataFrame: The latency summary of each operation in each phase (before, during, rebalance, after).
     """
-    start_time = time.time()
-    products_collection.update_one(
-        {'product_id': product_id, 'store_id': store_id},
-        {'$inc': {'stock_quantity': quantity}}
-    )
-    end_time = time.time()
-    return end_time - start_time
+    if storage_layout == 'embedded':
+        raise ValueError("The embedded layout cannot hold a large catalogue in one 16 MB store document; use the normalized layout.")
+    max_workers = max(1, int(get_num_cores() * percent_cores))
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    output_folder = os.path.join("executions", f"{timestamp}_onboarding")
+    os.makedirs(output_folder, exist_ok=True)
+    logging.info(f"Starting onboarding of a {catalogue_size}-product store under {max_workers} traffic threads.")
 
+    stores = insert_stores(num_stores, min_products, max_products)
+    insert_sales(num_sales, stores)
+    if isinstance(db, PartitionedDatabase):
+        db.rebalance()
+    generator = VectorizedGenerator(namespace=f"{timestamp}:onboarding")
+    is_mongos = not isinstance(db, MemoryDatabase) and db.client.admin.command('hello').get('msg') == 'isdbgrid'
+    window_start = datetime.now(timezone.utc)
 
-# Função para adicionar uma nova filial
-def add_store() -> float:
-    """Add a new store to the database with a 30% chance."""
-    #if random.random() < 0.3:  # 30% de chance de adicionar uma nova filial
-    start_time = time.time()
-    store = generate_fake_store(min_products=5, max_products=20)
-    stores_collection.insert_one(store)
-    end_time = time.time()
-    return end_time - start_time
-    
+    stop = threading.Event()
+    thread_samples: List[List[Tuple[str, int, float]]] = [[] for _ in range(max_workers)]
+    base_ns = time.perf_counter_ns()
+    threads = [threading.Thread(target=background_traffic, args=(stores, stop, base_ns, samples), daemon=True) for samples in thread_samples]
+    for thread in threads:
+        thread.start()
+    migrated = 0
+    try:
+        time.sleep(warmup_seconds)
+        load_start = time.perf_counter_ns() - base_ns
+        onboard_store(catalogue_size, generator, batch_size)
+        load_end = time.perf_counter_ns() - base_ns
+        if isinstance(db, PartitionedDatabase):
+            migrated = db.rebalance()
+        rebalance_end = time.perf_counter_ns() - base_ns
+        time.sleep(cooldown_seconds)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    logging.info(f"Onboarding load took {(load_end - load_start) / 1e6:.4f} ms ({catalogue_size / max(1e-9, (load_end - load_start) / 1e9):.0f} products/s), "
+                 f"rebalancing {(rebalance_end - load_end) / 1e6:.4f} ms with {migrated} documents migrated.")
+    if is_mongos:
+        logging.info(f"Chunk events during the onboarding: {chunk_migrations(db, window_start)}")
 
-# Função para adicionar um novo produto
-def add_product(store_id: str) -> float:
-    """Add a new product to a store with a 30% chance.
+    samples = pd.DataFrame([sample for samples in thread_samples for sample in samples], columns=['operation', 'start_ns', 'latency_ms'])
+    samples['phase'] = pd.cut(samples['start_ns'], [-1, load_start, load_end, rebalance_end, np.inf],
+                              labels=['before', 'during', 'rebalance', 'after'], right=False)
+    samples['bucket_ms'] = samples['start_ns'] // (TIMELINE_BUCKET_MS * 10 ** 6) * TIMELINE_BUCKET_MS
+    timeline = samples.groupby(['bucket_ms', 'operation'])['latency_ms'].describe(percentiles=[0.5, 0.99]).reset_index()
+    timeline.to_csv(os.path.join(output_folder, 'onboarding_timeline.csv'), index=False)
+
+    rows = []
+    for (phase, operation), group in samples.groupby(['phase', 'operation'], observed=True):
+        histogram = LatencyHistogram()
+        for latency in group['latency_ms'].tolist():
+            histogram.record(latency)
+        summary = histogram.summary()
+        rows.append({'phase': phase, 'operation': operation, **summary})
+        logging.info(f"Onboarding {phase} - {operation}: {summary['count']} ops, p50 {summary['p50']:.4f} ms, p99 {summary['p99']:.4f} ms, max {summary['max']:.4f} ms")
+    phases = pd.DataFrame(rows)
+    phases.to_csv(os.path.join(output_folder, 'onboarding_phases.csv'), index=False)
+
+    # Latency timeline around the onboarding
+    plt.figure(figsize=(chart_width / 100, 6))
+    for operation, group in timeline.groupby('operation'):
+        plt.plot(group['bucket_ms'] / 1000, group['99%'], label=f'{operation} p99')
+        plt.plot(group['bucket_ms'] / 1000, group['50%'], linestyle='--', label=f'{operation} p50')
+    plt.axvspan(load_start / 1e9, load_end / 1e9, color='orange', alpha=0.2, label='Catalogue load')
+    if rebalance_end > load_end:
+        plt.axvspan(load_end / 1e9, rebalance_end / 1e9, color='red', alpha=0.2, label='Rebalancing')
+    plt.title(f'Latency During Onboarding of a {catalogue_size}-Product Store')
+    plt.xlabel('Time (s)')
+    plt.ylabel('Time (ms)')
+    plt.legend()
+    plt.savefig(os.path.join(output_folder, 'onboarding_timeline.png'))
+    plt.close()
+    return phases
+
+
+############################
+# Comparação de consultas #
+############################
+
+# Intervalo de amostragem do RSS durante a comparação (ms)
+RSS_SAMPLE_INTERVAL_MS = 1.0
+
+
+# Amostrador do pico de memória residente
+class PeakRssSampler:
+    """Context manager sampling the resident set size of the process in a background thread and keeping the peak.
 
     Args:
-        store_id (str): The ID of the store to add the product to.
+        interval_ms (float, optional): The sampling interval, in milliseconds. Defaults to RSS_SAMPLE_INTERVAL_MS.
     """
-    #if random.random() < 0.3:  # 30% de chance de adicionar um novo produto
-    start_time = time.time()
-    new_product = generate_fake_product()
-    products_collection.insert_one({**new_product, 'store_id': store_id})
-    end_time = time.time()
-    return end_time - start_time
 
+    def __init__(self, interval_ms: float = RSS_SAMPLE_INTERVAL_MS) -> None:
+        self.interval = interval_ms / 1000
+        self.process = psutil.Process()
+        self.stopped = threading.Event()
+        self.baseline = self.peak = 0
 
-##############
-# Simulações #
-##############
+    def _sample(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def __enter__(self) -> 'PeakRssSampler':
+        gc.collect()
+        self.baseline = self.peak = self.process.memory_info().rss
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.peak = max(self.peak, self.process.memory_info().rss)
+        self.stopped.set()
+        self.thread.join()
+
+    @property
+    def peak_delta_mb(self) -> float:
+        """The peak RSS growth over the baseline, in megabytes."""
+        return (self.peak - self.baseline) / 1024 ** 2
 
-# Obter o número de núcleos do processador
-def get_num_cores() -> int:
-    """Get the number of CPU cores available on the machine.
+
+# Função para medir o tamanho de um documento lido
+def document_size(document: Any) -> int:
+    """Get the BSON size of a document as sent by the server.
+
+    Args:
+        document (Any): A RawBSONDocument, or a decoded document (from the in-memory engine).
 
     Returns:
-        int: The number of CPU cores.
+        int: The size in bytes.
     """
-    return multiprocessing.cpu_count()
+    return len(document.raw) if isinstance(document, RawBSONDocument) else len(bson.encode(document))
 
 
-# Simular consultas simultâneas
-def simulate_operations(num_operations: int, stores: List[Dict[str, Any]], percent_cores: float, run_number: int, output_folder: str) -> Tuple[List[float], List[float], Dict[str, int]]:
-    """Simulate concurrent operations on the database.
+# Função para comparar os modos de consulta do estoque
+def benchmark_query_modes(store_ids: List[str], output_folder: str, batch_size: int = 0, modes: List[str] = None) -> pd.DataFrame:
+    """Read the stock of the stores with each query mode and report bytes transferred and peak RSS.
+
+    Each mode is read through three interfaces: 'query_stock', the decoded full-document list that query_stock builds
+    (fetch_stock); 'list', the undecoded RawBSONDocument batches materialized into one list; and 'stream', the undecoded
+    batches consumed one at a time.
 
     Args:
-        num_operations (int): The number of operations to simulate.
-        stores (List[Dict[str, Any]]): A list of stores to use in the simulation.
-        percent_cores (float): The percentage of CPU cores to use for the simulation.
+        store_ids (List[str]): The stores to read.
+        output_folder (str): The folder to save query_modes.csv in.
+        batch_size (int, optional): The number of products per batch. Defaults to 0 (the current batch size).
+        modes (List[str], optional): The query modes to compare. Defaults to None (all of QUERY_PROJECTIONS).
 
     Returns:
-        Tuple[List[float], List[float], Dict[str, int]]: Lists of read and write times, and a count of each operation type.
+        pd.DataFrame: One row per mode and interface, with documents, bytes, elapsed_ms and peak_rss_mb.
     """
-    num_cores = get_num_cores()
-    max_workers = max(1, int(num_cores * percent_cores))
-    logging.info(f"Number of cores to be used: {max_workers}")
+    rows = []
+    for mode in modes or list(QUERY_PROJECTIONS):
+        for interface in ['query_stock', 'list', 'stream']:
+            documents = size = 0
+            with PeakRssSampler() as sampler:
+                start_time = time.perf_counter_ns()
+                for store_id in store_ids:
+                    if interface == 'query_stock':
+                        batches = [fetch_stock(store_id, mode)]
+                    else:
+                        batches = stream_stock(store_id, mode, batch_size, raw_bson=True)
+                    if interface == 'list':
+                        batches = [[product for batch in batches for product in batch]]
+                    for batch in batches:
+                        documents += len(batch)
+                        size += sum(document_size(product) for product in batch)
+                    del batches
+                elapsed_ms = (time.perf_counter_ns() - start_time) / 1e6
+            rows.append({'mode': mode, 'interface': interface, 'documents': documents, 'bytes': size,
+                         'elapsed_ms': elapsed_ms, 'peak_rss_mb': sampler.peak_delta_mb})
+            logging.info(f"Query mode {mode}/{interface}: {documents} documents, {size / 1024:.2f} KB transferred, "
+                         f"{elapsed_ms:.4f} ms, peak RSS +{sampler.peak_delta_mb:.2f} MB")
+    results = pd.DataFrame(rows)
+    results.to_csv(os.path.join(output_folder, 'query_modes.csv'), index=False)
+    return results
 
-    read_times: List[float] = []
-    write_times: List[float] = []
-    operation_counts: Dict[str, int] = {
-        'query_stock': 0,
-        'update_inventory': 0,
-        'add_store': 0,
-        'add_product': 0
-    }
 
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_operation = {}
-        for _ in range(num_operations):
-            store = random.choice(stores)
-            operation = random.choice(['query_stock', 'update_inventory', 'add_store', 'add_product'])
-            if operation == 'query_stock':
-                future = executor.submit(query_stock, store['store_id'])
-            elif operation == 'update_inventory':
-                product = random.choice(store['products'])
-                future = executor.submit(update_inventory, store['store_id'], product['product_id'], random.randint(1, 10))
-            elif operation == 'add_store':
-                future = executor.submit(add_store)
-            elif operation == 'add_product':
-                future = executor.submit(add_product, store['store_id'])
-            future_to_operation[future] = operation
+##############
+# Relatórios #
+##############
 
-        for future in tqdm(as_completed(future_to_operation), total=num_operations, desc=f"Operations Progress {run_number}"):
-            try:
-                result = future.result()
-                operation = future_to_operation[future]
-                if operation == 'query_stock':
-                    read_times.append(result[1] * 1000)  # Convert to milliseconds
-                    operation_counts['query_stock'] += 1
-                else:
-                    write_times.append(result * 1000)  # Convert to milliseconds
-                    if operation == 'update_inventory':
-                        operation_counts['update_inventory'] += 1
-                    elif operation == 'add_store':
-                        operation_counts['add_store'] += 1
-                    elif operation == 'add_product':
-                        operation_counts['add_product'] += 1
-            except Exception as e:
-                logging.error(e)
+# Limites dos gráficos agregados
+REPORT_MAX_POINTS = 1000
+REPORT_ROLLING_FRACTION = 0.02
 
-    # Generate individual run plots
-    plot_individual_times(run_number, read_times, write_times, output_folder)
 
-    return read_times, write_times, operation_counts
+# Função para salvar os tempos brutos de uma rodada
+def save_raw_times(run: int, read_times: List[float], write_times: List[float], output_folder: str) -> None:
+    """Save the read and write times of a run, in completion order, for the reports.
+
+    Args:
+        run (int): The run number.
+        read_times (List[float]): The read times (ms).
+        write_times (List[float]): The write times (ms).
+        output_folder (str): The folder of the execution.
+    """
+    np.savez_compressed(os.path.join(output_folder, f'raw_times_run_{run + 1}.npz'), read=np.asarray(read_times), write=np.asarray(write_times))
 
 
-#TIME_LABEL = 'Time (ms)'
+# Função para desenhar a distribuição das latências
+def plot_latency_distribution(histograms: Dict[str, LatencyHistogram], title: str, path: str, chart_width: int = 600) -> None:
+    """Draw the read and write latency distributions of histograms, with their p50 and p99.
 
-def plot_individual_times(run: int, read_times: List[float], write_times: List[float], output_folder: str, chart_width: int = 600) -> None:
-    # Scatter plot for read times
+    Args:
+        histograms (Dict[str, LatencyHistogram]): The histograms, by operation.
+        title (str): The chart title.
+        path (str): The image file.
+        chart_width (int, optional): The chart width, in pixels. Defaults to 600.
+    """
     plt.figure(figsize=(chart_width / 100, 6))
-    plt.scatter(range(len(read_times)), read_times)
-    plt.title(f'Read Times for Run {run + 1}')
-    plt.xlabel('Operation')
-    plt.ylabel('Time (ms)')
-    plt.xticks(np.arange(0, len(read_times), max(1, len(read_times) // 10)))
-    plt.yticks(np.arange(0, max(read_times) + 5, 5))
-    plt.savefig(os.path.join(output_folder, f'read_times_run_{run + 1}.png'))
+    for label, operations in [('Read', READ_OPERATIONS), ('Write', WRITE_OPERATIONS)]:
+        histogram = combine_histograms(histograms, operations)
+        values, counts = histogram.distribution()
+        if not counts.size:
+            continue
+        line, = plt.step(values, counts, where='post', label=f'{label} ({histogram.total_count} ops)')
+        for percentile, style in [(50, '--'), (99, ':')]:
+            plt.axvline(x=histogram.percentile(percentile), color=line.get_color(), linestyle=style, label=f'{label} p{percentile}')
+    plt.xscale('log')
+    plt.title(title)
+    plt.xlabel('Time (ms)')
+    plt.ylabel('Operations')
+    plt.legend()
+    plt.savefig(path)
     plt.close()
 
-    # Scatter plot for write times
+
+# Função para desenhar os percentis móveis de uma rodada
+def plot_rolling_percentiles(times: Dict[str, np.ndarray], title: str, path: str, chart_width: int = 600) -> None:
+    """Draw the rolling p50 and the p50-p99 band of each series of times, downsampled to REPORT_MAX_POINTS points.
+
+    Args:
+        times (Dict[str, np.ndarray]): The times (ms) in completion order, by label.
+        title (str): The chart title.
+        path (str): The image file.
+        chart_width (int, optional): The chart width, in pixels. Defaults to 600.
+    """
     plt.figure(figsize=(chart_width / 100, 6))
-    plt.scatter(range(len(write_times)), write_times)
-    plt.title(f'Write Times for Run {run + 1}')
+    for label, values in times.items():
+        if not len(values):
+            continue
+        rolling = pd.Series(values).rolling(max(1, int(len(values) * REPORT_ROLLING_FRACTION)), min_periods=1)
+        index = np.arange(0, len(values), max(1, -(-len(values) // REPORT_MAX_POINTS)))
+        p50 = rolling.quantile(0.5).to_numpy()[index]
+        p99 = rolling.quantile(0.99).to_numpy()[index]
+        line, = plt.plot(index, p50, label=f'{label} p50')
+        plt.fill_between(index, p50, p99, color=line.get_color(), alpha=0.25, label=f'{label} p50-p99')
+    plt.title(title)
     plt.xlabel('Operation')
     plt.ylabel('Time (ms)')
-    plt.xticks(np.arange(0, len(write_times), max(1, len(write_times) // 10)))
-    plt.yticks(np.arange(0, max(write_times) + 5, 5))
-    plt.savefig(os.path.join(output_folder, f'write_times_run_{run + 1}.png'))
+    plt.legend()
+    plt.savefig(path)
     plt.close()
 
-    # Scatter plot for total times
-    total_times = [r + w for r, w in zip(read_times, write_times)]
-    plt.figure(figsize=(chart_width / 100, 6))
-    plt.scatter(range(len(total_times)), total_times)
-    plt.title(f'Total Times for Run {run + 1}')
-    plt.xlabel('Operation')
-    plt.ylabel('Time (ms)')
-    plt.xticks(np.arange(0, len(total_times), max(1, len(total_times) // 10)))
-    plt.yticks(np.arange(0, max(total_times) + 5, 5))
-    plt.savefig(os.path.join(output_folder, f'total_times_run_{run + 1}.png'))
+
+# Função para desenhar a linha do tempo dos recursos de uma rodada
+def plot_resource_timeline(samples: pd.DataFrame, metrics: pd.DataFrame, title: str, path: str, chart_width: int = 600) -> None:
+    """Draw, on the time axis of a run, the p99 latency of each sampling interval above the client CPU and RSS and,
+    when the server was sampled, its lock queues and cache evictions.
+
+    Args:
+        samples (pd.DataFrame): The resource samples of the run.
+        metrics (pd.DataFrame): The per-operation records of the run, or None.
+        title (str): The chart title.
+        path (str): The image file.
+        chart_width (int, optional): The chart width, in pixels. Defaults to 600.
+    """
+    ends = samples['t_ns'].to_numpy()
+    has_metrics = metrics is not None and len(metrics) > 0
+    origin = min(ends[0], metrics['start_ns'].min()) if has_metrics else ends[0]
+    panels = (['latency'] if has_metrics else []) + ['client'] + (['server'] if 'queue_readers' in samples else [])
+    fig, axes = plt.subplots(len(panels), 1, sharex=True, squeeze=False, figsize=(chart_width / 100, 3 * len(panels)))
+    axes = dict(zip(panels, axes[:, 0]))
+    seconds = (ends - origin) / 1e9
+
+    if has_metrics:
+        intervals = np.searchsorted(ends, metrics['start_ns'].to_numpy())
+        p99 = metrics['duration_ms'].groupby(intervals).quantile(0.99)
+        p99 = p99[p99.index < len(ends)]
+        axes['latency'].plot(seconds[p99.index], p99.to_numpy(), color='black', marker='.')
+        axes['latency'].set_ylabel('p99 (ms)')
+
+    axes['client'].plot(seconds, samples['process_cpu_percent'], label='Process CPU (%)')
+    axes['client'].plot(seconds, samples['system_cpu_percent'], label='System CPU (%)')
+    axes['client'].set_ylabel('CPU (%)')
+    rss_axis = axes['client'].twinx()
+    rss_axis.plot(seconds, samples['rss_mb'], color='gray', linestyle='--', label='RSS (MB)')
+    rss_axis.set_ylabel('RSS (MB)')
+    axes['client'].legend(loc='upper left')
+
+    if 'server' in axes:
+        axes['server'].plot(seconds, samples['queue_readers'], label='Queued readers')
+        axes['server'].plot(seconds, samples['queue_writers'], label='Queued writers')
+        axes['server'].set_ylabel('Queue')
+        eviction_axis = axes['server'].twinx()
+        eviction_axis.bar(seconds, samples['cache_evicted_unmodified'] + samples['cache_evicted_modified'], width=0.8 * np.median(np.diff(seconds)) if len(seconds) > 1 else 0.1,
+                          color='red', alpha=0.3, label='Pages evicted')
+        eviction_axis.set_ylabel('Pages evicted')
+        axes['server'].legend(loc='upper left')
+
+    axes[panels[0]].set_title(title)
+    axes[panels[-1]].set_xlabel('Time (s)')
+    plt.tight_layout()
+    plt.savefig(path)
     plt.close()
 
-    # Bar chart with average line for read times
-    avg_read_time = sum(read_times) / len(read_times) if read_times else 0
+
+# Função para gerar os gráficos de uma rodada
+def render_run_report(output_folder: str, run: int, chart_width: int = 600) -> None:
+    """Draw the charts of a run from its persisted histograms and, when saved, its per-operation metrics or raw times and its resource samples.
+
+    Args:
+        output_folder (str): The folder of the execution.
+        run (int): The run number.
+        chart_width (int, optional): The chart width, in pixels. Defaults to 600.
+    """
+    histograms = load_histograms(os.path.join(output_folder, f'latency_run_{run + 1}.json'))
+    plot_latency_distribution(histograms, f'Latency Distribution for Run {run + 1}',
+                              os.path.join(output_folder, f'latency_distribution_run_{run + 1}.png'), chart_width)
+    metrics_path = os.path.join(output_folder, METRICS_FOLDER, f'run_{run + 1}.parquet')
+    raw_path = os.path.join(output_folder, f'raw_times_run_{run + 1}.npz')
+    metrics = times = None
+    if os.path.exists(metrics_path):
+        metrics = load_metrics(metrics_path)
+        metrics = metrics[metrics['outcome'] == 'ok']
+        times = {'Read': metrics.loc[metrics['operation'].isin(READ_OPERATIONS), 'duration_ms'].to_numpy(),
+                 'Write': metrics.loc[metrics['operation'].isin(WRITE_OPERATIONS), 'duration_ms'].to_numpy()}
+    elif os.path.exists(raw_path):
+        with np.load(raw_path) as raw:
+            times = {'Read': raw['read'], 'Write': raw['write']}
+    if times is not None:
+        plot_rolling_percentiles(times, f'Rolling Latency for Run {run + 1}',
+                                 os.path.join(output_folder, f'rolling_latency_run_{run + 1}.png'), chart_width)
+    for extension in ['parquet', 'csv']:
+        resources_path = os.path.join(output_folder, RESOURCES_FOLDER, f'run_{run + 1}.{extension}')
+        if os.path.exists(resources_path):
+            plot_resource_timeline(load_resources(resources_path), metrics, f'Resources for Run {run + 1}',
+                                   os.path.join(output_folder, f'resources_run_{run + 1}.png'), chart_width)
+
+
+# Função para gerar os gráficos de todas as rodadas
+def render_final_report(output_folder: str, chart_width: int = 600) -> None:
+    """Draw the charts across runs from runs.csv and the persisted histograms.
+
+    Args:
+        output_folder (str): The folder of the execution.
+        chart_width (int, optional): The chart width, in pixels. Defaults to 600.
+    """
+    runs = pd.read_csv(os.path.join(output_folder, 'runs.csv'))
+    index = runs['run'].to_numpy()
+
+    # Bar chart comparing read and write times for each run
     plt.figure(figsize=(chart_width / 100, 6))
-    plt.bar(range(len(read_times)), read_times)
-    plt.axhline(y=avg_read_time, color='r', linestyle='-', label=f'Avg: {avg_read_time:.2f} ms')
-    plt.title(f'Read Times for Run {run + 1}')
-    plt.xlabel('Operation')
+    bar_width = 0.35
+    plt.bar(index, runs['read_ms'], bar_width, label='Read Time')
+    plt.bar(index + bar_width, runs['write_ms'], bar_width, label='Write Time')
+    plt.title('Read vs Write Times for Each Run')
+    plt.xlabel('Run')
     plt.ylabel('Time (ms)')
+    plt.xticks(index + bar_width / 2, index)
     plt.legend()
-    plt.yticks(np.arange(0, max(read_times) + 5, 5))
-    plt.xticks(np.arange(0, len(read_times), max(1, len(read_times) // 10)))
-    # for i, v in enumerate(read_times):
-    #     plt.text(i, v + 0.5, f"{v:.2f}", ha='center')
-    plt.savefig(os.path.join(output_folder, f'read_bar_run_{run + 1}.png'))
+    plt.savefig(os.path.join(output_folder, 'read_vs_write_each_run.png'))
     plt.close()
 
-    # Bar chart with average line for write times
-    avg_write_time = sum(write_times) / len(write_times) if write_times else 0
+    # Execution time of each run with its average
     plt.figure(figsize=(chart_width / 100, 6))
-    plt.bar(range(len(write_times)), write_times)
-    plt.axhline(y=avg_write_time, color='r', linestyle='-', label=f'Avg: {avg_write_time:.2f} ms')
-    plt.title(f'Write Times for Run {run + 1}')
-    plt.xlabel('Operation')
-    plt.ylabel('Time (ms)')
+    plt.plot(index, runs['total_ms'], marker='o')
+    plt.axhline(y=runs['total_ms'].mean(), color='r', linestyle='-', label=f"Avg: {runs['total_ms'].mean():.2f} ms")
+    plt.title('Total Execution Times Across All Runs')
+    plt.xlabel('Run')
+    plt.ylabel('Total Execution Time (ms)')
     plt.legend()
-    plt.yticks(np.arange(0, max(write_times) + 5, 5))
-    plt.xticks(np.arange(0, len(write_times), max(1, len(write_times) // 10)))
-    # for i, v in enumerate(write_times):
-    #     plt.text(i, v + 0.5, f"{v:.2f}", ha='center')
-    plt.savefig(os.path.join(output_folder, f'write_bar_run_{run + 1}.png'))
+    plt.savefig(os.path.join(output_folder, 'total_execution_times_all_runs.png'))
     plt.close()
 
-    # Bar chart with average line for total times
-    avg_total_time = sum(total_times) / len(total_times) if total_times else 0
+    # Percentile bands of each run
     plt.figure(figsize=(chart_width / 100, 6))
-    plt.bar(range(len(total_times)), total_times)
-    plt.axhline(y=avg_total_time, color='r', linestyle='-', label=f'Avg: {avg_total_time:.2f} ms')
-    plt.title(f'Total Times for Run {run + 1}')
-    plt.xlabel('Operation')
+    run_histograms = [load_histograms(os.path.join(output_folder, f'latency_run_{run}.json')) for run in index]
+    for label, operations in [('Read', READ_OPERATIONS), ('Write', WRITE_OPERATIONS)]:
+        combined = [combine_histograms(histograms, operations) for histograms in run_histograms]
+        p50 = [histogram.percentile(50) for histogram in combined]
+        line, = plt.plot(index, p50, marker='o', label=f'{label} p50')
+        plt.fill_between(index, [histogram.percentile(90) for histogram in combined], [histogram.percentile(99) for histogram in combined],
+                         color=line.get_color(), alpha=0.25, label=f'{label} p90-p99')
+    plt.title('Latency Percentiles for Each Run')
+    plt.xlabel('Run')
     plt.ylabel('Time (ms)')
     plt.legend()
-    plt.yticks(np.arange(0, max(total_times) + 5, 5))
-    plt.xticks(np.arange(0, len(total_times), max(1, len(total_times) // 10)))
-    # for i, v in enumerate(total_times):
-    #     plt.text(i, v + 0.5, f"{v:.2f}", ha='center')
-    plt.savefig(os.path.join(output_folder, f'total_bar_run_{run + 1}.png'))
+    plt.savefig(os.path.join(output_folder, 'percentile_bands_each_run.png'))
     plt.close()
-    
-    
-    # Encontre o tamanho máximo entre os dois arrays
-    max_size = max(len(read_times), len(write_times))
 
-    # Ajuste os arrays para terem o mesmo tamanho
-    read_times_adjusted = np.pad(read_times, (0, max_size - len(read_times)), 'constant', constant_values=(0))
-    write_times_adjusted = np.pad(write_times, (0, max_size - len(write_times)), 'constant', constant_values=(0))
-
-    # Bar chart comparing read and write times for each run
-    plt.figure(figsize=(chart_width / 100, 6))
-    bar_width = 0.35
-    # Agora, use read_times_adjusted e write_times_adjusted para o plot
-    #index = np.arange(len(read_times))
-    index = np.arange(max_size)
-    # plt.bar(index, read_times, bar_width, label='Read Time')
-    plt.bar(index, read_times_adjusted, bar_width, label='Read Time')
-    # plt.bar(index + bar_width, write_times, bar_width, label='Write Time')
-    plt.bar(index + bar_width, write_times_adjusted, bar_width, label='Write Time')
-    plt.title(f'Read vs Write Times for Run {run + 1}')
-    plt.xlabel('Operation')
-    plt.ylabel('Time (ms)')
-    # Ajuste plt.xticks para corresponder ao número de operações
-    # plt.xticks(index + bar_width / 2, np.arange(0, len(read_times), max(1, len(read_times) // 10)))
-    plt.xticks(index + bar_width / 2, np.arange(max_size))
-    plt.yticks(np.arange(0, max(read_times + write_times) + 5, 5))
-    plt.legend()
-    plt.savefig(os.path.join(output_folder, f'read_vs_write_run_{run + 1}.png'))
+    # Candlestick chart comparing read and write times for each run
+    fig, ax = plt.subplots(figsize=(chart_width / 100, 6))
+    ax.vlines(index, runs[['read_ms', 'write_ms']].min(axis=1), runs[['read_ms', 'write_ms']].max(axis=1), color='black')
+    ax.scatter(index, runs['write_ms'], color='red', label='Write Time')
+    ax.scatter(index, runs['read_ms'], color='green', label='Read Time')
+    ax.set_title('Candlestick Chart of Read vs Write Times for Each Run')
+    ax.set_xlabel('Run')
+    ax.set_ylabel('Time (ms)')
+    ax.legend()
+    plt.savefig(os.path.join(output_folder, 'candlestick_read_vs_write_each_run.png'))
     plt.close()
-    
+
+    plot_latency_distribution(load_histograms(os.path.join(output_folder, 'latency_all_runs.json')), 'Latency Distribution Across All Runs',
+                              os.path.join(output_folder, 'latency_distribution_all_runs.png'), chart_width)
+
+
+# Função do processo de relatórios
+def report_worker(queue: Any, output_folder: str, chart_width: int) -> None:
+    """Render the reports requested on a queue until it receives None.
+
+    Args:
+        queue (Any): The multiprocessing queue of ('run', run number) and ('final', None) requests.
+        output_folder (str): The folder of the execution.
+        chart_width (int): The chart width, in pixels.
+    """
+    for kind, run in iter(queue.get, None):
+        try:
+            if kind == 'run':
+                render_run_report(output_folder, run, chart_width)
+            else:
+                render_final_report(output_folder, chart_width)
+        except Exception as e:
+            logging.error(f"Report {kind} {'' if run is None else run + 1} failed: {e}")
+
+
+# Etapa de relatórios em segundo plano
+class ReportPipeline:
+    """Render the charts of an execution in a separate process, from the metrics persisted in its output folder,
+    so that chart rendering is never counted in a run's wall time.
+
+    Runs are only queued while the simulation goes on; the process is started and renders every queued report in
+    close(), after the last run, so that it never competes with a timed run for the CPU.
+
+    Args:
+        output_folder (str): The folder of the execution.
+        chart_width (int, optional): The chart width, in pixels. Defaults to 600.
+    """
+
+    def __init__(self, output_folder: str, chart_width: int = 600) -> None:
+        self.output_folder = output_folder
+        self.chart_width = chart_width
+        self.runs: List[int] = []
+
+    def submit_run(self, run: int) -> None:
+        """Queue the charts of a run whose metrics were saved, to be rendered in close()."""
+        self.runs.append(run)
+
+    def close(self) -> None:
+        """Render the queued run charts and the charts across runs in the report process, and wait for them."""
+        context = multiprocessing.get_context('spawn')
+        queue = context.Queue()
+        process = context.Process(target=report_worker, args=(queue, self.output_folder, self.chart_width), daemon=True)
+        process.start()
+        for run in self.runs:
+            queue.put(('run', run))
+        queue.put(('final', None))
+        queue.put(None)
+        process.join()
+
 
 # Registrar desempenho
-def measure_performance(runs: int = 10, num_operations: int = 1000, percent_cores: float = 0.5, num_sales: int = 50, num_stores: int = 5, min_products: int = 5, max_products: int = 20, chart_width: int = 600) -> None:
+def measure_performance(runs: int = 10, num_operations: int = 1000, percent_cores: float = 0.5, num_sales: int = 50, num_stores: int = 5, min_products: int = 5, max_products: int = 20, chart_width: int = 600, use_indexes: bool = True, layout: str = STORAGE_LAYOUT, generator: str = GENERATOR_MODE, seed_workers: int = 0, engine: str = ENGINE, concurrency: int = ASYNC_CONCURRENCY, async_backend: str = ASYNC_BACKEND, keep_raw_times: bool = False, use_cache: bool = False, query: str = QUERY_MODE, batch_size: int = QUERY_BATCH_SIZE, distribution: str = None, theta: float = None, workload: str = None, workloads_file: str = WORKLOADS_FILE, record_metrics: bool = True, sample_resources: bool = True, compare_queries: bool = False) -> None:
+    global storage_layout, generator_mode, bulk_generator, stock_cache, query_mode, query_batch_size
+    if layout not in STORAGE_LAYOUTS:
+        raise ValueError(f"Unknown storage layout '{layout}', expected one of {STORAGE_LAYOUTS}.")
+    storage_layout = layout
+    if generator not in GENERATOR_MODES:
+        raise ValueError(f"Unknown generator mode '{generator}', expected one of {GENERATOR_MODES}.")
+    generator_mode = generator
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of {ENGINES}.")
+    if async_backend not in ASYNC_BACKENDS:
+        raise ValueError(f"Unknown async backend '{async_backend}', expected one of {ASYNC_BACKENDS}.")
+    if engine == 'asyncio' and (async_backend == 'memory') != isinstance(db, MemoryDatabase):
+        raise ValueError(f"The '{async_backend}' async backend cannot run over the {'memory' if isinstance(db, MemoryDatabase) else 'mongodb'} backend; "
+                         f"use async_backend='{'memory' if isinstance(db, MemoryDatabase) else 'motor'}'.")
+    if query not in QUERY_PROJECTIONS:
+        raise ValueError(f"Unknown query mode '{query}', expected one of {list(QUERY_PROJECTIONS)}.")
+    if seed_workers > 0 and isinstance(db, MemoryDatabase):
+        raise ValueError("Parallel seeding needs the 'mongodb' backend; the in-memory database lives in this process.")
+    query_mode = query
+    query_batch_size = batch_size
+    if workload is not None:
+        workloads = load_workloads(workloads_file)
+        if workload not in workloads:
+            raise ValueError(f"Unknown workload '{workload}', expected one of {list(workloads)}.")
+        profile = workloads[workload]
+        min_products, max_products = profile['min_products'], profile['max_products']
+    else:
+        profile = WORKLOAD_DEFAULTS
+    # A distribuição e o theta explícitos substituem os do perfil
+    if distribution is not None:
+        profile = {**profile, 'distribution': distribution}
+    if theta is not None:
+        profile = {**profile, 'theta': theta}
+    apply_workload(profile)
     total_times: List[float] = []
-    all_read_times: List[List[float]] = []
-    all_write_times: List[List[float]] = []
-    total_operations: Dict[str, int] = {
-        'query_stock': 0,
-        'update_inventory': 0,
-        'add_store': 0,
-        'add_product': 0
-    }
+    all_read_times: List[float] = []  # Read time (ms) summed per run
+    all_write_times: List[float] = []  # Write time (ms) summed per run
+    all_histograms: Dict[str, LatencyHistogram] = {}
+    run_rows: List[Dict[str, Any]] = []
+    total_operations: Dict[str, int] = dict.fromkeys(OPERATIONS, 0)
 
     # Configurações de simulação
     num_cores = get_num_cores()
@@ -532,20 +6245,83 @@ def measure_performance(runs: int = 10, num_operations: int = 1000, percent_core
     log_file = os.path.join(output_folder, 'simulation_log.txt')
     file_handler = logging.FileHandler(log_file)
     logging.getLogger().addHandler(file_handler)
+    with open(os.path.join(output_folder, 'workload.json'), 'w') as file:
+        json.dump({'name': workload, **profile}, file, indent=4)
+
+    # Gerar os gráficos em outro processo, depois da última rodada
+    report_pipeline = ReportPipeline(output_folder, chart_width)
+
+    # Preparar os índices conforme o modo da simulação
+    index_mode = 'indexed' if use_indexes else 'unindexed'
+    if use_indexes:
+        create_indexes(db)
+    else:
+        drop_indexes(db)
+    logging.info(f"Storage backend: {f'memory ({db.latency_ms} ms per call)' if isinstance(db, MemoryDatabase) else f'mongodb ({MONGO_HOST}:{MONGO_PORT})'}")
+    logging.info(f"Index mode: {index_mode}")
+    logging.info(f"Workload: {workload or 'default'} ({', '.join(f'{operation} {weight:g}' for operation, weight in profile['operations'].items())})")
+    logging.info(f"Storage layout: {storage_layout}")
+    logging.info(f"Generator mode: {'vectorized (the seeding processes always generate in batches)' if seed_workers > 0 else generator_mode}")
+    logging.info(f"Seeding processes: {seed_workers if seed_workers > 0 else 'serial'}")
+    logging.info(f"Engine: {engine}" + (f" ({async_backend} backend, {concurrency} in flight)" if engine == 'asyncio' else ''))
+    logging.info(f"Stock cache: {'enabled' if use_cache else 'disabled'}")
+    logging.info(f"Metrics sink: {os.path.join(output_folder, METRICS_FOLDER) if record_metrics else 'disabled'}")
+    logging.info(f"Query mode: {query_mode} (batch size {query_batch_size})")
+    logging.info(f"Access distribution: {access_distribution}" + (f" (theta {access_theta})" if access_distribution in ['zipfian', 'latest'] else ''))
+    stock_cache = StockCache() if use_cache else None
+    if generator_mode == 'vectorized':
+        bulk_generator = VectorizedGenerator(namespace=timestamp)
+
+    # Aquecer o pool de conexões antes da fase cronometrada
+    if not isinstance(db, MemoryDatabase):
+        max_pool_size = db.client.options.pool_options.max_pool_size
+        if max_workers > max_pool_size:
+            logging.warning(f"{max_workers} workers share {max_pool_size} pooled connections; latencies will include socket queuing.")
+        prewarm_pool(db.client, max_workers)
 
     # for run in tqdm(range(runs), desc="Simulation Runs"):
     for run in range(runs):
-        start_time = time.time()
-        stores = insert_stores(num_stores, min_products, max_products)
-        insert_sales(num_sales, stores)
-        read_times, write_times, operation_counts = simulate_operations(num_operations, stores, percent_cores, run, output_folder)
-        end_time = time.time()
+        start_time = time.perf_counter()
+        if seed_workers > 0:
+            stores = parallel_seed(num_stores, min_products, max_products, num_sales, seed_workers, namespace=f"{timestamp}:{run}", profile=profile)
+        else:
+            stores = insert_stores(num_stores, min_products, max_products)
+            insert_sales(num_sales, stores)
+        if access_distribution != 'uniform':
+            logging.info(f"Run {run + 1} - Hottest 1% of stores receive {access_sampler('stores').top_share(len(stores), 0.01):.2%} of the accesses")
+        pool_monitor.reset()
+        operation_timer.reset()
+        if stock_cache is not None:
+            stock_cache.reset_stats()
+        recorder = LatencyRecorder(MetricsSink(output_folder, run) if record_metrics else None)
+        sampler = ResourceSampler(output_folder, run, db) if sample_resources else None
+        if sampler is not None:
+            sampler.start()
+        timed_start = time.perf_counter()
+        if engine == 'asyncio':
+            read_times, write_times, operation_counts = simulate_operations_async(num_operations, stores, concurrency, run, output_folder, async_backend, recorder, keep_raw_times)
+        else:
+            read_times, write_times, operation_counts = simulate_operations(num_operations, stores, percent_cores, run, output_folder, recorder, keep_raw_times)
+        end_time = time.perf_counter()
+        timed_ms = (end_time - timed_start) * 1000  # Only the operations, without the seeding
+        if sampler is not None:
+            sampler.stop()
+        if recorder.sink is not None:
+            recorder.sink.close()
+        pool_stats = pool_monitor.summary()
+        run_histograms = recorder.merged()
+        save_histograms(run_histograms, os.path.join(output_folder, f'latency_run_{run + 1}.json'))
+        for operation, histogram in run_histograms.items():
+            all_histograms.setdefault(operation, LatencyHistogram()).merge(histogram)
 
         total_times.append((end_time - start_time) * 1000)  # Convert to milliseconds
-        all_read_times.append(read_times)
-        all_write_times.append(write_times)
+        all_read_times.append(combine_histograms(run_histograms, READ_OPERATIONS).total_us / 1000)
+        all_write_times.append(combine_histograms(run_histograms, WRITE_OPERATIONS).total_us / 1000)
         for key in total_operations:
             total_operations[key] += operation_counts[key]
+        run_rows.append({'run': run + 1, 'total_ms': total_times[-1], 'timed_ms': timed_ms, 'read_ms': all_read_times[-1], 'write_ms': all_write_times[-1], **operation_counts})
+        pd.DataFrame(run_rows).to_csv(os.path.join(output_folder, 'runs.csv'), index=False)
+        report_pipeline.submit_run(run)
             
         #print("\n\n", all_read_times, "\n\n")
 
@@ -553,226 +6329,211 @@ def measure_performance(runs: int = 10, num_operations: int = 1000, percent_core
         # avg_write_time = sum(all_write_times) / len(all_write_times) if all_write_times else 0
         # avg_total_time = sum(total_times) / len(total_times) if total_times else 0
         
-        avg_read_time = sum([sum(rt) for rt in all_read_times]) / len(all_read_times) if all_read_times else 0
-        avg_write_time = sum([sum(wt) for wt in all_write_times]) / len(all_write_times) if all_write_times else 0
+        avg_read_time = sum(all_read_times) / len(all_read_times) if all_read_times else 0
+        avg_write_time = sum(all_write_times) / len(all_write_times) if all_write_times else 0
         avg_total_time = sum(total_times) / len(total_times) if total_times else 0
 
         logging.info(f"Run {run + 1} - Total execution time: {(end_time - start_time) * 1000:.4f} ms")
-        logging.info(f"Run {run + 1} - Number of query_stock: {operation_counts['query_stock']}")
-        logging.info(f"Run {run + 1} - Number of update_inventory: {operation_counts['update_inventory']}")
-        logging.info(f"Run {run + 1} - Number of add_store: {operation_counts['add_store']}")
-        logging.info(f"Run {run + 1} - Number of add_product: {operation_counts['add_product']}")
+        for operation in OPERATIONS:
+            logging.info(f"Run {run + 1} - Number of {operation}: {operation_counts[operation]}")
         logging.info(f"Run {run + 1} - Average read time: {avg_read_time:.4f} ms")
         logging.info(f"Run {run + 1} - Average write time: {avg_write_time:.4f} ms")
+        logging.info(f"Run {run + 1} - Pool checkouts: {pool_stats['checkouts']} (failures: {pool_stats['checkout_failures']})")
+        logging.info(f"Run {run + 1} - Pool checkout wait: avg {pool_stats['avg_wait_ms']:.4f} ms, max {pool_stats['max_wait_ms']:.4f} ms")
+        logging.info(f"Run {run + 1} - Pool connections created: {pool_stats['connections_created']}")
+        log_latency_summary(run_histograms, f"Run {run + 1}")
+        log_phase_summary(f"Run {run + 1}")
+        log_cache_stats(f"Run {run + 1}")
 
     # final_avg_total_time = sum(total_times) / len(total_times) if total_times else 0
     # final_avg_read_time = sum(all_read_times) / len(all_read_times) if all_read_times else 0
     # final_avg_write_time = sum(all_write_times) / len(all_write_times) if all_write_times else 0
     
     final_avg_total_time = sum(total_times) / len(total_times) if total_times else 0
-    final_avg_read_time = sum([sum(rt) for rt in all_read_times]) / len(all_read_times) if all_read_times else 0
-    final_avg_write_time = sum([sum(wt) for wt in all_write_times]) / len(all_write_times) if all_write_times else 0
+    final_avg_read_time = sum(all_read_times) / len(all_read_times) if all_read_times else 0
+    final_avg_write_time = sum(all_write_times) / len(all_write_times) if all_write_times else 0
 
+    explain_queries(db)
+    log_storage_stats(db)
+    if compare_queries:
+        # Compara os modos de consulta sobre as filiais da última rodada
+        benchmark_query_modes([store['store_id'] for store in stores], output_folder)
     logging.info(f"Final Average total execution time: {final_avg_total_time:.4f} ms")
     logging.info(f"Final Average read time: {final_avg_read_time:.4f} ms")
     logging.info(f"Final Average write time: {final_avg_write_time:.4f} ms")
-    logging.info(f"Total Number of query_stock: {total_operations['query_stock']}")
-    logging.info(f"Total Number of update_inventory: {total_operations['update_inventory']}")
-    logging.info(f"Total Number of add_store: {total_operations['add_store']}")
-    logging.info(f"Total Number of add_product: {total_operations['add_product']}")
-    
-    # Flatten the lists for scatter plots
-    # flat_all_read_times = [time for sublist in all_read_times for time in sublist]
-    # flat_all_write_times = [time for sublist in all_write_times for time in sublist]
-    flat_all_read_times = [sum(itens) for itens in all_read_times]
-    flat_all_write_times = [sum(itens) for itens in all_write_times]
-
-    # Max values and subdivisions for vertical and horizontal axes
-    # max_read_time = max(all_read_times) if all_read_times else 0
-    max_read_time = max(flat_all_read_times) if flat_all_read_times else 0
-    # max_write_time = max(all_write_times) if all_write_times else 0
-    max_write_time = max(flat_all_write_times) if flat_all_write_times else 0
-    max_total_time = max(total_times) if total_times else 0
-    max_operations = max(num_operations, runs)
-
-    # Scatter plot for total read times across all runs
-    plt.figure(figsize=(chart_width / 100, 6))
-    # plt.scatter(range(len(all_read_times)), all_read_times)
-    plt.scatter(range(len(flat_all_read_times)), flat_all_read_times)
-    plt.axhline(y=final_avg_read_time, color='r', linestyle='-', label=f'Avg: {final_avg_read_time:.2f} ms')
-    plt.title('Total Read Times Across All Runs')
-    plt.xlabel('Operation')
-    plt.ylabel('Read Time (ms)')
-    plt.legend()
-    plt.yticks(np.arange(0, max_read_time + 5, 5))
-    # plt.yticks(np.arange(0, max(max_read_time) + 5, 5))
-    # plt.yticks(np.arange(0, max_read_time, 5))
-    plt.xticks(np.arange(0, max_operations, max(10, max_operations // 10)))
-    plt.savefig(os.path.join(output_folder, 'total_read_times_all_runs.png'))
-    plt.close()
+    for operation in OPERATIONS:
+        logging.info(f"Total Number of {operation}: {total_operations[operation]}")
+    log_latency_summary(all_histograms, "All runs")
+    save_histograms(all_histograms, os.path.join(output_folder, 'latency_all_runs.json'))
+    report_pipeline.close()
 
-    # Scatter plot for total write times across all runs
-    plt.figure(figsize=(chart_width / 100, 6))
-    # plt.scatter(range(len(all_write_times)), all_write_times)
-    plt.scatter(range(len(flat_all_write_times)), flat_all_write_times)
-    plt.axhline(y=final_avg_write_time, color='r', linestyle='-', label=f'Avg: {final_avg_write_time:.2f} ms')
-    plt.title('Total Write Times Across All Runs')
-    plt.xlabel('Operation')
-    plt.ylabel('Write Time (ms)')
-    plt.legend()
-    plt.yticks(np.arange(0, max_write_time + 5, 5))
-    # plt.yticks(np.arange(0, max(max_write_time) + 5, 5))
-    plt.xticks(np.arange(0, max_operations, max(10, max_operations // 10)))
-    plt.savefig(os.path.join(output_folder, 'total_write_times_all_runs.png'))
-    plt.close()
 
-    # Scatter plot for total execution times across all runs
-    plt.figure(figsize=(chart_width / 100, 6))
-    plt.scatter(range(len(total_times)), total_times)
-    plt.axhline(y=final_avg_total_time, color='r', linestyle='-', label=f'Avg: {final_avg_total_time:.2f} ms')
-    plt.title('Total Execution Times Across All Runs')
-    plt.xlabel('Operation')
-    plt.ylabel('Total Execution Time (ms)')
-    plt.legend()
-    plt.yticks(np.arange(0, max_total_time + 5, 5))
-    plt.xticks(np.arange(0, max_operations, max(10, max_operations // 10)))
-    plt.savefig(os.path.join(output_folder, 'total_execution_times_all_runs.png'))
-    plt.close()
+###########################
+# Comparação de execuções #
+###########################
 
-    # Bar chart with average line for read times across all runs
-    plt.figure(figsize=(chart_width / 100, 6))
-    # plt.bar(range(len(all_read_times)), all_read_times)
-    plt.bar(range(len(flat_all_read_times)), flat_all_read_times)
-    plt.axhline(y=final_avg_read_time, color='r', linestyle='-', label=f'Avg: {final_avg_read_time:.2f} ms')
-    plt.title('Read Times Across All Runs')
-    plt.xlabel('Operation')
-    plt.ylabel('Read Time (ms)')
-    plt.legend()
-    plt.yticks(np.arange(0, max_read_time + 5, 5))
-    # plt.yticks(np.arange(0, max(max_read_time) + 5, 5))
-    plt.xticks(np.arange(0, max_operations, max(10, max_operations // 10)))
-    # for i, v in enumerate(all_read_times):
-    # for i, v in enumerate(flat_all_read_times):
-    #     plt.text(i, v + 0.5, f"{v:.2f}", ha='center')
-    plt.savefig(os.path.join(output_folder, 'read_times_bar_all_runs.png'))
-    plt.close()
+# Configurar a comparação de execuções
+COMPARE_PERCENTILES = [50, 90, 99]
+BOOTSTRAP_SAMPLES = 1000
+BOOTSTRAP_MAX_VALUES = 100_000
+BOOTSTRAP_CHUNK = 50
+CONFIDENCE_LEVEL = 0.95
+REGRESSION_THRESHOLD = 0.10
 
-    # Bar chart with average line for write times across all runs
-    plt.figure(figsize=(chart_width / 100, 6))
-    # plt.bar(range(len(all_write_times)), all_write_times)
-    plt.bar(range(len(flat_all_write_times)), flat_all_write_times)
-    plt.axhline(y=final_avg_write_time, color='r', linestyle='-', label=f'Avg: {final_avg_write_time:.2f} ms')
-    plt.title('Write Times Across All Runs')
-    plt.xlabel('Operation')
-    plt.ylabel('Write Time (ms)')
-    plt.legend()
-    plt.yticks(np.arange(0, max_write_time + 5, 5))
-    # plt.yticks(np.arange(0, max(max_write_time) + 5, 5))
-    plt.xticks(np.arange(0, max_operations, max(10, max_operations // 10)))
-    # for i, v in enumerate(all_write_times):
-    # for i, v in enumerate(flat_all_write_times):
-    #     plt.text(i, v + 0.5, f"{v:.2f}", ha='center')
-    plt.savefig(os.path.join(output_folder, 'write_times_bar_all_runs.png'))
-    plt.close()
 
-    # Bar chart with average line for total times across all runs
-    plt.figure(figsize=(chart_width / 100, 6))
-    plt.bar(range(len(total_times)), total_times)
-    plt.axhline(y=final_avg_total_time, color='r', linestyle='-', label=f'Avg: {final_avg_total_time:.2f} ms')
-    plt.title('Total Execution Times Across All Runs')
-    plt.xlabel('Operation')
-    plt.ylabel('Total Execution Time (ms)')
-    plt.legend()
-    plt.yticks(np.arange(0, max_total_time + 5, 5))
-    plt.xticks(np.arange(0, max_operations, max(10, max_operations // 10)))
-    # for i, v in enumerate(total_times):
-    #     plt.text(i, v + 0.5, f"{v:.2f}", ha='center')
-    plt.savefig(os.path.join(output_folder, 'total_execution_times_bar_all_runs.png'))
-    plt.close()
+# Função para carregar as latências de uma execução
+def execution_latencies(folder: str) -> Dict[str, np.ndarray]:
+    """Get the latencies (ms) of the successful operations of an execution, by operation type.
 
+    Reads the per-operation metrics when the execution saved them, otherwise expands the buckets of latency_all_runs.json.
 
-    # max_read_time = max(max(sublist) for sublist in all_read_times if sublist)
-    # max_write_time = max(max(sublist) for sublist in all_write_times if sublist)
-    
-    # Bar chart comparing read and write times for each run
-    plt.figure(figsize=(chart_width / 100, 6))
-    bar_width = 0.35
-    index = np.arange(runs)
-    plt.bar(index, [sum(read_times) for read_times in all_read_times], bar_width, label='Read Time')
-    plt.bar(index + bar_width, [sum(write_times) for write_times in all_write_times], bar_width, label='Write Time')
-    plt.title('Read vs Write Times for Each Run')
-    plt.xlabel('Run')
-    plt.ylabel('Time (ms)')
-    plt.xticks(index + bar_width / 2, np.arange(runs))
-    #plt.yticks(np.arange(0, max(max(all_read_times), max(all_write_times)) + 250, 250))
-    plt.yticks(np.arange(0, max(max(flat_all_read_times), max(flat_all_write_times)) + 250, 250))
-    # plt.yticks(np.arange(0, max(max_read_time, max_write_time) + 250, 250))
-    plt.legend()
-    plt.savefig(os.path.join(output_folder, 'read_vs_write_each_run.png'))
-    plt.close()
+    Args:
+        folder (str): The execution folder.
 
-    # Candlestick chart comparing read and write times for each run
-    # df = pd.DataFrame({
-    #     'read_times': [sum(read_times) for read_times in all_read_times],
-    #     'write_times': [sum(write_times) for write_times in all_write_times]
-    # })
-    # df['run'] = np.arange(runs)
-    # # df.set_index('run', inplace=True)
-
-    # # mpf.plot(
-    # #     df,
-    # #     type='candle',
-    # #     style='charles',
-    # #     title='Candlestick Chart of Read vs Write Times for Each Run',
-    # #     ylabel='Time (ms)',
-    # #     savefig=os.path.join(output_folder, 'candlestick_read_vs_write_each_run.png')
-    # # )
-    # # Configurando o gráfico
-    # fig, ax = plt.subplots()
-
-    # # Para cada run, desenhe um candlestick
-    # for i in range(len(df)):
-    #     # Definindo cores para os candlesticks baseado na comparação entre leitura e escrita
-    #     color = 'green' if df.loc[i, 'read_times'] <= df.loc[i, 'write_times'] else 'red'
-        
-    #     # Desenhando o corpo do candlestick
-    #     ax.plot([i, i], [df.loc[i, 'read_times'], df.loc[i, 'write_times']], color=color, lw=2)
-        
-    #     # Aqui você adicionaria o código para desenhar as sombras dos candlesticks
-    #     # Como não temos dados de máximo e mínimo, isso será omitido
+    Returns:
+        Dict[str, np.ndarray]: The latencies of each operation type.
+    """
+    if os.path.isdir(os.path.join(folder, METRICS_FOLDER)):
+        metrics = load_metrics(folder)
+        metrics = metrics[metrics['outcome'] == 'ok']
+        return {operation: group['duration_ms'].to_numpy() for operation, group in metrics.groupby('operation', observed=True)}
+    latencies = {}
+    for operation, histogram in load_histograms(os.path.join(folder, 'latency_all_runs.json')).items():
+        values, counts = histogram.distribution()
+        latencies[operation] = np.repeat(values, counts)
+    return latencies
 
-    # # Configurações adicionais do gráfico
-    # ax.set_title('Candlestick Chart of Read vs Write Times for Each Run')
-    # ax.set_ylabel('Time (ms)')
-    # ax.set_xticks(range(len(df)))
-    # ax.set_xticklabels(df['run'])
 
-    # # Salvando o gráfico
-    # plt.savefig(os.path.join(output_folder, 'candlestick_read_vs_write_each_run_matplotlib.png'))
-    
-    # Convert times to DataFrame
-    df = pd.DataFrame({
-        'run': np.arange(runs),
-        'read_times': [sum(rt) for rt in all_read_times],
-        'write_times': [sum(wt) for wt in all_write_times]
-    })
-    df['total_times'] = df['read_times'] + df['write_times']
-
-    # Generate candlestick chart
-    fig, ax = plt.subplots(figsize=(chart_width / 100, 6))
-    for idx, row in df.iterrows():
-        ax.plot([row['run'], row['run']], [row['write_times'], row['read_times']], color='black')
-        ax.plot(row['run'], row['write_times'], marker='o', color='red')
-        ax.plot(row['run'], row['read_times'], marker='o', color='green')
-    ax.set_title('Candlestick Chart of Read vs Write Times for Each Run')
-    ax.set_xlabel('Run')
-    ax.set_ylabel('Time (ms)')
-    ax.set_xticks(np.arange(0, runs, max(1, runs // 10)))
-    ax.set_yticks(np.arange(0, max(max_read_time, max_write_time) + 5, 5))
-    #fig.legend(['Write Time', 'Read Time'])
-    plt.savefig(os.path.join(output_folder, 'candlestick_read_vs_write_each_run.png'))
-    plt.close()
+# Função para carregar as vazões de uma execução
+def execution_throughputs(folder: str) -> np.ndarray:
+    """Get the throughput (operations per second) of each run of an execution.
+
+    Uses the span of the per-operation metrics when the execution saved them, otherwise the duration of the timed phase
+    in runs.csv (timed_ms, which leaves out the seeding; executions older than that column fall back to total_ms).
+
+    Args:
+        folder (str): The execution folder.
+
+    Returns:
+        np.ndarray: The throughput of each run.
+    """
+    if os.path.isdir(os.path.join(folder, METRICS_FOLDER)):
+        metrics = load_metrics(folder)
+        runs = metrics.assign(end_ns=metrics['start_ns'] + metrics['duration_ns']).groupby('run').agg(
+            operations=('start_ns', 'size'), start_ns=('start_ns', 'min'), end_ns=('end_ns', 'max'))
+        return (runs['operations'] / ((runs['end_ns'] - runs['start_ns']) / 1e9)).to_numpy()
+    runs = pd.read_csv(os.path.join(folder, 'runs.csv'))
+    duration_ms = runs['timed_ms'] if 'timed_ms' in runs else runs['total_ms']
+    return (runs[[column for column in OPERATIONS if column in runs]].sum(axis=1) / (duration_ms / 1000)).to_numpy()
+
+
+# Função para estimar por bootstrap a variação relativa de uma estatística
+def bootstrap_delta(baseline: np.ndarray, candidate: np.ndarray, statistic: Any, samples: int = BOOTSTRAP_SAMPLES, confidence: float = CONFIDENCE_LEVEL, rng: np.random.Generator = None) -> Tuple[Any, Any, Any]:
+    """Estimate the relative change of one or more statistics from baseline to candidate, with percentile bootstrap intervals.
+
+    Every statistic is computed on the same resamples, so several percentiles cost a single bootstrap.
+
+    Args:
+        baseline (np.ndarray): The baseline values.
+        candidate (np.ndarray): The candidate values.
+        statistic (Any): Computes the statistic of each row of a 2-D array, as one value per row (e.g. lambda x: x.mean(axis=1))
+            or as one row of values per row (e.g. lambda x: np.percentile(x, [50, 99], axis=1).T).
+        samples (int, optional): The bootstrap resamples. Defaults to BOOTSTRAP_SAMPLES.
+        confidence (float, optional): The confidence level of the interval. Defaults to CONFIDENCE_LEVEL.
+        rng (np.random.Generator, optional): The random generator. Defaults to None.
+
+    Returns:
+        Tuple[Any, Any, Any]: The relative change and the bounds of its interval (NaN when a side has fewer than 2 values),
+            each a float or an array with one value per statistic.
+    """
+    rng = rng or np.random.default_rng()
+    baseline = rng.choice(baseline, BOOTSTRAP_MAX_VALUES, replace=False) if len(baseline) > BOOTSTRAP_MAX_VALUES else baseline
+    candidate = rng.choice(candidate, BOOTSTRAP_MAX_VALUES, replace=False) if len(candidate) > BOOTSTRAP_MAX_VALUES else candidate
+    delta = statistic(candidate[np.newaxis])[0] / statistic(baseline[np.newaxis])[0] - 1
+    if len(baseline) < 2 or len(candidate) < 2:
+        return delta, np.full_like(delta, np.nan), np.full_like(delta, np.nan)
+    deltas = []
+    for start in range(0, samples, BOOTSTRAP_CHUNK):
+        size = min(BOOTSTRAP_CHUNK, samples - start)
+        baseline_statistic = statistic(baseline[rng.integers(0, len(baseline), (size, len(baseline)))])
+        candidate_statistic = statistic(candidate[rng.integers(0, len(candidate), (size, len(candidate)))])
+        deltas.append(candidate_statistic / baseline_statistic - 1)
+    low, high = np.quantile(np.concatenate(deltas), [(1 - confidence) / 2, (1 + confidence) / 2], axis=0)
+    return delta, low, high
+
 
+# Função para comparar duas execuções
+def compare_executions(baseline_folder: str, candidate_folder: str, percentiles: List[float] = COMPARE_PERCENTILES, samples: int = BOOTSTRAP_SAMPLES, confidence: float = CONFIDENCE_LEVEL, threshold: float = REGRESSION_THRESHOLD, seed: int = None) -> pd.DataFrame:
+    """Compare the latency percentiles of each operation type and the throughput of a candidate execution against a baseline.
+
+    A change is significant when its bootstrap interval excludes zero, and a regression when it is significant, makes
+    the candidate worse (higher latency or lower throughput) and exceeds the threshold.
+
+    Args:
+        baseline_folder (str): The baseline execution folder.
+        candidate_folder (str): The candidate execution folder.
+        percentiles (List[float], optional): The latency percentiles to compare. Defaults to COMPARE_PERCENTILES.
+        samples (int, optional): The bootstrap resamples. Defaults to BOOTSTRAP_SAMPLES.
+        confidence (float, optional): The confidence level of the intervals. Defaults to CONFIDENCE_LEVEL.
+        threshold (float, optional): The relative change past which a significant worsening is a regression. Defaults to REGRESSION_THRESHOLD.
+        seed (int, optional): The seed of the bootstrap. Defaults to None.
+
+    Returns:
+        pd.DataFrame: One row per operation and metric with the baseline and candidate values, the relative change, its interval and the flags.
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    baseline_latencies = execution_latencies(baseline_folder)
+    candidate_latencies = execution_latencies(candidate_folder)
+    for operation in sorted(set(baseline_latencies) & set(candidate_latencies)):
+        baseline, candidate = baseline_latencies[operation], candidate_latencies[operation]
+        statistic = lambda values: np.percentile(values, percentiles, axis=1).T
+        deltas, lows, highs = bootstrap_delta(baseline, candidate, statistic, samples, confidence, rng)
+        for percentile, delta, low, high in zip(percentiles, deltas, lows, highs):
+            rows.append({'operation': operation, 'metric': f'p{percentile:g}_ms', 'baseline': np.percentile(baseline, percentile),
+                         'candidate': np.percentile(candidate, percentile), 'delta': delta, 'ci_low': low, 'ci_high': high,
+                         'significant': bool(low > 0 or high < 0), 'regression': bool(low > 0 and delta > threshold)})
+    baseline, candidate = execution_throughputs(baseline_folder), execution_throughputs(candidate_folder)
+    delta, low, high = bootstrap_delta(baseline, candidate, lambda values: values.mean(axis=1), samples, confidence, rng)
+    rows.append({'operation': 'all', 'metric': 'throughput_ops', 'baseline': baseline.mean(), 'candidate': candidate.mean(),
+                 'delta': delta, 'ci_low': low, 'ci_high': high,
+                 'significant': bool(low > 0 or high < 0), 'regression': bool(high < 0 and delta < -threshold)})
+    comparison = pd.DataFrame(rows)
+    comparison.insert(0, 'candidate_folder', candidate_folder)
+    comparison.insert(0, 'baseline_folder', baseline_folder)
+    return comparison
+
+
+# Função para comparar execuções pela linha de comando
+def compare_command(folders: List[str], samples: int = BOOTSTRAP_SAMPLES, confidence: float = CONFIDENCE_LEVEL, threshold: float = REGRESSION_THRESHOLD, seed: int = None, output: str = None) -> int:
+    """Compare each execution against the first one and print the deltas.
+
+    Args:
+        folders (List[str]): The execution folders; the first one is the baseline.
+        samples (int, optional): The bootstrap resamples. Defaults to BOOTSTRAP_SAMPLES.
+        confidence (float, optional): The confidence level of the intervals. Defaults to CONFIDENCE_LEVEL.
+        threshold (float, optional): The relative change past which a significant worsening is a regression. Defaults to REGRESSION_THRESHOLD.
+        seed (int, optional): The seed of the bootstrap. Defaults to None.
+        output (str, optional): A CSV file to save the comparison to. Defaults to None.
+
+    Returns:
+        int: The exit status, 1 when a regression was found and 0 otherwise.
+    """
+    comparison = pd.concat([compare_executions(folders[0], folder, samples=samples, confidence=confidence, threshold=threshold, seed=seed)
+                            for folder in folders[1:]], ignore_index=True)
+    if output:
+        comparison.to_csv(output, index=False)
+    for candidate_folder, rows in comparison.groupby('candidate_folder', sort=False):
+        print(f"\n{folders[0]} -> {candidate_folder}")
+        for row in rows.itertuples():
+            flag = 'REGRESSION' if row.regression else ('significant' if row.significant else '')
+            print(f"  {row.operation:<18} {row.metric:<15} {row.baseline:>12.4f} {row.candidate:>12.4f} {row.delta:>+8.2%} "
+                  f"[{row.ci_low:+.2%}, {row.ci_high:+.2%}] {flag}")
+    regressions = comparison[comparison['regression']]
+    if len(regressions):
+        print(f"\n{len(regressions)} regression(s) past {threshold:.0%} at {confidence:.0%} confidence.")
+        return 1
+    return 0
 
 
 #############
@@ -780,11 +6541,52 @@ def measure_performance(runs: int = 10, num_operations: int = 1000, percent_core
 #############
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='MongoDB inventory performance simulation.')
+    parser.add_argument('--workload', help='Workload profile to run (see --list-workloads); defaults to the original uniform mix.')
+    parser.add_argument('--workloads-file', default=WORKLOADS_FILE, help='JSON file with the workload profiles.')
+    parser.add_argument('--list-workloads', action='store_true', help='List the workload profiles and exit.')
+    parser.add_argument('--runs', type=int, default=10, help='Number of simulation runs.')
+    parser.add_argument('--operations', type=int, default=100, help='Number of operations per run.')
+    parser.add_argument('--backend', choices=BACKENDS, default=BACKEND, help='Storage backend: the configured mongod or the in-memory engine.')
+    parser.add_argument('--pool-profile', choices=list(POOL_PROFILES), default=POOL_PROFILE, help='Connection pool profile of the mongodb backend.')
+    parser.add_argument('--memory-latency-ms', type=float, default=MEMORY_LATENCY_MS, help='Round trip injected in each call of the in-memory backend.')
+    parser.add_argument('--engine', choices=ENGINES, default=ENGINE, help='Workload engine: a thread pool or an asyncio event loop.')
+    parser.add_argument('--concurrency', type=int, default=ASYNC_CONCURRENCY, help='In-flight operations of the asyncio engine.')
+    parser.add_argument('--compare-queries', action='store_true', help="Compare the query modes on the last run's stores after the runs.")
+    parser.add_argument('--no-indexes', action='store_true', help='Drop the declared indexes and run unindexed; pass both execution folders to compare for the side-by-side report.')
+    parser.add_argument('--layout', choices=STORAGE_LAYOUTS, default=STORAGE_LAYOUT, help='Storage layout of the products.')
+    parser.add_argument('--generator', choices=GENERATOR_MODES, default=GENERATOR_MODE, help='Generator of the seeded data.')
+    parser.add_argument('--seed-workers', type=int, default=0, help='Processes seeding the mongodb backend in parallel (0 seeds in this process).')
+    parser.add_argument('--cache', action='store_true', help='Serve query_stock through the read-through stock cache.')
+    parser.add_argument('--query', choices=list(QUERY_PROJECTIONS), default=QUERY_MODE, help='Projection of the query_stock reads.')
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, help="Access distribution of stores and products; overrides the workload's.")
+    parser.add_argument('--theta', type=float, help="Zipfian skew; overrides the workload's.")
+    subparsers = parser.add_subparsers(dest='command')
+    compare_parser = subparsers.add_parser('compare', help='Compare executions against a baseline and exit non-zero on regressions.')
+    compare_parser.add_argument('folders', nargs='+', help='Execution folders; the first one is the baseline.')
+    compare_parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help='Relative worsening that fails the comparison.')
+    compare_parser.add_argument('--confidence', type=float, default=CONFIDENCE_LEVEL, help='Confidence level of the bootstrap intervals.')
+    compare_parser.add_argument('--bootstrap', type=int, default=BOOTSTRAP_SAMPLES, help='Number of bootstrap resamples.')
+    compare_parser.add_argument('--seed', type=int, help='Seed of the bootstrap.')
+    compare_parser.add_argument('--output', help='CSV file to save the comparison to.')
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        if len(args.folders) < 2:
+            parser.error('compare needs a baseline and at least one other execution folder')
+        sys.exit(compare_command(args.folders, args.bootstrap, args.confidence, args.threshold, args.seed, args.output))
+
+    if args.list_workloads:
+        for name, profile in load_workloads(args.workloads_file).items():
+            print(f"{name}: {profile.get('description', '')}")
+        sys.exit(0)
+    if args.workload is not None and args.workload not in load_workloads(args.workloads_file):
+        parser.error(f"unknown workload '{args.workload}' (see --list-workloads)")
+
     log_system_info()
-    db = check_and_create_db(MONGO_HOST, MONGO_PORT, DB_NAME, USER, PASS, COLLECTIONS)
+    db = open_backend(args.backend, args.memory_latency_ms, args.pool_profile, max(1, int(get_num_cores() * 0.5)))
     #print('', db)
-    stores_collection = db['stores']
-    products_collection = db['products']
-    sales_collection = db['sales']
-    measure_performance(10, 100)
+    measure_performance(args.runs, args.operations, workload=args.workload, workloads_file=args.workloads_file, compare_queries=args.compare_queries,
+                        use_indexes=not args.no_indexes, layout=args.layout, generator=args.generator, seed_workers=args.seed_workers, use_cache=args.cache, query=args.query,
+                        distribution=args.distribution, theta=args.theta, engine=args.engine, concurrency=args.concurrency, async_backend='memory' if args.backend == 'memory' else 'motor')
     
\ No newline at end of file
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Tornar o main.py da raiz importável nos testes
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,154 @@
+import pymongo
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+import main
+from main import MISSING, MemoryCollection, MemoryIndex, match_condition
+
+
+# Coleção em memória sem latência injetada
+@pytest.fixture
+def collection() -> MemoryCollection:
+    return MemoryCollection('products')
+
+
+def ids(documents):
+    return sorted(document['product_id'] for document in documents)
+
+
+# Consultas por prefixo das chaves do índice
+def test_index_lookup_uses_longest_equality_prefix():
+    index = MemoryIndex('store_product', [('store_id', pymongo.ASCENDING), ('product_id', pymongo.ASCENDING)])
+    documents = [{'store_id': store_id, 'product_id': f'{store_id}-{number}'} for store_id in 'ab' for number in range(3)]
+    for document in documents:
+        index.add(document)
+
+    used, candidates = index.lookup({'store_id': 'a'})
+    assert used == 1
+    assert ids(candidates) == ['a-0', 'a-1', 'a-2']
+
+    used, candidates = index.lookup({'store_id': 'b', 'product_id': 'b-1'})
+    assert used == 2
+    assert ids(candidates) == ['b-1']
+
+    assert index.lookup({'store_id': {'$eq': 'a'}, 'product_id': 'a-2'})[0] == 2
+    assert index.lookup({'store_id': 'a', 'product_id': {'$gt': 'a-0'}})[0] == 1
+    assert index.lookup({'product_id': 'a-1'}) == (0, [])
+    assert index.lookup({'store_id': {'$in': ['a', 'b']}}) == (0, [])
+
+
+def test_plan_prefers_the_index_matching_more_keys(collection):
+    collection.create_index('store_id')
+    collection.create_index([('store_id', pymongo.ASCENDING), ('product_id', pymongo.ASCENDING)], name='store_product')
+    collection.insert_many([{'store_id': 'a', 'product_id': f'a-{number}'} for number in range(5)])
+
+    index_name, candidates = collection._plan({'store_id': 'a', 'product_id': 'a-3'})
+    assert index_name == 'store_product'
+    assert ids(candidates) == ['a-3']
+    assert collection._plan({'price': 10})[0] is None
+
+
+def test_partial_index_only_serves_covered_queries(collection):
+    collection.create_index('stock_quantity', name='low_stock', partialFilterExpression={'stock_quantity': {'$lt': 10}})
+    collection.insert_many([{'product_id': 'p1', 'stock_quantity': 5}, {'product_id': 'p2', 'stock_quantity': 50}])
+
+    assert ids(collection.indexes['low_stock'].entries()) == ['p1']
+    assert collection._plan({'stock_quantity': 5})[0] == 'low_stock'
+    assert collection._plan({'stock_quantity': 50})[0] is None
+
+
+# Reversão dos índices quando um índice único rejeita o documento
+def test_unique_violation_leaves_no_index_entries(collection):
+    collection.create_index('store_id')
+    collection.create_index('sku', unique=True)
+    collection.insert_one({'product_id': 'p1', 'store_id': 'a', 'sku': '123'})
+
+    with pytest.raises(DuplicateKeyError):
+        collection.insert_one({'product_id': 'p2', 'store_id': 'b', 'sku': '123'})
+
+    assert ids(collection.documents) == ['p1']
+    assert collection.indexes['store_id_1'].lookup({'store_id': 'b'}) == (1, [])
+    assert ids(collection.indexes['_id_'].entries()) == ['p1']
+    assert collection.find_one({'sku': '123'})['product_id'] == 'p1'
+
+
+# Reindexação dos campos atualizados
+def test_update_reindexes_changed_fields(collection):
+    collection.create_index('store_id')
+    collection.create_index('stock_quantity', name='low_stock', partialFilterExpression={'stock_quantity': {'$lt': 10}})
+    collection.insert_one({'product_id': 'p1', 'store_id': 'a', 'stock_quantity': 12})
+
+    collection.update_one({'product_id': 'p1'}, {'$set': {'store_id': 'b'}, '$inc': {'stock_quantity': -4}})
+
+    assert collection.indexes['store_id_1'].lookup({'store_id': 'a'}) == (1, [])
+    assert ids(collection.indexes['store_id_1'].lookup({'store_id': 'b'})[1]) == ['p1']
+    assert ids(collection.indexes['low_stock'].entries()) == ['p1']
+    assert ids(collection.find({'store_id': 'b', 'stock_quantity': {'$lt': 10}})) == ['p1']
+
+    collection.update_one({'product_id': 'p1'}, {'$inc': {'stock_quantity': 10}})
+    assert collection.indexes['low_stock'].entries() == []
+
+
+# Operador posicional com $elemMatch
+def test_elem_match_positional_update_targets_the_matched_element(collection):
+    collection.insert_one({'store_id': 'a', 'products': [{'product_id': 'p1', 'stock_quantity': 1},
+                                                         {'product_id': 'p2', 'stock_quantity': 8},
+                                                         {'product_id': 'p3', 'stock_quantity': 8}]})
+
+    query = {'store_id': 'a', 'products': {'$elemMatch': {'product_id': 'p2', 'stock_quantity': {'$gte': 3}}}}
+    result = collection.update_one(query, {'$inc': {'products.$.stock_quantity': -3}})
+    assert result.matched_count == 1
+    stocks = [product['stock_quantity'] for product in collection.find_one({'store_id': 'a'})['products']]
+    assert stocks == [1, 5, 8]
+
+    query = {'store_id': 'a', 'products': {'$elemMatch': {'product_id': 'p1', 'stock_quantity': {'$gte': 3}}}}
+    assert collection.update_one(query, {'$inc': {'products.$.stock_quantity': -3}}).matched_count == 0
+    assert collection.find_one({'store_id': 'a'})['products'][0]['stock_quantity'] == 1
+
+
+def test_dotted_path_positional_update(collection):
+    collection.insert_one({'store_id': 'a', 'products': [{'product_id': 'p1', 'stock_quantity': 1}, {'product_id': 'p2', 'stock_quantity': 2}]})
+
+    collection.update_one({'store_id': 'a', 'products.product_id': 'p2'}, {'$inc': {'products.$.stock_quantity': 5}})
+
+    assert [product['stock_quantity'] for product in collection.find_one({'store_id': 'a'})['products']] == [1, 7]
+
+
+# Operadores de consulta
+@pytest.mark.parametrize('value, condition, expected', [
+    (5, 5, True),
+    (5, 6, False),
+    (MISSING, None, False),
+    (5, {'$eq': 5}, True),
+    (5, {'$ne': 5}, False),
+    (MISSING, {'$ne': 5}, True),
+    (5, {'$gt': 4}, True),
+    (5, {'$gt': 5}, False),
+    (5, {'$gte': 5}, True),
+    (5, {'$lt': 5}, False),
+    (5, {'$lte': 5}, True),
+    (5, {'$gte': 1, '$lt': 10}, True),
+    (5, {'$gte': 1, '$lt': 5}, False),
+    (None, {'$lt': 10}, False),
+    (MISSING, {'$gt': 0}, False),
+    ('b', {'$in': ['a', 'b']}, True),
+    ('c', {'$in': ['a', 'b']}, False),
+    (MISSING, {'$exists': False}, True),
+    (5, {'$exists': True}, True),
+    (None, {'$exists': True}, True),
+    ({'nested': 1}, {'nested': 1}, True),
+])
+def test_match_condition_operators(value, condition, expected):
+    assert match_condition(value, condition) is expected
+
+
+def test_match_condition_rejects_unknown_operators():
+    with pytest.raises(NotImplementedError):
+        match_condition(5, {'$regex': '5'})
+
+
+def test_memory_database_collections_share_the_database():
+    database = main.MemoryDatabase(latency_ms=0)
+
+    assert database['products'] is database['products']
+    assert database['products'].database is database
@@ -0,0 +1,102 @@
+import json
+
+import numpy as np
+import pytest
+
+from main import LatencyHistogram, bootstrap_delta
+
+
+# Histograma com valores conhecidos
+@pytest.fixture
+def histogram() -> LatencyHistogram:
+    histogram = LatencyHistogram()
+    for value_ms in np.linspace(0.1, 100.0, 1000):
+        histogram.record(value_ms)
+    return histogram
+
+
+# Percentis dentro da precisão do histograma
+def test_percentiles_are_exact_within_the_significant_digits(histogram):
+    values = np.linspace(0.1, 100.0, 1000)
+    for percentile in [50, 90, 99, 99.9]:
+        expected = np.percentile(values, percentile, method='inverted_cdf')
+        assert histogram.percentile(percentile) == pytest.approx(expected, rel=1e-3)
+    assert histogram.percentile(100) == pytest.approx(100.0, rel=1e-3)
+    assert LatencyHistogram().percentile(99) == 0.0
+
+
+def test_values_past_the_highest_are_clamped():
+    histogram = LatencyHistogram(highest_ms=10.0)
+    histogram.record(50.0)
+    assert histogram.percentile(100) == pytest.approx(10.0, rel=1e-3)
+
+
+# Mesclar histogramas equivale a registrar todos os valores em um só
+def test_merge_matches_a_single_histogram():
+    rng = np.random.default_rng(1)
+    first, second = rng.exponential(5.0, 500), rng.exponential(20.0, 700)
+    merged, single, other = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+    for value_ms in first:
+        merged.record(value_ms)
+        single.record(value_ms)
+    for value_ms in second:
+        other.record(value_ms)
+        single.record(value_ms)
+
+    merged.merge(other)
+    assert merged.summary() == single.summary()
+    assert np.array_equal(merged.counts, single.counts)
+
+
+def test_merge_into_an_empty_histogram_keeps_the_minimum(histogram):
+    merged = LatencyHistogram().merge(histogram)
+    assert merged.min_us == histogram.min_us
+    assert merged.summary() == histogram.summary()
+
+
+def test_merge_rejects_other_settings(histogram):
+    with pytest.raises(ValueError):
+        histogram.merge(LatencyHistogram(significant_digits=2))
+
+
+# Serialização ida e volta pelo JSON
+def test_to_dict_round_trip(histogram):
+    restored = LatencyHistogram.from_dict(json.loads(json.dumps(histogram.to_dict())))
+    assert np.array_equal(restored.counts, histogram.counts)
+    assert restored.summary() == histogram.summary()
+
+
+# Intervalos do bootstrap
+def test_bootstrap_delta_detects_a_shift():
+    rng = np.random.default_rng(2)
+    baseline = rng.normal(10.0, 1.0, 400)
+    candidate = baseline * 1.2
+    delta, low, high = bootstrap_delta(baseline, candidate, lambda x: x.mean(axis=1), samples=500, rng=np.random.default_rng(3))
+    assert delta == pytest.approx(0.2)
+    assert low < delta < high
+    assert low > 0.1
+
+
+def test_bootstrap_delta_interval_covers_zero_without_a_change():
+    rng = np.random.default_rng(4)
+    baseline, candidate = rng.normal(10.0, 1.0, 400), rng.normal(10.0, 1.0, 400)
+    _, low, high = bootstrap_delta(baseline, candidate, lambda x: x.mean(axis=1), samples=500, rng=np.random.default_rng(5))
+    assert low < 0 < high
+
+
+def test_bootstrap_delta_several_statistics_share_the_resamples():
+    rng = np.random.default_rng(6)
+    baseline = rng.exponential(5.0, 300)
+    candidate = baseline * 2
+    delta, low, high = bootstrap_delta(baseline, candidate, lambda x: np.percentile(x, [50, 99], axis=1).T,
+                                       samples=300, rng=np.random.default_rng(7))
+    assert delta.shape == low.shape == high.shape == (2,)
+    assert delta == pytest.approx([1.0, 1.0])
+    assert np.all(low < delta) and np.all(delta < high)
+    assert np.all(low > 0)
+
+
+def test_bootstrap_delta_without_enough_values_has_no_interval():
+    delta, low, high = bootstrap_delta(np.array([1.0]), np.array([2.0, 2.0]), lambda x: x.mean(axis=1))
+    assert delta == pytest.approx(1.0)
+    assert np.isnan(low) and np.isnan(high)
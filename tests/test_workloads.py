@@ -0,0 +1,90 @@
+import json
+
+import numpy as np
+import pytest
+
+import main
+from main import DISTRIBUTIONS, OPERATIONS, WORKLOAD_DEFAULTS, AccessSampler, load_workloads
+
+
+# Perfis gravados em um arquivo temporário
+@pytest.fixture
+def workloads_file(tmp_path):
+    def write(profiles):
+        path = tmp_path / 'workloads.json'
+        path.write_text(json.dumps(profiles))
+        return str(path)
+    return write
+
+
+def test_load_workloads_fills_the_defaults(workloads_file):
+    workloads = load_workloads(workloads_file({'reads': {'operations': {'query_stock': 1.0}, 'distribution': 'zipfian'}}))
+    profile = workloads['reads']
+    assert profile['operations'] == {**dict.fromkeys(OPERATIONS, 0.0), 'query_stock': 1.0}
+    assert profile['distribution'] == 'zipfian'
+    assert profile['theta'] == WORKLOAD_DEFAULTS['theta']
+    assert profile['new_store_products'] == WORKLOAD_DEFAULTS['new_store_products']
+
+
+def test_load_workloads_without_operations_keeps_the_default_mix(workloads_file):
+    profile = load_workloads(workloads_file({'sizes': {'description_chars': 50}}))['sizes']
+    assert profile['operations'] == {**dict.fromkeys(OPERATIONS, 0.0), **WORKLOAD_DEFAULTS['operations']}
+    assert profile['description_chars'] == 50
+
+
+@pytest.mark.parametrize('profile', [
+    {'operations': {'delete_store': 1.0}},
+    {'distribution': 'pareto'},
+])
+def test_load_workloads_rejects_unknown_settings(workloads_file, profile):
+    with pytest.raises(ValueError):
+        load_workloads(workloads_file({'broken': profile}))
+
+
+def test_shipped_workloads_load():
+    workloads = load_workloads(main.WORKLOADS_FILE)
+    assert workloads
+    for profile in workloads.values():
+        assert sum(profile['operations'].values()) > 0
+
+
+# Amostradores de acesso
+@pytest.mark.parametrize('distribution', DISTRIBUTIONS)
+def test_sampler_indexes_stay_in_range(distribution):
+    sampler = AccessSampler(distribution, seed=1)
+    for size in [1, 2, 7, 1000]:
+        draws = sampler.samples(size, 5000)
+        assert draws.min() >= 0 and draws.max() < size
+        assert all(0 <= sampler.sample(size) < size for _ in range(200))
+
+
+@pytest.mark.parametrize('distribution', DISTRIBUTIONS)
+def test_scalar_and_vector_paths_agree(distribution):
+    sampler = AccessSampler(distribution, seed=2, pool_size=64)
+    size = 500
+    expected = sampler.indexes(size, sampler.positions(size, np.array(sampler.pool)))
+    assert [sampler.sample(size) for _ in range(64)] == expected.tolist()
+
+
+def test_uniform_sampler_is_flat():
+    sampler = AccessSampler('uniform', seed=3)
+    counts = np.bincount(sampler.samples(10, 100_000), minlength=10)
+    assert counts.min() > 9000 and counts.max() < 11000
+    assert sampler.top_share(1000, 0.01) == pytest.approx(0.01)
+
+
+@pytest.mark.parametrize('distribution', ['zipfian', 'hotspot', 'latest'])
+def test_skewed_samplers_match_their_top_share(distribution):
+    sampler = AccessSampler(distribution, seed=4)
+    size, draws = 1000, 200_000
+    counts = np.sort(np.bincount(sampler.samples(size, draws), minlength=size))[::-1]
+    expected = sampler.top_share(size, 0.1)
+    assert expected > 0.3
+    assert counts[:100].sum() / draws == pytest.approx(expected, abs=0.02)
+
+
+def test_latest_favours_the_newest_items():
+    sampler = AccessSampler('latest', seed=5)
+    draws = sampler.samples(1000, 50_000)
+    assert np.mean(draws >= 900) > 0.3
+    assert np.bincount(draws, minlength=1000).argmax() == 999